@@ -0,0 +1,184 @@
+"""
+Semantischer Cache für Dokumenten-Klassifizierungen
+Ähnliche Dokumente (z.B. monatliche Kontoauszüge) bekommen die gespeicherte
+Klassifizierung statt eines neuen LLM-Aufrufs
+"""
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Optional
+import chromadb
+from chromadb.config import Settings
+from embedding_service import EmbeddingService
+
+logger = logging.getLogger(__name__)
+
+# Bei einem semantischen Treffer übernommene Felder - das Datum gehört zum einzelnen
+# Dokument (Kontoauszug Februar vs. Januar) und wird nur bei exaktem Treffer übernommen
+SEMANTIC_REUSE_KEYS = ('document_type', 'correspondent', 'person_tags')
+
+
+class SemanticClassificationCache:
+    """Cache für Klassifizierungen: exakter Hash-Treffer zuerst, dann Embedding-Ähnlichkeit"""
+
+    def __init__(
+        self,
+        embedding_service: EmbeddingService,
+        persist_directory: str = "data/classification_cache",
+        similarity_threshold: float = 0.95,
+        max_entries: int = 5000,
+        prefix_chars: int = 2000
+    ):
+        """
+        Initialisiert den Klassifizierungs-Cache
+
+        Args:
+            embedding_service: Service für Embedding-Generierung
+            persist_directory: Verzeichnis für persistente Speicherung
+            similarity_threshold: Minimale Kosinus-Ähnlichkeit für einen Treffer
+            max_entries: Maximale Anzahl Einträge (älteste werden verdrängt)
+            prefix_chars: Anzahl Zeichen vom Dokumentanfang, die eingebettet werden
+        """
+        self.embeddings = embedding_service
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.prefix_chars = prefix_chars
+
+        os.makedirs(persist_directory, exist_ok=True)
+        self.client = chromadb.PersistentClient(
+            path=persist_directory,
+            settings=Settings(anonymized_telemetry=False)
+        )
+        # Kosinus-Distanz, damit der Schwellwert unabhängig von der Vektor-Norm ist
+        self.collection = self.client.get_or_create_collection(
+            name="classification_cache",
+            metadata={"hnsw:space": "cosine"}
+        )
+
+        logger.info(f"Klassifizierungs-Cache initialisiert: {self.collection.count()} Einträge")
+
+    @staticmethod
+    def _content_hash(content: str) -> str:
+        """SHA-256 über den normalisierten Text (Whitespace vereinheitlicht)"""
+        normalized = ' '.join(content.split())
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def _touch(self, cache_id: str, metadata: Dict):
+        """Aktualisiert den Zeitstempel der letzten Nutzung (für LRU-Verdrängung)"""
+        try:
+            self.collection.update(
+                ids=[cache_id],
+                metadatas=[{**metadata, 'last_used': datetime.now().isoformat()}]
+            )
+        except Exception as e:
+            logger.debug(f"Cache-Zeitstempel konnte nicht aktualisiert werden: {e}")
+
+    def lookup(self, content: str) -> Optional[Dict]:
+        """
+        Sucht eine gespeicherte Klassifizierung für ein Dokument
+
+        Args:
+            content: Dokumententext
+
+        Returns:
+            Klassifizierung oder None wenn kein Treffer; bei einem semantischen Treffer
+            nur die Felder aus SEMANTIC_REUSE_KEYS (ohne Datum)
+        """
+        try:
+            # 1. Exakter Treffer über den Text-Hash (ohne Embedding)
+            cache_id = self._content_hash(content)
+            exact = self.collection.get(ids=[cache_id], include=['metadatas'])
+            if exact['ids']:
+                metadata = exact['metadatas'][0]
+                self._touch(cache_id, metadata)
+                logger.info("Klassifizierung aus Cache (exakter Treffer)")
+                return json.loads(metadata['classification'])
+
+            if self.collection.count() == 0:
+                return None
+
+            # 2. Semantischer Treffer über das Embedding des Dokumentanfangs
+            embedding = self.embeddings.generate_embedding(content[:self.prefix_chars])
+            if embedding.size == 0:
+                return None
+
+            result = self.collection.query(
+                query_embeddings=[embedding.tolist()],
+                n_results=1,
+                include=['metadatas', 'distances']
+            )
+            if not result['ids'][0]:
+                return None
+
+            similarity = 1 - result['distances'][0][0]
+            if similarity < self.similarity_threshold:
+                logger.debug(f"Kein Cache-Treffer (beste Ähnlichkeit: {similarity:.3f})")
+                return None
+
+            metadata = result['metadatas'][0][0]
+            self._touch(result['ids'][0][0], metadata)
+            logger.info(f"Klassifizierung aus Cache (Ähnlichkeit: {similarity:.3f})")
+            classification = json.loads(metadata['classification'])
+            return {key: classification[key] for key in SEMANTIC_REUSE_KEYS if key in classification}
+
+        except Exception as e:
+            logger.warning(f"Fehler beim Cache-Lookup: {e}")
+            return None
+
+    def store(self, content: str, classification: Dict):
+        """
+        Speichert eine Klassifizierung im Cache
+
+        Args:
+            content: Dokumententext
+            classification: Klassifizierung (Ergebnis des LLM)
+        """
+        if not classification:
+            return
+
+        try:
+            embedding = self.embeddings.generate_embedding(content[:self.prefix_chars])
+            if embedding.size == 0:
+                return
+
+            self._evict_if_full()
+
+            now = datetime.now().isoformat()
+            self.collection.upsert(
+                ids=[self._content_hash(content)],
+                embeddings=[embedding.tolist()],
+                metadatas=[{
+                    'classification': json.dumps(classification),
+                    'cached_at': now,
+                    'last_used': now
+                }]
+            )
+            logger.debug("Klassifizierung im Cache gespeichert")
+
+        except Exception as e:
+            logger.warning(f"Fehler beim Speichern im Cache: {e}")
+
+    def _evict_if_full(self):
+        """Verdrängt die am längsten nicht genutzten 10% der Einträge, wenn der Cache voll ist"""
+        if self.collection.count() < self.max_entries:
+            return
+
+        entries = self.collection.get(include=['metadatas'])
+        by_last_use = sorted(
+            zip(entries['ids'], entries['metadatas']),
+            key=lambda item: item[1].get('last_used', '')
+        )
+        n_evict = max(1, self.max_entries // 10)
+        self.collection.delete(ids=[cache_id for cache_id, _ in by_last_use[:n_evict]])
+        logger.info(f"Klassifizierungs-Cache voll: {n_evict} Einträge verdrängt")
+
+    def clear(self):
+        """Löscht alle Einträge im Cache"""
+        self.client.delete_collection(name="classification_cache")
+        self.collection = self.client.get_or_create_collection(
+            name="classification_cache",
+            metadata={"hnsw:space": "cosine"}
+        )
+        logger.info("Klassifizierungs-Cache wurde geleert")
@@ -3,139 +3,394 @@ Datenbank für Tracking verarbeiteter Dokumente
 """
 import sqlite3
 import json
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Set, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Ältere SQLite-Versionen erlauben maximal 999 gebundene Parameter pro Statement
+SQLITE_MAX_PARAMS = 900
+
+_INSERT_PROCESSED_SQL = '''
+    INSERT OR REPLACE INTO processed_documents
+    (document_id, document_title, processed_at, classification_result, success, error_message, content_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Hintergrund-Writer: so viele Zeilen bzw. so lange wird pro Transaktion gesammelt
+WRITER_BATCH_SIZE = 64
+WRITER_MAX_WAIT = 0.1  # Sekunden
+
+_STOP = object()
+
 
 class DocumentDatabase:
     def __init__(self, db_path: str = 'processed_documents.db'):
         self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # Eigene Verbindung für Lesezugriffe: auf der Schreib-Verbindung sähen sie die noch
+        # nicht committeten Zeilen des Writers (WAL isoliert nur zwischen Verbindungen)
+        self._read_conn: Optional[sqlite3.Connection] = None
+        self._read_lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
         self.init_database()
 
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Öffnet eine Verbindung und setzt die Performance-PRAGMAs
+
+        WAL erlaubt parallele Leser während geschrieben wird; synchronous=NORMAL
+        ist im WAL-Modus sicher und spart den fsync pro Commit. Der Journal-Modus
+        bleibt in der Datei gespeichert, synchronous gilt dagegen nur pro Verbindung
+        und muss deshalb bei jedem Connect neu gesetzt werden.
+        In-Memory-Datenbanken (':memory:') unterstützen kein WAL und bleiben beim
+        Standard-Journal.
+        """
+        # check_same_thread=False: die Verbindung wird von Flask-Threads geteilt,
+        # Schreibzugriffe sind über self._lock serialisiert
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        if self.db_path != ':memory:':
+            conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-20000')  # ~20 MB Page-Cache
+        conn.execute('PRAGMA mmap_size=268435456')  # 256 MB
+        return conn
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """Gibt die geteilte Verbindung zurück (wird beim ersten Zugriff geöffnet)"""
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    self._conn = self._connect()
+        return self._conn
+
+    @contextmanager
+    def _reading(self) -> Iterator[sqlite3.Connection]:
+        """
+        Stellt die Lese-Verbindung exklusiv für eine Abfrage bereit
+
+        Die Lese-Verbindung ist nur lesend (query_only) und sieht ausschließlich committete
+        Daten. ':memory:'-Datenbanken gibt es nur in einer Verbindung - dort wird auf der
+        geteilten Verbindung unter self._lock gelesen, also nie mitten in einer Transaktion.
+        """
+        if self.db_path == ':memory:':
+            conn = self._get_conn()
+            with self._lock:
+                yield conn
+            return
+
+        with self._read_lock:
+            if self._read_conn is None:
+                self._get_conn()  # Datei und Tabellen existieren danach sicher
+                self._read_conn = self._connect()
+                self._read_conn.execute('PRAGMA query_only=ON')
+            yield self._read_conn
+
+    def _ensure_writer(self):
+        """Startet den Hintergrund-Writer beim ersten Schreibzugriff"""
+        if self._writer is None or not self._writer.is_alive():
+            with self._lock:
+                if self._writer is None or not self._writer.is_alive():
+                    self._writer = threading.Thread(
+                        target=self._writer_loop, name='DocumentDatabaseWriter', daemon=True
+                    )
+                    self._writer.start()
+
+    def _writer_loop(self):
+        """
+        Schreibt eingereihte Zeilen gesammelt in einer Transaktion
+
+        Nach der ersten Zeile wird bis zu WRITER_MAX_WAIT auf weitere gewartet
+        (maximal WRITER_BATCH_SIZE), damit sich mehrere Commits einen fsync teilen.
+        """
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+
+            rows = [item]
+            stop = False
+            deadline = time.monotonic() + WRITER_MAX_WAIT
+            while len(rows) < WRITER_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                rows.append(item)
+
+            self._write_rows(rows)
+            for _ in rows:
+                self._queue.task_done()
+
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _write_rows(self, rows: List[Tuple]) -> bool:
+        """Schreibt fertige Zeilen (siehe _to_row) in einer Transaktion"""
+        conn = self._get_conn()
+
+        with self._lock:
+            try:
+                conn.executemany(_INSERT_PROCESSED_SQL, rows)
+                conn.commit()
+                for row in rows:
+                    logger.info(f"Document {row[0]} added to database")
+                return True
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error adding documents to database: {e}")
+                return False
+
+    def flush(self):
+        """Wartet, bis alle eingereihten Schreibzugriffe in der Datenbank sind"""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Schreibt ausstehende Zeilen, beendet den Writer und schließt die Datenbankverbindung"""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        self._writer = None
+
+        with self._read_lock:
+            if self._read_conn is not None:
+                self._read_conn.close()
+                self._read_conn = None
+
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
     def init_database(self):
         """Initialisiert die Datenbank-Tabellen"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS processed_documents (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                document_id INTEGER UNIQUE NOT NULL,
-                document_title TEXT,
-                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                classification_result TEXT,
-                success BOOLEAN,
-                error_message TEXT
-            )
-        ''')
+        conn = self._get_conn()
+
+        with self._lock:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS processed_documents (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    document_id INTEGER UNIQUE NOT NULL,
+                    document_title TEXT,
+                    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    classification_result TEXT,
+                    success BOOLEAN,
+                    error_message TEXT,
+                    content_hash TEXT
+                )
+            ''')
 
-        conn.commit()
-        conn.close()
+            # Migration: content_hash für bestehende Datenbanken nachrüsten
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(processed_documents)')}
+            if 'content_hash' not in columns:
+                conn.execute('ALTER TABLE processed_documents ADD COLUMN content_hash TEXT')
+
+            # Nicht UNIQUE: mehrere Paperless-Dokumente können identischen Inhalt haben
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_content_hash ON processed_documents(content_hash)'
+            )
+            conn.commit()
         logger.info(f"Database initialized at {self.db_path}")
 
     def add_processed_document(self, document_id: int, document_title: str,
-                              classification: Dict, success: bool, error_message: str = None):
-        """Fügt ein verarbeitetes Dokument hinzu"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+                              classification: Dict, success: bool, error_message: str = None,
+                              content_hash: str = None):
+        """
+        Fügt ein verarbeitetes Dokument hinzu (content_hash: SHA-256 des OCR-Texts)
 
+        Die Zeile wird nur eingereiht und vom Hintergrund-Writer geschrieben, der
+        Aufrufer wartet nicht auf den Commit. Lesende Methoden rufen vorher flush() auf.
+        """
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO processed_documents
-                (document_id, document_title, processed_at, classification_result, success, error_message)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                document_id,
-                document_title,
-                datetime.now().isoformat(),
-                json.dumps(classification),
-                success,
-                error_message
-            ))
-            conn.commit()
-            logger.info(f"Document {document_id} added to database")
+            row = self._to_row(document_id, document_title, classification, success, error_message, content_hash)
         except Exception as e:
             logger.error(f"Error adding document to database: {e}")
-        finally:
-            conn.close()
+            return
 
-    def is_document_processed(self, document_id: int) -> bool:
-        """Prüft, ob ein Dokument bereits verarbeitet wurde"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self._ensure_writer()
+        self._queue.put(row)
+
+    def add_processed_documents_bulk(self, documents: List[Tuple]) -> bool:
+        """
+        Fügt mehrere verarbeitete Dokumente in einer Transaktion hinzu (executemany)
+
+        Args:
+            documents: Liste von Tupeln mit den Argumenten von add_processed_document:
+                       (document_id, document_title, classification, success[, error_message[, content_hash]])
+        """
+        if not documents:
+            return True
+
+        try:
+            rows = [self._to_row(*document) for document in documents]
+        except Exception as e:
+            logger.error(f"Error adding documents to database: {e}")
+            return False
 
-        cursor.execute(
-            'SELECT COUNT(*) FROM processed_documents WHERE document_id = ?',
-            (document_id,)
+        # Eingereihte Einzelzeilen zuerst, damit die Reihenfolge erhalten bleibt
+        self.flush()
+        return self._write_rows(rows)
+
+    @staticmethod
+    def _to_row(document_id: int, document_title: str, classification: Dict, success: bool,
+                error_message: str = None, content_hash: str = None) -> Tuple:
+        """Baut die Parameter für _INSERT_PROCESSED_SQL"""
+        return (
+            document_id,
+            document_title,
+            datetime.now().isoformat(),
+            json.dumps(classification),
+            success,
+            error_message,
+            content_hash
         )
-        count = cursor.fetchone()[0]
-        conn.close()
+
+    def is_document_processed(self, document_id: int) -> bool:
+        """Prüft, ob ein Dokument bereits verarbeitet wurde"""
+        self.flush()
+        with self._reading() as conn:
+            count = conn.execute(
+                'SELECT COUNT(*) FROM processed_documents WHERE document_id = ?',
+                (document_id,)
+            ).fetchone()[0]
 
         return count > 0
 
+    def get_classification_by_hash(self, content_hash: str) -> Optional[Dict]:
+        """
+        Gibt die Klassifizierung eines erfolgreich verarbeiteten Dokuments mit identischem Inhalt zurück
+
+        Ohne flush(): die Abfrage ist nur eine Abkürzung vor dem LLM-Aufruf und soll
+        parallele Worker nicht auf den Writer warten lassen.
+        """
+        with self._reading() as conn:
+            row = conn.execute('''
+                SELECT classification_result FROM processed_documents
+                WHERE content_hash = ? AND success = 1
+                ORDER BY processed_at DESC
+                LIMIT 1
+            ''', (content_hash,)).fetchone()
+
+        if row and row['classification_result']:
+            return json.loads(row['classification_result']) or None
+        return None
+
+    def get_processed_ids(self, document_ids: List[int]) -> Set[int]:
+        """
+        Gibt die IDs zurück, die bereits verarbeitet wurden (eine Abfrage statt N)
+
+        Die IDs werden in Blöcken abgefragt, um unter SQLites Limit für
+        gebundene Parameter zu bleiben.
+        """
+        self.flush()
+        processed = set()
+
+        with self._reading() as conn:
+            for i in range(0, len(document_ids), SQLITE_MAX_PARAMS):
+                batch = document_ids[i:i + SQLITE_MAX_PARAMS]
+                placeholders = ','.join('?' * len(batch))
+                cursor = conn.execute(
+                    f'SELECT document_id FROM processed_documents WHERE document_id IN ({placeholders})',
+                    batch
+                )
+                processed.update(row[0] for row in cursor.fetchall())
+
+        return processed
+
     def get_all_processed_documents(self) -> List[Dict]:
         """Gibt alle verarbeiteten Dokumente zurück"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        return list(self.iter_processed_documents())
 
-        cursor.execute('''
-            SELECT * FROM processed_documents
-            ORDER BY processed_at DESC
-        ''')
+    def iter_processed_documents(self, batch_size: int = 500) -> Iterator[Dict]:
+        """
+        Liefert die verarbeiteten Dokumente nacheinander (neueste zuerst)
 
-        rows = cursor.fetchall()
-        conn.close()
+        Die Zeilen werden in Blöcken von batch_size gelesen, damit z.B. eine gestreamte
+        API-Antwort nicht alle Dokumente gleichzeitig im Speicher halten muss. Jeder Block
+        ist eine eigene Abfrage (Keyset über processed_at, id), zwischen den Blöcken bleibt
+        kein Cursor auf der Verbindung offen.
+        """
+        self.flush()
+        last = None
 
-        documents = []
-        for row in rows:
-            doc = dict(row)
-            if doc['classification_result']:
-                doc['classification_result'] = json.loads(doc['classification_result'])
-            documents.append(doc)
+        while True:
+            with self._reading() as conn:
+                if last is None:
+                    rows = conn.execute('''
+                        SELECT * FROM processed_documents
+                        ORDER BY processed_at DESC, id DESC
+                        LIMIT ?
+                    ''', (batch_size,)).fetchall()
+                else:
+                    rows = conn.execute('''
+                        SELECT * FROM processed_documents
+                        WHERE processed_at < ? OR (processed_at = ? AND id < ?)
+                        ORDER BY processed_at DESC, id DESC
+                        LIMIT ?
+                    ''', (last['processed_at'], last['processed_at'], last['id'], batch_size)).fetchall()
 
-        return documents
+            if not rows:
+                break
+            last = rows[-1]
+            for row in rows:
+                doc = dict(row)
+                if doc['classification_result']:
+                    doc['classification_result'] = json.loads(doc['classification_result'])
+                yield doc
+            if len(rows) < batch_size:
+                break
 
     def reset_document(self, document_id: int) -> bool:
         """Entfernt ein Dokument aus der Verarbeitungsliste (für erneute Verarbeitung)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # Eingereihte Zeilen zuerst schreiben, sonst würde das Dokument danach wieder eingetragen
+        self.flush()
+        conn = self._get_conn()
 
-        try:
-            cursor.execute(
-                'DELETE FROM processed_documents WHERE document_id = ?',
-                (document_id,)
-            )
-            conn.commit()
-            logger.info(f"Document {document_id} reset for reprocessing")
-            return True
-        except Exception as e:
-            logger.error(f"Error resetting document: {e}")
-            return False
-        finally:
-            conn.close()
+        with self._lock:
+            try:
+                conn.execute(
+                    'DELETE FROM processed_documents WHERE document_id = ?',
+                    (document_id,)
+                )
+                conn.commit()
+                logger.info(f"Document {document_id} reset for reprocessing")
+                return True
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error resetting document: {e}")
+                return False
 
     def get_statistics(self) -> Dict:
         """Gibt Statistiken über verarbeitete Dokumente zurück"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Gesamt-Anzahl
-        cursor.execute('SELECT COUNT(*) FROM processed_documents')
-        total = cursor.fetchone()[0]
+        self.flush()
 
-        # Erfolgreiche Verarbeitungen
-        cursor.execute('SELECT COUNT(*) FROM processed_documents WHERE success = 1')
-        successful = cursor.fetchone()[0]
+        with self._reading() as conn:
+            # Gesamt-Anzahl
+            total = conn.execute('SELECT COUNT(*) FROM processed_documents').fetchone()[0]
 
-        # Fehlerhafte Verarbeitungen
-        cursor.execute('SELECT COUNT(*) FROM processed_documents WHERE success = 0')
-        failed = cursor.fetchone()[0]
+            # Erfolgreiche Verarbeitungen
+            successful = conn.execute('SELECT COUNT(*) FROM processed_documents WHERE success = 1').fetchone()[0]
 
-        conn.close()
+            # Fehlerhafte Verarbeitungen
+            failed = conn.execute('SELECT COUNT(*) FROM processed_documents WHERE success = 0').fetchone()[0]
 
         return {
             'total': total,
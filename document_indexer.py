@@ -3,13 +3,21 @@ Document Indexer für semantische Suche
 Lädt Dokumente aus Paperless und indexiert sie im Vector Store
 """
 import logging
-from typing import List, Dict, Any, Optional
+import re
+from bisect import bisect_left
+from typing import Callable, List, Dict, Any, Optional
 from paperless_client import PaperlessClient
 from embedding_service import EmbeddingService
-from vector_store import VectorStore
+from vector_store import VectorStore, TAG_METADATA_PREFIX
 
 logger = logging.getLogger(__name__)
 
+# Satzende bzw. Zeilenumbruch als bevorzugte Stelle für Chunk-Grenzen
+_BOUNDARY_RE = re.compile(r'[.\n]')
+
+# Größere add()-Batches bringen in ChromaDB kaum noch etwas, kosten aber Speicher
+MAX_BATCH_CHUNKS = 250
+
 
 class DocumentIndexer:
     """Indexiert Paperless Dokumente für semantische Suche"""
@@ -49,105 +57,179 @@ class DocumentIndexer:
         if not text or len(text) <= chunk_size:
             return [text]
 
+        # Positionen aller Satzenden einmal vorberechnen, statt jedes Fenster per rfind zu durchsuchen
+        boundaries = [m.start() for m in _BOUNDARY_RE.finditer(text)]
+
         chunks = []
         start = 0
+        text_length = len(text)
 
-        while start < len(text):
+        while start < text_length:
             end = start + chunk_size
-            chunk = text[start:end]
 
             # Versuche bei Satzende zu teilen
-            if end < len(text):
-                last_period = chunk.rfind('.')
-                last_newline = chunk.rfind('\n')
-                split_point = max(last_period, last_newline)
+            if end < text_length:
+                # Letztes Satzende innerhalb von text[start:end]
+                idx = bisect_left(boundaries, end) - 1
+                if idx >= 0 and boundaries[idx] >= start:
+                    split_point = boundaries[idx] - start
 
-                if split_point > chunk_size * 0.5:  # Nur wenn Split-Punkt nicht zu früh
-                    chunk = chunk[:split_point + 1]
-                    end = start + split_point + 1
+                    if split_point > chunk_size * 0.5:  # Nur wenn Split-Punkt nicht zu früh
+                        end = start + split_point + 1
 
-            chunks.append(chunk.strip())
+            chunks.append(text[start:end].strip())
             start = end - overlap
 
         return chunks
 
-    def index_document(self, doc_id: int, force_reindex: bool = False) -> bool:
+    def _load_document(self, doc_id: int) -> Optional[Dict[str, Any]]:
         """
-        Indexiert ein einzelnes Dokument
+        Lädt ein Dokument und teilt es in Chunks (ohne Embeddings)
 
         Args:
             doc_id: Paperless Dokument-ID
-            force_reindex: Wenn True, wird Dokument neu indexiert auch wenn bereits vorhanden
 
         Returns:
-            True wenn erfolgreich indexiert
+            Dictionary mit doc_id, chunks und metadata oder None bei Fehler
         """
-        try:
-            # Prüfe ob bereits indexiert (check first chunk)
-            first_chunk_id = f"{doc_id}_chunk_0"
-            if not force_reindex and self.vector_store.document_exists(first_chunk_id):
-                logger.debug(f"Dokument {doc_id} bereits indexiert (überspringe)")
-                return True
+        # Dokument von Paperless laden
+        document = self.paperless.get_document(doc_id)
+        if not document:
+            logger.error(f"Dokument {doc_id} konnte nicht geladen werden")
+            return None
+
+        # Text extrahieren
+        content = document.get('content', '')
+        if not content:
+            logger.warning(f"Dokument {doc_id} hat keinen Inhalt")
+            return None
+
+        # Text in Chunks aufteilen (auch für kurze Dokumente einheitlich)
+        chunks = self._chunk_text(content, chunk_size=1500, overlap=200)
+        total_chunks = len(chunks)
+
+        logger.debug(f"Dokument {doc_id}: {total_chunks} Chunks erstellt")
+
+        # Für alle Chunks gleiche Metadaten einmal vorbereiten, pro Chunk kommt nur die Nummer dazu
+        metadata = {
+            'title': document.get('title', ''),
+            'correspondent': document.get('correspondent_name', ''),
+            'document_type': document.get('document_type_name', ''),
+            'created': document.get('created', ''),
+            'tags': ','.join(document.get('tag_names', [])),
+            'archive_serial_number': document.get('archive_serial_number', ''),
+            'total_chunks': str(total_chunks),
+            'doc_id_original': str(doc_id)  # Original Doc ID für Deduplizierung
+        }
 
-            # Dokument von Paperless laden
-            document = self.paperless.get_document(doc_id)
-            if not document:
-                logger.error(f"Dokument {doc_id} konnte nicht geladen werden")
-                return False
+        # Jahr als Zahl und Tags als einzelne Felder, damit ChromaDB direkt danach filtern kann
+        created = str(metadata['created'])
+        if created[:4].isdigit():
+            metadata['year'] = int(created[:4])
+        for tag in document.get('tag_names', []):
+            metadata[TAG_METADATA_PREFIX + tag] = True
 
-            # Text extrahieren
-            content = document.get('content', '')
-            if not content:
-                logger.warning(f"Dokument {doc_id} hat keinen Inhalt")
-                return False
+        return {'doc_id': doc_id, 'chunks': chunks, 'metadata': metadata}
 
-            # Metadaten sammeln
-            metadata = {
-                'title': document.get('title', ''),
-                'correspondent': document.get('correspondent_name', ''),
-                'document_type': document.get('document_type_name', ''),
-                'created': document.get('created', ''),
-                'tags': ','.join(document.get('tag_names', [])),
-                'archive_serial_number': document.get('archive_serial_number', '')
-            }
+    def _embed_documents(self, loaded: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Erstellt die Embeddings für die Chunks mehrerer geladener Dokumente
 
-            # Text in Chunks aufteilen (auch für kurze Dokumente einheitlich)
-            chunks = self._chunk_text(content, chunk_size=1500, overlap=200)
-            total_chunks = len(chunks)
+        Alle Chunks gehen gemeinsam an generate_embeddings_batch, damit auch viele kurze
+        Dokumente (oft nur ein Chunk) volle Requests an Ollama ergeben.
 
-            logger.debug(f"Dokument {doc_id}: {total_chunks} Chunks erstellt")
+        Args:
+            loaded: Liste von geladenen Dokumenten (siehe _load_document)
 
-            # Alle Chunks indexieren
-            all_success = True
-            for chunk_idx, chunk_text in enumerate(chunks):
-                # Metadaten für diesen Chunk
-                chunk_metadata = metadata.copy()
-                chunk_metadata['chunk_number'] = str(chunk_idx)
-                chunk_metadata['total_chunks'] = str(total_chunks)
-                chunk_metadata['doc_id_original'] = str(doc_id)  # Original Doc ID für Deduplizierung
+        Returns:
+            Pro Dokument ein Dictionary mit ids, texts, embeddings, metadatas und complete
+            (False wenn einzelne Chunks fehlgeschlagen sind)
+        """
+        # Embeddings für alle Chunks erstellen (Blöcke parallel, Reihenfolge bleibt erhalten)
+        all_chunks = [chunk for doc in loaded for chunk in doc['chunks']]
+        all_embeddings = self.embeddings.generate_embeddings_batch(all_chunks)
+
+        results = []
+        offset = 0
+        for doc in loaded:
+            doc_id, chunks = doc['doc_id'], doc['chunks']
+            embeddings = all_embeddings[offset:offset + len(chunks)]
+            offset += len(chunks)
+
+            prepared = {
+                'ids': [],
+                'texts': [],
+                'embeddings': [],
+                'metadatas': [],
+                'complete': True
+            }
+            # Chunk-ID: 123_chunk_0 (wird im Vector Store zu doc_123_chunk_0)
+            id_prefix = f"{doc_id}_chunk_"
 
-                # Embedding für Chunk erstellen
-                embedding = self.embeddings.generate_embedding(chunk_text)
-                if not embedding:
+            for chunk_idx, (chunk_text, embedding) in enumerate(zip(chunks, embeddings)):
+                if embedding.size == 0:
                     logger.error(f"Embedding für Dokument {doc_id}, Chunk {chunk_idx} fehlgeschlagen")
-                    all_success = False
+                    prepared['complete'] = False
                     continue
 
-                # Chunk-ID: doc_123_chunk_0
-                chunk_doc_id = f"{doc_id}_chunk_{chunk_idx}"
+                prepared['ids'].append(id_prefix + str(chunk_idx))
+                prepared['texts'].append(chunk_text[:500])  # Preview für Anzeige
+                prepared['embeddings'].append(embedding)
+                prepared['metadatas'].append({**doc['metadata'], 'chunk_number': str(chunk_idx)})
 
-                # Chunk indexieren
-                success = self.vector_store.add_document(
-                    doc_id=chunk_doc_id,
-                    text=chunk_text[:500],  # Preview für Anzeige
-                    embedding=embedding,
-                    metadata=chunk_metadata
-                )
+            results.append(prepared)
 
-                if not success:
-                    all_success = False
+        return results
 
-            success = all_success
+    def _prepare_document(self, doc_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Lädt ein Dokument, teilt es in Chunks und erstellt die Embeddings
+
+        Args:
+            doc_id: Paperless Dokument-ID
+
+        Returns:
+            Dictionary mit ids, texts, embeddings, metadatas und complete
+            (False wenn einzelne Chunks fehlgeschlagen sind) oder None bei Fehler
+        """
+        loaded = self._load_document(doc_id)
+        if not loaded:
+            return None
+        return self._embed_documents([loaded])[0]
+
+    def index_document(self, doc_id: int, force_reindex: bool = False) -> bool:
+        """
+        Indexiert ein einzelnes Dokument
+
+        Args:
+            doc_id: Paperless Dokument-ID
+            force_reindex: Wenn True, wird Dokument neu indexiert auch wenn bereits vorhanden
+
+        Returns:
+            True wenn erfolgreich indexiert
+        """
+        try:
+            # Prüfe ob bereits indexiert (check first chunk)
+            first_chunk_id = f"{doc_id}_chunk_0"
+            if not force_reindex and self.vector_store.document_exists(first_chunk_id):
+                logger.debug(f"Dokument {doc_id} bereits indexiert (überspringe)")
+                return True
+
+            prepared = self._prepare_document(doc_id)
+            if not prepared:
+                return False
+
+            # Alle Chunks des Dokuments in einem Aufruf schreiben; bei erzwungener Neuindexierung
+            # per Upsert, damit vorhandene Chunks der alten Version ersetzt statt ignoriert werden
+            success = prepared['complete']
+            if prepared['ids']:
+                success = self.vector_store.add_documents_batch(
+                    doc_ids=prepared['ids'],
+                    texts=prepared['texts'],
+                    embeddings=prepared['embeddings'],
+                    metadatas=prepared['metadatas'],
+                    upsert=force_reindex
+                ) and success
 
             if success:
                 logger.info(f"✓ Dokument {doc_id} erfolgreich indexiert")
@@ -157,12 +239,79 @@ class DocumentIndexer:
             logger.error(f"Fehler beim Indexieren von Dokument {doc_id}: {e}")
             return False
 
-    def index_all_documents(self, batch_size: int = 10) -> Dict[str, int]:
+    def _flush_batch(self, batch: List[Dict[str, Any]], stats: Dict[str, int], replace: bool = False):
+        """
+        Bettet die geladenen Dokumente eines Batches ein und schreibt sie gemeinsam in den Vector Store
+
+        Ein add()-Aufruf entspricht einer Transaktion in ChromaDB, statt einer pro Chunk.
+
+        Args:
+            batch: Liste von geladenen Dokumenten (siehe _load_document)
+            stats: Statistik-Dictionary, wird aktualisiert
+            replace: Vorhandene Chunks der Dokumente ersetzen (Neuindexierung)
+        """
+        loaded = batch
+        try:
+            batch = self._embed_documents(loaded)
+        except Exception as e:
+            logger.error(f"Fehler beim Erstellen der Embeddings für {len(batch)} Dokumente: {e}")
+            stats['failed'] += len(batch)
+            return
+
+        ids, texts, embeddings, metadatas = [], [], [], []
+        for prepared in batch:
+            # Beim Ersetzen behalten unvollständig eingebettete Dokumente ihre alten Chunks,
+            # statt durch eine Teilmenge ersetzt zu werden - sie zählen als fehlgeschlagen
+            if replace and not prepared['complete']:
+                continue
+            ids.extend(prepared['ids'])
+            texts.extend(prepared['texts'])
+            embeddings.extend(prepared['embeddings'])
+            metadatas.extend(prepared['metadatas'])
+
+        written = True
+        if ids:
+            # Beim Ersetzen per upsert schreiben: die alten Chunks bleiben bis zum
+            # erfolgreichen Schreiben erhalten
+            written = self.vector_store.add_documents_batch(
+                doc_ids=ids,
+                texts=texts,
+                embeddings=embeddings,
+                metadatas=metadatas,
+                upsert=replace
+            )
+
+        for doc, prepared in zip(loaded, batch):
+            if written and prepared['complete']:
+                # Erst nach dem Schreiben überzählige Chunks einer längeren alten Fassung löschen
+                if replace and not self.vector_store.delete_stale_document_chunks(doc['doc_id'], len(doc['chunks'])):
+                    stats['failed'] += 1
+                    continue
+                stats['indexed'] += 1
+            else:
+                stats['failed'] += 1
+
+    def index_all_documents(
+        self,
+        batch_size: int = 100,
+        batch_chunks: int = 100,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, int]:
         """
         Indexiert alle Dokumente aus Paperless
 
+        Eingebettet und geschrieben wird, sobald batch_chunks Chunks oder batch_size Dokumente
+        gesammelt sind - so ergeben auch viele kurze Dokumente volle Embedding-Requests und
+        große Transaktionen.
+
+        Meldet der Vector Store einen veralteten Index (reindex_reasons), werden auch bereits
+        indexierte Dokumente neu eingebettet und ersetzt; als aktuell gilt der Index erst nach
+        einem vollständigen Durchlauf ohne Fehler.
+
         Args:
-            batch_size: Anzahl Dokumente die gleichzeitig verarbeitet werden
+            batch_size: Maximale Anzahl Dokumente, deren Chunks gemeinsam geschrieben werden
+            batch_chunks: Anzahl gesammelter Chunks, ab der geschrieben wird (höchstens MAX_BATCH_CHUNKS)
+            progress: Wird pro Dokument mit (bearbeitet, gesamt) aufgerufen (z.B. für eine Statusanzeige)
 
         Returns:
             Dictionary mit Statistiken (indexed, skipped, failed)
@@ -172,33 +321,72 @@ class DocumentIndexer:
             'skipped': 0,
             'failed': 0
         }
+        batch_chunks = max(1, min(batch_chunks, MAX_BATCH_CHUNKS))
+        batch = []
+        pending_chunks = 0
+        reindex = bool(self.vector_store.reindex_reasons)
 
         try:
-            # Alle Dokumente von Paperless holen
+            # Dokumente seitenweise von Paperless laden (nicht alle auf einmal im Speicher)
             logger.info("Lade alle Dokumente von Paperless...")
-            all_documents = self.paperless.get_all_documents()
-            total = len(all_documents)
+            total = self.paperless.get_document_count()
+
+            # Bereits indexierte IDs einmal laden statt pro Dokument beim Vector Store nachzufragen
+            # (bei veraltetem Index-Format werden alle Dokumente neu eingebettet)
+            if reindex:
+                logger.warning("Veraltetes Index-Format: alle Dokumente werden neu eingebettet")
+                indexed_ids = set()
+            else:
+                indexed_ids = self.vector_store.get_indexed_doc_ids()
 
             logger.info(f"Starte Indexierung von {total} Dokumenten...")
 
-            for i, doc in enumerate(all_documents, 1):
+            for i, doc in enumerate(self.paperless.iter_all_documents(fields=['id']), 1):
                 doc_id = doc['id']
 
-                # Fortschritt anzeigen
+                # Fortschritt anzeigen (total kann abweichen, wenn während der Indexierung Dokumente dazukommen)
                 if i % 10 == 0 or i == total:
-                    logger.info(f"Fortschritt: {i}/{total} ({i*100//total}%)")
+                    logger.info(f"Fortschritt: {i}/{total} ({i*100//max(total, i)}%)")
+                if progress is not None:
+                    progress(i, max(total, i))
 
                 # Prüfe ob bereits indexiert
-                if self.vector_store.document_exists(doc_id):
+                if doc_id in indexed_ids:
                     stats['skipped'] += 1
                     continue
 
-                # Indexieren
-                success = self.index_document(doc_id, force_reindex=False)
-                if success:
-                    stats['indexed'] += 1
-                else:
+                # Dokument laden und chunken, eingebettet und geschrieben wird gesammelt pro Batch
+                try:
+                    loaded = self._load_document(doc_id)
+                except Exception as e:
+                    logger.error(f"Fehler beim Indexieren von Dokument {doc_id}: {e}")
+                    loaded = None
+
+                if not loaded:
                     stats['failed'] += 1
+                    continue
+
+                batch.append(loaded)
+                pending_chunks += len(loaded['chunks'])
+                # Merken, damit ein bei verschobenen Seiten doppelt geliefertes Dokument
+                # nicht erneut eingebettet wird (doppelte IDs im Batch würden add() scheitern lassen)
+                indexed_ids.add(doc_id)
+                if len(batch) >= batch_size or pending_chunks >= batch_chunks:
+                    self._flush_batch(batch, stats, replace=reindex)
+                    batch = []
+                    pending_chunks = 0
+
+            if batch:
+                self._flush_batch(batch, stats, replace=reindex)
+                batch = []
+
+            # Nur als aktuell markieren, wenn wirklich alle Dokumente neu eingebettet wurden -
+            # übersprungene Dokumente würden sonst dauerhaft im alten Format bleiben
+            if reindex:
+                if stats['failed'] == 0:
+                    self.vector_store.mark_index_current()
+                else:
+                    logger.warning(f"{stats['failed']} Dokumente fehlgeschlagen: Index bleibt als veraltet markiert")
 
             logger.info("=" * 60)
             logger.info("Indexierung abgeschlossen!")
@@ -211,6 +399,9 @@ class DocumentIndexer:
 
         except Exception as e:
             logger.error(f"Fehler bei der Indexierung aller Dokumente: {e}")
+            # Bereits geladene Dokumente nicht verwerfen
+            if batch:
+                self._flush_batch(batch, stats, replace=reindex)
             return stats
 
     def reindex_document(self, doc_id: int) -> bool:
@@ -236,12 +427,15 @@ class DocumentIndexer:
         """
         try:
             vector_stats = self.vector_store.get_stats()
-            all_docs = self.paperless.get_all_documents()
+            total_docs = self.paperless.get_document_count()
 
             return {
-                'total_paperless_documents': len(all_docs),
+                'total_paperless_documents': total_docs,
                 'indexed_documents': vector_stats['total_documents'],
-                'indexing_progress': f"{vector_stats['total_documents']}/{len(all_docs)}"
+                'indexing_progress': f"{vector_stats['total_documents']}/{total_docs}",
+                # Veraltetes Index-Format: "Indexieren" bettet alle Dokumente neu ein
+                'reindex_required': bool(self.vector_store.reindex_reasons),
+                'reindex_reasons': list(self.vector_store.reindex_reasons)
             }
         except Exception as e:
             logger.error(f"Fehler beim Abrufen der Statistiken: {e}")
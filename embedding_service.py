@@ -3,41 +3,165 @@ Embedding Service für semantische Suche
 Nutzt Ollama nomic-embed-text Modell
 """
 import requests
+import hashlib
 import logging
-from typing import List, Dict, Any
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+import numpy as np
+from json_utils import response_json
 
 logger = logging.getLogger(__name__)
 
+# Rückgabewert bei fehlgeschlagener Generierung (Prüfung über embedding.size == 0)
+EMPTY_EMBEDDING = np.empty(0, dtype=np.float32)
+EMPTY_EMBEDDING.setflags(write=False)
+
+
+def _as_vector(values) -> np.ndarray:
+    """Konvertiert ein Embedding in ein schreibgeschütztes float32-Array (sicher im Cache teilbar)"""
+    vector = np.asarray(values, dtype=np.float32)
+    vector.setflags(write=False)
+    return vector
+
 
 class EmbeddingService:
     """Service für die Generierung von Text-Embeddings via Ollama"""
 
-    def __init__(self, ollama_url: str, model: str = "nomic-embed-text"):
+    def __init__(
+        self,
+        ollama_url: str,
+        model: str = "nomic-embed-text",
+        max_workers: int = 8,
+        cache_size: int = 8192,
+        batch_size: int = 32
+    ):
         """
         Initialisiert den Embedding Service
 
         Args:
             ollama_url: URL des Ollama Servers (z.B. http://192.168.2.139:11434)
             model: Embedding Modell (default: nomic-embed-text)
+            max_workers: Maximale Anzahl paralleler Requests in generate_embeddings_batch
+            cache_size: Maximale Anzahl Embeddings im LRU-Cache (0 = Cache deaktiviert)
+            batch_size: Anzahl Texte pro Request an /api/embed
         """
         self.ollama_url = ollama_url.rstrip('/')
         self.model = model
         self.embed_endpoint = f"{self.ollama_url}/api/embeddings"
+        # /api/embed nimmt mehrere Texte pro Request an (neuere Ollama Versionen)
+        self.embed_batch_endpoint = f"{self.ollama_url}/api/embed"
+        self._embed_api_available = True
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+
+        # Session hält die TCP-Verbindung offen (Keep-Alive) statt pro Request neu zu verbinden
+        self._session = requests.Session()
+
+        # LRU-Cache: Text-Hash -> Embedding (thread-safe, da Batches parallel laufen)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
 
         logger.info(f"EmbeddingService initialisiert: {self.ollama_url} (Model: {self.model})")
 
-    def generate_embedding(self, text: str) -> List[float]:
+    def _cache_key(self, text: str) -> str:
+        """Cache-Key inkl. Modellname, damit ein Modellwechsel keine alten Vektoren liefert"""
+        return hashlib.sha256(f"{self.model}:{text}".encode('utf-8')).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[np.ndarray]:
+        with self._cache_lock:
+            embedding = self._cache.get(key)
+            if embedding is None:
+                self._misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return embedding
+
+    def _cache_put(self, key: str, embedding: np.ndarray):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
         """
-        Generiert Embedding für einen einzelnen Text
+        Gibt Statistiken über den Embedding-Cache zurück
 
-        Args:
-            text: Text für den ein Embedding erstellt werden soll
+        Returns:
+            Dictionary mit hits, misses, hit_rate und size
+        """
+        with self._cache_lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'size': len(self._cache)
+            }
+
+    def _request_embeddings(self, texts: List[str]) -> Optional[List[np.ndarray]]:
+        """
+        Holt Embeddings für mehrere Texte mit einem Request von /api/embed
 
         Returns:
-            Liste von float-Werten (Embedding-Vektor)
+            Liste von Embedding-Vektoren (Zeilen eines float32-Arrays) oder None
+            wenn der Request fehlschlägt
         """
         try:
-            response = requests.post(
+            response = self._session.post(
+                self.embed_batch_endpoint,
+                json={
+                    "model": self.model,
+                    "input": texts
+                },
+                timeout=30 + 5 * len(texts)
+            )
+            if response.status_code == 404:
+                # Auch ein nicht geladenes Modell liefert 404 (JSON mit "error") - dann bleibt
+                # /api/embed aktiv, damit es nach einem "ollama pull" wieder genutzt wird
+                if self._is_model_missing(response):
+                    logger.error(f"Embedding-Modell {self.model} nicht gefunden: {response.text[:200]}")
+                    return [EMPTY_EMBEDDING] * len(texts)
+                # Alte Ollama Version ohne /api/embed - ab jetzt direkt /api/embeddings nutzen
+                logger.warning("Ollama unterstützt /api/embed nicht, nutze /api/embeddings")
+                self._embed_api_available = False
+                return None
+            response.raise_for_status()
+
+            embeddings = response_json(response).get("embeddings", [])
+            if len(embeddings) != len(texts):
+                logger.error(f"Embedding-Anzahl passt nicht: {len(embeddings)} statt {len(texts)}")
+                return None
+
+            # Ein zusammenhängender (N, dim) Block, die Zeilen sind Views darauf
+            return list(_as_vector(embeddings))
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Fehler bei Batch-Embedding-Generierung: {e}")
+            return None
+
+    @staticmethod
+    def _is_model_missing(response: requests.Response) -> bool:
+        """True wenn eine 404-Antwort von Ollama ein fehlendes Modell meldet (statt einer fehlenden Route)"""
+        try:
+            data = response_json(response)
+        except ValueError:
+            return False
+        error = data.get('error') if isinstance(data, dict) else None
+        return isinstance(error, str) and 'model' in error.lower()
+
+    def _request_embedding_legacy(self, text: str) -> np.ndarray:
+        """Holt das Embedding für einen Text von /api/embeddings (ein Text pro Request)"""
+        try:
+            response = self._session.post(
                 self.embed_endpoint,
                 json={
                     "model": self.model,
@@ -47,39 +171,123 @@ class EmbeddingService:
             )
             response.raise_for_status()
 
-            result = response.json()
-            embedding = result.get("embedding", [])
-
-            if not embedding:
-                logger.error(f"Kein Embedding erhalten für Text: {text[:100]}...")
-                return []
-
-            logger.debug(f"Embedding generiert: {len(embedding)} Dimensionen")
-            return embedding
+            return _as_vector(response_json(response).get("embedding", []))
 
         except requests.exceptions.RequestException as e:
             logger.error(f"Fehler bei Embedding-Generierung: {e}")
-            return []
+            return EMPTY_EMBEDDING
+
+    def _embed_uncached(self, texts: List[str]) -> List[np.ndarray]:
+        """Embeddings ohne Cache holen; bevorzugt /api/embed, sonst einzeln über /api/embeddings"""
+        if self._embed_api_available:
+            embeddings = self._request_embeddings(texts)
+            if embeddings is not None:
+                return embeddings
+
+        return [self._request_embedding_legacy(text) for text in texts]
+
+    def generate_embedding(self, text: str, use_cache: bool = True) -> np.ndarray:
+        """
+        Generiert Embedding für einen einzelnen Text
+
+        Args:
+            text: Text für den ein Embedding erstellt werden soll
+            use_cache: Ob der LRU-Cache genutzt werden soll
+
+        Returns:
+            Embedding-Vektor als float32-Array (leer bei Fehler)
+        """
+        key = None
+        if use_cache and self.cache_size > 0:
+            key = self._cache_key(text)
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
+        embedding = self._embed_uncached([text])[0]
+
+        if embedding.size == 0:
+            logger.error(f"Kein Embedding erhalten für Text: {text[:100]}...")
+            return EMPTY_EMBEDDING
+
+        logger.debug(f"Embedding generiert: {len(embedding)} Dimensionen")
+        if key:
+            self._cache_put(key, embedding)
+        return embedding
+
+    def generate_embeddings_multi(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Generiert Embeddings für mehrere Texte mit einem einzigen Request
+
+        Texte die bereits im Cache liegen werden nicht erneut angefragt.
+
+        Args:
+            texts: Liste von Texten
+
+        Returns:
+            Liste von float32-Vektoren (gleiche Reihenfolge, leer für fehlgeschlagene Texte)
+        """
+        embeddings: List[np.ndarray] = [EMPTY_EMBEDDING] * len(texts)
+        missing = []
 
-    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        use_cache = self.cache_size > 0
+        keys = [self._cache_key(text) for text in texts] if use_cache else []
+        for i, text in enumerate(texts):
+            cached = self._cache_get(keys[i]) if use_cache else None
+            if cached is not None:
+                embeddings[i] = cached
+            else:
+                missing.append(i)
+
+        if not missing:
+            return embeddings
+
+        fetched = self._embed_uncached([texts[i] for i in missing])
+        for i, embedding in zip(missing, fetched):
+            if embedding.size == 0:
+                logger.error(f"Kein Embedding erhalten für Text: {texts[i][:100]}...")
+                continue
+            embeddings[i] = embedding
+            if use_cache:
+                self._cache_put(keys[i], embedding)
+
+        logger.debug(f"Multi-Embedding: {len(missing)} angefragt, {len(texts) - len(missing)} aus Cache")
+        return embeddings
+
+    def generate_embeddings_batch(self, texts: List[str]) -> List[np.ndarray]:
         """
         Generiert Embeddings für mehrere Texte
 
+        Die Texte werden in Blöcke von batch_size aufgeteilt, die Blöcke laufen parallel.
+        Unterstützt der Server kein /api/embed, laufen die Einzel-Requests parallel.
+
         Args:
             texts: Liste von Texten
 
         Returns:
-            Liste von Embedding-Vektoren
+            Liste von float32-Vektoren (leer für fehlgeschlagene Texte)
         """
-        embeddings = []
-        total = len(texts)
+        if not texts:
+            return []
 
-        for i, text in enumerate(texts, 1):
-            if i % 10 == 0:
-                logger.info(f"Embedding-Progress: {i}/{total}")
+        # Ohne /api/embed wird jeder Text einzeln angefragt, sonst in Blöcken von batch_size
+        if self._embed_api_available:
+            groups = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        else:
+            groups = [[text] for text in texts]
 
-            embedding = self.generate_embedding(text)
-            embeddings.append(embedding)
+        # Requests parallel absetzen - die Wartezeit liegt komplett beim Ollama Server.
+        # executor.map behält die Reihenfolge der Blöcke bei.
+        workers = min(self.max_workers, len(groups))
+        if workers == 1:
+            embeddings = self.generate_embeddings_multi(texts)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                embeddings = [
+                    embedding
+                    for group in executor.map(self.generate_embeddings_multi, groups)
+                    for embedding in group
+                ]
 
         logger.info(f"Batch-Embedding abgeschlossen: {len(embeddings)} Embeddings erstellt")
         return embeddings
@@ -92,10 +300,10 @@ class EmbeddingService:
             True wenn Verbindung erfolgreich, sonst False
         """
         try:
-            # Test mit kurzem Text
-            test_embedding = self.generate_embedding("Test")
+            # Test mit kurzem Text (am Cache vorbei, sonst wird der Server nicht geprüft)
+            test_embedding = self.generate_embedding("Test", use_cache=False)
 
-            if test_embedding and len(test_embedding) > 0:
+            if test_embedding.size > 0:
                 logger.info(f"✓ Embedding Service erfolgreich getestet: {len(test_embedding)} Dimensionen")
                 return True
             else:
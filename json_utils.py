@@ -0,0 +1,40 @@
+"""
+JSON-Hilfsfunktionen
+Nutzt orjson (deutlich schnelleres Parsen, v.a. von Embedding-Arrays) und fällt
+auf das json-Modul zurück, wenn orjson nicht installiert ist
+"""
+import json
+from typing import Any, Union
+import requests
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optionale Abhängigkeit
+    orjson = None
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Dekodiert JSON aus str oder bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Kodiert ein Objekt als UTF-8-JSON (z.B. als Request-Body)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def response_json(response: requests.Response) -> Any:
+    """
+    Dekodiert den Body einer HTTP-Antwort (Ersatz für response.json())
+
+    Wirft wie response.json() requests.exceptions.JSONDecodeError, damit bestehende
+    except RequestException-Blöcke ungültige Antworten weiterhin abfangen.
+    """
+    try:
+        return loads(response.content)
+    except ValueError as e:
+        raise requests.exceptions.JSONDecodeError(str(e), response.text, 0) from e
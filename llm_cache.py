@@ -0,0 +1,126 @@
+"""
+Persistenter Cache für LLM-Ergebnisse der Suche
+Speichert z.B. generierte Synonyme und Query-Varianten pro normalisierter Frage,
+damit wiederholte Fragen keinen neuen LLM-Aufruf brauchen (auch nach einem Neustart)
+"""
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from json_utils import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    """Vereinheitlicht Groß-/Kleinschreibung und Whitespace einer Frage"""
+    return _WHITESPACE_RE.sub(' ', query.strip().lower())
+
+
+class LLMResultCache:
+    """LRU im Speicher, optional mit SQLite-Datei als zweiter Stufe; Einträge verfallen nach ttl Sekunden"""
+
+    def __init__(self, db_path: Optional[str] = None, max_size: int = 1024, ttl: float = 86400.0):
+        """
+        Initialisiert den Cache
+
+        Args:
+            db_path: Pfad zur SQLite-Datei (None = nur im Speicher)
+            max_size: Maximale Anzahl Einträge im Speicher (0 deaktiviert den Cache)
+            ttl: Lebensdauer eines Eintrags in Sekunden (Standard: 24h)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+        if db_path and max_size > 0:
+            try:
+                self._conn = sqlite3.connect(db_path, check_same_thread=False)
+                self._conn.execute('PRAGMA journal_mode=WAL')
+                self._conn.execute('PRAGMA synchronous=NORMAL')
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS llm_results (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                ''')
+                # Abgelaufene Einträge beim Start aufräumen
+                self._conn.execute('DELETE FROM llm_results WHERE created_at < ?', (time.time() - ttl,))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"LLM-Cache-Datei nicht nutzbar, nur In-Memory-Cache: {e}")
+                self._conn = None
+
+    @staticmethod
+    def make_key(namespace: str, model: str, query: str) -> str:
+        """Key aus Art des Ergebnisses, Modell und normalisierter Frage"""
+        return hashlib.sha1(f"{namespace}|{model}|{normalize_query(query)}".encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Gibt ein gespeichertes Ergebnis zurück oder None"""
+        if self.max_size <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    return entry[0]
+                del self._entries[key]
+
+            if self._conn is None:
+                return None
+            try:
+                row = self._conn.execute(
+                    'SELECT value, created_at FROM llm_results WHERE key = ?', (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.debug(f"Fehler beim Lesen aus dem LLM-Cache: {e}")
+                return None
+            if row is None or now - row[1] > self.ttl:
+                return None
+            value = loads(row[0])
+            self._remember(key, value, row[1])
+            return value
+
+    def put(self, key: str, value: Any):
+        """Speichert ein Ergebnis (leere Ergebnisse werden nicht gespeichert)"""
+        if self.max_size <= 0 or not value:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO llm_results (key, value, created_at) VALUES (?, ?, ?)',
+                    (key, dumps(value).decode('utf-8'), now)
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.debug(f"Fehler beim Schreiben in den LLM-Cache: {e}")
+
+    def _remember(self, key: str, value: Any, created_at: float):
+        """Legt einen Eintrag in der In-Memory-LRU ab (Lock muss gehalten werden)"""
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def close(self):
+        """Schließt die SQLite-Verbindung"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
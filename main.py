@@ -3,14 +3,20 @@
 Paperless-NGX AI Agent
 Verarbeitet Dokumente mit dem Tag "KI" und klassifiziert sie automatisch
 """
+import atexit
 import os
 import sys
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
 from dotenv import load_dotenv
-from paperless_client import PaperlessClient
+from paperless_client import PaperlessClient, LIST_FIELDS
 from ollama_classifier import OllamaClassifier
 from config import DOCUMENT_TYPES, PERSON_TAGS, CORRESPONDENTS
 from database import DocumentDatabase
+from embedding_service import EmbeddingService
+from classification_cache import SemanticClassificationCache
 
 # Logging konfigurieren
 logging.basicConfig(
@@ -23,6 +29,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+_SPACE_TO_UNDERSCORE = str.maketrans({' ': '_'})
+
 
 def ensure_metadata_exists(paperless: PaperlessClient):
     """
@@ -52,10 +60,43 @@ def ensure_metadata_exists(paperless: PaperlessClient):
             paperless.create_correspondent(correspondent)
 
 
+def build_title(validated: Dict) -> str:
+    """
+    Erzeugt den Titel datum_dokumenttyp_korrespondent_person aus einer validierten Klassifizierung
+
+    Returns:
+        Titel oder leerer String wenn keine Bestandteile vorhanden sind
+    """
+    title_parts = []
+
+    # Datum (falls vorhanden)
+    if 'date' in validated:
+        title_parts.append(validated['date'])
+
+    # Dokumententyp und Korrespondent (falls vorhanden), Leerzeichen -> _
+    title_parts.extend(
+        validated[key].lower().translate(_SPACE_TO_UNDERSCORE)
+        for key in ('document_type', 'correspondent')
+        if key in validated
+    )
+
+    # Personen-Tags (falls vorhanden), alle Personen mit _ verbinden
+    if validated.get('person_tags'):
+        title_parts.append('_'.join(p.lower() for p in validated['person_tags']))
+
+    return '_'.join(title_parts)
+
+
 def process_document(doc_id: int, paperless: PaperlessClient, classifier: OllamaClassifier,
-                     db: DocumentDatabase, dry_run: bool = False):
+                     db: DocumentDatabase, dry_run: bool = False,
+                     doc_types: Optional[Dict[str, int]] = None,
+                     correspondents: Optional[Dict[str, int]] = None,
+                     all_tags: Optional[Dict[str, int]] = None):
     """
     Verarbeitet ein einzelnes Dokument
+
+    doc_types, correspondents und all_tags (Name -> ID) können einmal vorab geladen
+    und für alle Dokumente wiederverwendet werden; fehlen sie, werden sie bei Bedarf geholt.
     """
     logger.info(f"Verarbeite Dokument {doc_id}...")
 
@@ -66,19 +107,28 @@ def process_document(doc_id: int, paperless: PaperlessClient, classifier: Ollama
         db.add_processed_document(doc_id, 'Unbekannt', {}, False, 'Kein Inhalt gefunden')
         return False
 
-    # Klassifizierung durchführen
-    classification = classifier.classify_document(content)
-    if not classification:
-        logger.error(f"Klassifizierung fehlgeschlagen für Dokument {doc_id}")
-        db.add_processed_document(doc_id, 'Unbekannt', {}, False, 'Klassifizierung fehlgeschlagen')
-        return False
+    # Identischer Inhalt bereits erfolgreich klassifiziert? Dann kein LLM-Aufruf nötig
+    content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    validated = db.get_classification_by_hash(content_hash)
 
-    # Validieren
-    validated = classifier.validate_classification(classification)
-    if not validated:
-        logger.warning(f"Keine gültigen Klassifizierungen für Dokument {doc_id}")
-        db.add_processed_document(doc_id, 'Unbekannt', classification, False, 'Keine gültigen Klassifizierungen')
-        return False
+    if validated:
+        logger.info(f"Dokument {doc_id}: Klassifizierung für identischen Inhalt aus Datenbank übernommen")
+    else:
+        # Klassifizierung durchführen
+        classification = classifier.classify_document(content)
+        if not classification:
+            logger.error(f"Klassifizierung fehlgeschlagen für Dokument {doc_id}")
+            db.add_processed_document(doc_id, 'Unbekannt', {}, False, 'Klassifizierung fehlgeschlagen',
+                                      content_hash=content_hash)
+            return False
+
+        # Validieren
+        validated = classifier.validate_classification(classification)
+        if not validated:
+            logger.warning(f"Keine gültigen Klassifizierungen für Dokument {doc_id}")
+            db.add_processed_document(doc_id, 'Unbekannt', classification, False, 'Keine gültigen Klassifizierungen',
+                                      content_hash=content_hash)
+            return False
 
     logger.info(f"Klassifizierung: {validated}")
 
@@ -87,26 +137,26 @@ def process_document(doc_id: int, paperless: PaperlessClient, classifier: Ollama
 
     # Dokumententyp
     if 'document_type' in validated:
-        doc_types = paperless.get_all_document_types()
+        if doc_types is None:
+            doc_types = paperless.get_all_document_types()
         doc_type_id = doc_types.get(validated['document_type'])
         if doc_type_id:
             updates['document_type'] = doc_type_id
 
     # Korrespondent
     if 'correspondent' in validated:
-        correspondents = paperless.get_all_correspondents()
+        if correspondents is None:
+            correspondents = paperless.get_all_correspondents()
         correspondent_id = correspondents.get(validated['correspondent'])
         if correspondent_id:
             updates['correspondent'] = correspondent_id
 
     # Tags (Personen)
     if 'person_tags' in validated and validated['person_tags']:
-        all_tags = paperless.get_all_tags()
+        if all_tags is None:
+            all_tags = paperless.get_all_tags()
         tag_ids = [all_tags[tag] for tag in validated['person_tags'] if tag in all_tags]
 
-        # Hole aktuelle Tags des Dokuments
-        current_doc = paperless.get_document_content(doc_id)
-
         # KI-Tag beibehalten, neue Tags hinzufügen
         ki_tag_id = all_tags.get('KI')
         if ki_tag_id:
@@ -120,50 +170,32 @@ def process_document(doc_id: int, paperless: PaperlessClient, classifier: Ollama
         updates['created'] = validated['date']
 
     # Titel generieren: datum_dokumenttyp_korrespondent_person
-    title_parts = []
-
-    # Datum (falls vorhanden)
-    if 'date' in validated:
-        title_parts.append(validated['date'])
-
-    # Dokumententyp (falls vorhanden)
-    if 'document_type' in validated:
-        title_parts.append(validated['document_type'].lower().replace(' ', '_'))
-
-    # Korrespondent (falls vorhanden)
-    if 'correspondent' in validated:
-        title_parts.append(validated['correspondent'].lower().replace(' ', '_'))
-
-    # Personen-Tags (falls vorhanden)
-    if 'person_tags' in validated and validated['person_tags']:
-        # Alle Personen mit _ verbinden
-        persons = '_'.join([p.lower() for p in validated['person_tags']])
-        title_parts.append(persons)
-
-    # Titel zusammensetzen
-    if title_parts:
-        new_title = '_'.join(title_parts)
+    new_title = build_title(validated)
+    if new_title:
         updates['title'] = new_title
         logger.info(f"Generiere Titel: {new_title}")
 
     # Updates anwenden
     if not updates:
         logger.info(f"Keine Updates für Dokument {doc_id}")
-        db.add_processed_document(doc_id, 'Unbekannt', validated, True)
+        db.add_processed_document(doc_id, 'Unbekannt', validated, True, content_hash=content_hash)
         return True
 
+    title = updates.get('title', 'Unbekannt')
+
     if dry_run:
         logger.info(f"DRY-RUN: Würde Dokument {doc_id} aktualisieren mit: {updates}")
-        db.add_processed_document(doc_id, updates.get('title', 'Unbekannt'), validated, True)
+        db.add_processed_document(doc_id, title, validated, True, content_hash=content_hash)
         return True
 
     success = paperless.update_document(doc_id, updates)
     if success:
         logger.info(f"Dokument {doc_id} erfolgreich aktualisiert")
-        db.add_processed_document(doc_id, updates.get('title', 'Unbekannt'), validated, True)
+        db.add_processed_document(doc_id, title, validated, True, content_hash=content_hash)
     else:
         logger.error(f"Fehler beim Aktualisieren von Dokument {doc_id}")
-        db.add_processed_document(doc_id, updates.get('title', 'Unbekannt'), validated, False, 'Update fehlgeschlagen')
+        db.add_processed_document(doc_id, title, validated, False, 'Update fehlgeschlagen',
+                                  content_hash=content_hash)
 
     return success
 
@@ -195,28 +227,46 @@ def main():
     logger.info(f"Dry-Run Modus: {dry_run}")
     logger.info("=" * 60)
 
-    # Clients initialisieren
-    paperless = PaperlessClient(paperless_url, paperless_token)
-    classifier = OllamaClassifier(ollama_url, ollama_model)
-
     # Datenverzeichnis erstellen falls nicht vorhanden
     data_dir = os.path.join(os.path.dirname(__file__), 'data')
     os.makedirs(data_dir, exist_ok=True)
+
+    # Semantischer Klassifizierungs-Cache (optional, konfigurierbar über .env)
+    classification_cache = None
+    if os.getenv('USE_CLASSIFICATION_CACHE', 'false').lower() == 'true':
+        embedding_model = os.getenv('EMBEDDING_MODEL', 'nomic-embed-text')
+        logger.info(f"Klassifizierungs-Cache aktiviert (Embedding-Modell: {embedding_model})")
+        classification_cache = SemanticClassificationCache(
+            EmbeddingService(ollama_url=ollama_url, model=embedding_model),
+            persist_directory=os.path.join(data_dir, 'classification_cache')
+        )
+
+    # Clients initialisieren
+    paperless = PaperlessClient(paperless_url, paperless_token)
+    classifier = OllamaClassifier(ollama_url, ollama_model, cache=classification_cache)
     db_path = os.path.join(data_dir, 'processed_documents.db')
     db = DocumentDatabase(db_path=db_path)
+    # Ausstehende Schreibzugriffe des Hintergrund-Writers beim Beenden schreiben
+    atexit.register(db.close)
 
     # Metadaten sicherstellen
     ensure_metadata_exists(paperless)
 
+    # Metadaten-Kataloge einmal laden (nach ensure_metadata_exists, damit neu erstellte enthalten sind)
+    doc_types = paperless.get_all_document_types()
+    correspondents = paperless.get_all_correspondents()
+    all_tags = paperless.get_all_tags()
+
     # Dokumente mit Tag "KI" abrufen
-    all_documents = paperless.get_documents_by_tag('KI')
+    all_documents = paperless.get_documents_by_tag('KI', fields=LIST_FIELDS)
 
     if not all_documents:
         logger.info("Keine Dokumente mit Tag 'KI' gefunden")
         return
 
     # Filtere bereits verarbeitete Dokumente heraus
-    documents = [doc for doc in all_documents if not db.is_document_processed(doc['id'])]
+    processed_ids = db.get_processed_ids([doc['id'] for doc in all_documents])
+    documents = [doc for doc in all_documents if doc['id'] not in processed_ids]
 
     if not documents:
         logger.info(f"Alle {len(all_documents)} Dokumente wurden bereits verarbeitet")
@@ -225,24 +275,29 @@ def main():
 
     logger.info(f"Gefunden: {len(documents)} neue Dokumente zur Verarbeitung ({len(all_documents)} gesamt)")
 
-    # Dokumente verarbeiten
-    success_count = 0
-    error_count = 0
+    # Dokumente verarbeiten - parallel, da jeder Schritt auf Paperless/Ollama wartet.
+    # Die Anzahl Worker sollte zu OLLAMA_NUM_PARALLEL des Ollama Servers passen.
+    workers = max(1, int(os.getenv('PROCESSING_WORKERS', '4')))
+    logger.info(f"Verarbeite mit {workers} parallelen Workern")
 
-    for doc in documents:
+    def run(doc: Dict) -> bool:
         doc_id = doc['id']
         doc_title = doc.get('title', 'Unbekannt')
         logger.info(f"\n--- Dokument {doc_id}: {doc_title} ---")
 
         try:
-            if process_document(doc_id, paperless, classifier, db, dry_run):
-                success_count += 1
-            else:
-                error_count += 1
+            return process_document(doc_id, paperless, classifier, db, dry_run,
+                                    doc_types=doc_types, correspondents=correspondents, all_tags=all_tags)
         except Exception as e:
             logger.error(f"Unerwarteter Fehler bei Dokument {doc_id}: {e}")
             db.add_processed_document(doc_id, doc_title, {}, False, f"Unerwarteter Fehler: {str(e)}")
-            error_count += 1
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(run, documents))
+
+    success_count = sum(1 for ok in outcomes if ok)
+    error_count = len(outcomes) - success_count
 
     # Zusammenfassung
     logger.info("\n" + "=" * 60)
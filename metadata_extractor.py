@@ -3,14 +3,126 @@ Metadata Extractor für intelligente Query-Filtering
 Extrahiert Filter-Kriterien aus natürlichsprachigen Fragen
 """
 import logging
-import json
 import re
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Dict, Any, Iterable, Optional, Tuple
 from datetime import datetime
-from ollama_classifier import OllamaClassifier
+from ollama_classifier import OllamaClassifier, extract_json
+from vector_store import build_where_filter
 
 logger = logging.getLogger(__name__)
 
+# Extrahierte Filter, die convert_to_chromadb_filter als Auto-Filter übernimmt
+AUTO_FILTER_KEYS = ('document_type', 'correspondent')
+
+# Jahr-Extraktion (2020-2029)
+_YEAR_RE = re.compile(r'\b(202\d)\b')
+
+# Monat-Extraktion (Januar, Februar, etc.)
+_MONTHS = {
+    'januar': '01', 'februar': '02', 'märz': '03', 'april': '04',
+    'mai': '05', 'juni': '06', 'juli': '07', 'august': '08',
+    'september': '09', 'oktober': '10', 'november': '11', 'dezember': '12'
+}
+
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """
+    Baut aus einer Wortliste eine Trie-komprimierte Regex-Alternation
+
+    Gemeinsame Präfixe werden nur einmal geprüft, z.B. ['juni', 'juli'] -> 'ju(?:li|ni)'.
+    Längere Wörter stehen vor ihren Präfixen, damit immer der längste Treffer gewinnt.
+    """
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}  # Wortende
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if len(branches) == 1 and '' not in node:
+            return branches[0]
+        group = '(?:' + '|'.join(branches) + ')'
+        return group + '?' if '' in node else group
+
+    return build(trie)
+
+
+def _compile_terms(terms: Iterable[str]) -> re.Pattern:
+    """Kompiliert Begriffe zu einem Muster, das nur ganze Wörter trifft (ohne Groß-/Kleinschreibung)"""
+    # Lookarounds statt \b, damit auch Namen mit Sonderzeichen am Rand (z.B. "1&1") passen
+    return re.compile(r'(?<!\w)(' + _trie_regex(terms) + r')(?!\w)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=32)
+def _metadata_pattern(names: Tuple[str, ...]) -> Tuple[re.Pattern, Dict[str, str]]:
+    """Muster und Rückabbildung (klein -> Originalname) für eine Liste von Metadaten-Namen"""
+    lookup = {name.lower(): name for name in names if name}
+    return _compile_terms(lookup), lookup
+
+
+# Wortgrenzen, damit z.B. "mai" nicht in "E-Mail" anschlägt
+_MONTH_RE = _compile_terms(_MONTHS)
+
+# Gleichbleibender Teil des Filter-Prompts (vor den variablen Teilen, siehe _extract_filters_llm)
+_FILTER_PROMPT_PREFIX = """Analysiere die Suchanfrage am Ende und extrahiere Filter-Kriterien.
+
+Aufgabe: Extrahiere folgende Filter falls in der Frage enthalten:
+- document_type: Dokumenttyp (z.B. "Rechnung", "Vertrag", "Lieferschein")
+- correspondent: Absender/Korrespondent (z.B. "Amazon", "Telekom")
+- tags: Tags (z.B. "wichtig", "privat")
+- year: Jahr (z.B. "2024")
+
+WICHTIG:
+- Nutze NUR Werte die in der Frage explizit genannt werden
+- Wenn nichts gefunden wurde, gib leeres JSON zurück: {}
+- Antworte NUR mit JSON, keine Erklärungen!
+
+Beispiele:
+Frage: "Zeige mir Rechnungen von Amazon aus 2024"
+Antwort: {"document_type": "Rechnung", "correspondent": "Amazon", "year": "2024"}
+
+Frage: "Welche Verträge habe ich?"
+Antwort: {"document_type": "Vertrag"}
+
+Frage: "Was steht in meinen Dokumenten?"
+Antwort: {}
+"""
+
+# Kombinierter Prompt: Filter und Synonyme in einem LLM-Aufruf (siehe extract_filters_and_synonyms)
+_FILTER_SYNONYM_PROMPT_PREFIX = """Analysiere die Suchanfrage am Ende: extrahiere Filter-Kriterien und generiere Synonyme.
+
+Aufgabe 1 - Filter, falls in der Frage enthalten:
+- document_type: Dokumenttyp (z.B. "Rechnung", "Vertrag", "Lieferschein")
+- correspondent: Absender/Korrespondent (z.B. "Amazon", "Telekom")
+- tags: Tags (z.B. "wichtig", "privat")
+- year: Jahr (z.B. "2024")
+
+Aufgabe 2 - Synonyme: 2-4 Synonyme oder alternative Schreibweisen pro wichtigem Suchbegriff, durch Komma getrennt.
+
+WICHTIG:
+- Nutze für Filter NUR Werte die in der Frage explizit genannt werden
+- Antworte NUR mit JSON im Format {"filters": {...}, "synonyms": "..."}, keine Erklärungen!
+
+Beispiele:
+Frage: "Zeige mir Rechnungen von Amazon aus 2024"
+Antwort: {"filters": {"document_type": "Rechnung", "correspondent": "Amazon", "year": "2024"}, "synonyms": "Invoice, Faktura, Beleg"}
+
+Frage: "Wie lautet meine Steuer ID?"
+Antwort: {"filters": {}, "synonyms": "Steuer-Identifikationsnummer, Steuernummer, Tax ID"}
+"""
+
+# Großgeschriebene Wörter, die keine Filter-Kandidaten sind (Satzanfang, Fragewörter)
+_STOPWORDS = frozenset({
+    'was', 'wie', 'wo', 'wer', 'wann', 'welche', 'welcher', 'welches', 'warum',
+    'zeige', 'zeig', 'gib', 'finde', 'suche', 'liste', 'habe', 'hab', 'ich', 'mir',
+    'mein', 'meine', 'meinen', 'alle', 'der', 'die', 'das', 'von', 'aus', 'im', 'in'
+})
+
 
 class MetadataExtractor:
     """Extrahiert Metadata-Filter aus natürlichsprachigen Fragen"""
@@ -25,20 +137,28 @@ class MetadataExtractor:
         self.llm = llm
         logger.info("MetadataExtractor initialisiert")
 
-    def extract_filters(self, query: str, available_metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def extract_filters(self, query: str, available_metadata: Optional[Dict[str, Any]] = None,
+                        force_llm: bool = False) -> Dict[str, Any]:
         """
         Extrahiert Filter-Kriterien aus einer Frage
 
         Args:
             query: Die Suchanfrage
             available_metadata: Verfügbare Metadaten (Tags, Typen, Korrespondenten)
+            force_llm: LLM-Extraktion auch dann ausführen, wenn die Regex-Filter ausreichen
 
         Returns:
             Dictionary mit ChromaDB-kompatiblen Filtern
         """
         try:
             # Schnelle Regex-basierte Extraktion für häufige Patterns
-            regex_filters = self._extract_filters_regex(query)
+            regex_filters = self._extract_filters_regex(query, available_metadata)
+
+            # LLM-Aufruf sparen, wenn er voraussichtlich nichts Neues liefert
+            if not force_llm and not self._needs_llm(query, regex_filters, available_metadata):
+                if regex_filters:
+                    logger.info(f"Filter extrahiert (nur Regex): {regex_filters}")
+                return regex_filters
 
             # LLM-basierte Extraktion für komplexe Queries
             llm_filters = self._extract_filters_llm(query, available_metadata)
@@ -54,37 +174,134 @@ class MetadataExtractor:
             logger.error(f"Fehler bei Filter-Extraktion: {e}")
             return {}
 
-    def _extract_filters_regex(self, query: str) -> Dict[str, Any]:
+    def extract_filters_and_synonyms(
+        self,
+        query: str,
+        available_metadata: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        Extrahiert Filter und generiert Synonyme mit einem einzigen LLM-Aufruf
+
+        Für Suchen mit LLM-Query-Expansion: statt je eines Aufrufs für Filter und
+        Synonyme. Braucht die Filter-Extraktion kein LLM, wird auch keins aufgerufen.
+
+        Args:
+            query: Die Suchanfrage
+            available_metadata: Verfügbare Metadaten (Tags, Typen, Korrespondenten)
+
+        Returns:
+            Tuple aus Filtern und Synonymen (None wenn kein LLM-Aufruf stattfand)
+        """
+        try:
+            regex_filters = self._extract_filters_regex(query, available_metadata)
+            if not self._needs_llm(query, regex_filters, available_metadata):
+                return regex_filters, None
+
+            prompt = f"""{_FILTER_SYNONYM_PROMPT_PREFIX}{self._metadata_context(available_metadata)}
+
+Suchanfrage: {query}
+JSON:"""
+            response = self.llm.generate(prompt, temperature=0.1, json_format=True)
+            result = extract_json(response) if response else None
+            if not isinstance(result, dict):
+                return regex_filters, None
+
+            llm_filters = result.get('filters')
+            filters = {**regex_filters, **(llm_filters if isinstance(llm_filters, dict) else {})}
+            synonyms = result.get('synonyms')
+            if isinstance(synonyms, list):
+                synonyms = ', '.join(str(s) for s in synonyms)
+            if filters:
+                logger.info(f"Filter extrahiert: {filters}")
+            return filters, synonyms if isinstance(synonyms, str) else ''
+
+        except Exception as e:
+            logger.error(f"Fehler bei Filter-/Synonym-Extraktion: {e}")
+            return {}, None
+
+    def _needs_llm(self, query: str, regex_filters: Dict[str, Any],
+                   available_metadata: Optional[Dict[str, Any]]) -> bool:
+        """
+        Ob die LLM-Extraktion voraussichtlich mehr liefert als die Regex-Filter
+
+        Zählt nur Treffer, die als Auto-Filter übrig bleiben (AUTO_FILTER_KEYS): ein
+        gefundenes Jahr oder ein Monat ersetzt nicht die Suche nach Typ und Korrespondent.
+        """
+        if any(key in regex_filters for key in AUTO_FILTER_KEYS):
+            return available_metadata is not None and not self._query_looks_simple(query)
+        return not self._query_looks_simple(query)
+
+    @staticmethod
+    def _metadata_context(available_metadata: Optional[Dict[str, Any]]) -> str:
+        """Verfügbare Metadaten als Prompt-Zeilen"""
+        metadata_context = ""
+        if available_metadata:
+            if 'document_types' in available_metadata:
+                metadata_context += f"\nVerfügbare Dokumenttypen: {', '.join(available_metadata['document_types'])}"
+            if 'correspondents' in available_metadata:
+                metadata_context += f"\nVerfügbare Korrespondenten: {', '.join(available_metadata['correspondents'])}"
+            if 'tags' in available_metadata:
+                metadata_context += f"\nVerfügbare Tags: {', '.join(available_metadata['tags'])}"
+        return metadata_context
+
+    @staticmethod
+    def _query_looks_simple(query: str) -> bool:
+        """
+        Kurze Frage (weniger als 4 Wörter) ohne großgeschriebene Nicht-Stoppwörter
+
+        Großgeschriebene Wörter sind im Deutschen Substantive oder Namen und damit
+        mögliche Dokumenttypen oder Korrespondenten - dann lohnt sich das LLM.
+        """
+        words = query.split()
+        if len(words) >= 4:
+            return False
+        return not any(
+            word[0].isupper() and word.strip('?!.,').lower() not in _STOPWORDS
+            for word in words
+        )
+
+    def _extract_filters_regex(self, query: str, available_metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Schnelle Regex-basierte Filter-Extraktion
 
         Args:
             query: Die Suchanfrage
+            available_metadata: Verfügbare Metadaten; deren Namen werden ebenfalls per Regex gesucht
 
         Returns:
             Dictionary mit Filtern
         """
         filters = {}
-        query_lower = query.lower()
 
         # Jahr-Extraktion (2020-2029)
-        year_match = re.search(r'\b(202\d)\b', query)
+        year_match = _YEAR_RE.search(query)
         if year_match:
             year = year_match.group(1)
             filters['created_year'] = year
             logger.debug(f"Jahr gefunden: {year}")
 
         # Monat-Extraktion (Januar, Februar, etc.)
-        months = {
-            'januar': '01', 'februar': '02', 'märz': '03', 'april': '04',
-            'mai': '05', 'juni': '06', 'juli': '07', 'august': '08',
-            'september': '09', 'oktober': '10', 'november': '11', 'dezember': '12'
-        }
-        for month_name, month_num in months.items():
-            if month_name in query_lower:
-                filters['created_month'] = month_num
-                logger.debug(f"Monat gefunden: {month_name}")
-                break
+        month_match = _MONTH_RE.search(query)
+        if month_match:
+            month_name = month_match.group(1).lower()
+            filters['created_month'] = _MONTHS[month_name]
+            logger.debug(f"Monat gefunden: {month_name}")
+
+        # Bekannte Dokumenttypen, Korrespondenten und Tags (Muster wird pro Namensliste gecacht)
+        if available_metadata:
+            for metadata_key, filter_key in (('document_types', 'document_type'), ('correspondents', 'correspondent')):
+                names = available_metadata.get(metadata_key)
+                if names:
+                    pattern, lookup = _metadata_pattern(tuple(names))
+                    match = pattern.search(query)
+                    if match:
+                        filters[filter_key] = lookup[match.group(1).lower()]
+
+            if available_metadata.get('tags'):
+                pattern, lookup = _metadata_pattern(tuple(available_metadata['tags']))
+                tags = list(dict.fromkeys(lookup[m.lower()] for m in pattern.findall(query)))
+                if tags:
+                    filters['tags'] = tags
 
         return filters
 
@@ -100,55 +317,18 @@ class MetadataExtractor:
             Dictionary mit Filtern
         """
         try:
-            # Build metadata context
-            metadata_context = ""
-            if available_metadata:
-                if 'document_types' in available_metadata:
-                    metadata_context += f"\nVerfügbare Dokumenttypen: {', '.join(available_metadata['document_types'])}"
-                if 'correspondents' in available_metadata:
-                    metadata_context += f"\nVerfügbare Korrespondenten: {', '.join(available_metadata['correspondents'])}"
-                if 'tags' in available_metadata:
-                    metadata_context += f"\nVerfügbare Tags: {', '.join(available_metadata['tags'])}"
-
-            prompt = f"""Analysiere diese Suchanfrage und extrahiere Filter-Kriterien.
+            # Suchanfrage am Ende: der gleichbleibende Anfang kann von Ollama wiederverwendet werden
+            prompt = f"""{_FILTER_PROMPT_PREFIX}{self._metadata_context(available_metadata)}
 
 Suchanfrage: {query}
-{metadata_context}
-
-Aufgabe: Extrahiere folgende Filter falls in der Frage enthalten:
-- document_type: Dokumenttyp (z.B. "Rechnung", "Vertrag", "Lieferschein")
-- correspondent: Absender/Korrespondent (z.B. "Amazon", "Telekom")
-- tags: Tags (z.B. "wichtig", "privat")
-- year: Jahr (z.B. "2024")
-
-WICHTIG:
-- Nutze NUR Werte die in der Frage explizit genannt werden
-- Wenn nichts gefunden wurde, gib leeres JSON zurück: {{}}
-- Antworte NUR mit JSON, keine Erklärungen!
-
-Beispiele:
-Frage: "Zeige mir Rechnungen von Amazon aus 2024"
-Antwort: {{"document_type": "Rechnung", "correspondent": "Amazon", "year": "2024"}}
-
-Frage: "Welche Verträge habe ich?"
-Antwort: {{"document_type": "Vertrag"}}
-
-Frage: "Was steht in meinen Dokumenten?"
-Antwort: {{}}
-
 JSON:"""
 
             response = self.llm.generate(prompt, temperature=0.1)
 
-            # Parse JSON
+            # Parse JSON (erstes Objekt in der Antwort)
             if response:
-                # Find JSON in response
-                start_idx = response.find('{')
-                end_idx = response.rfind('}') + 1
-
-                if start_idx != -1 and end_idx > start_idx:
-                    json_str = response[start_idx:end_idx]
-                    filters = json.loads(json_str)
+                filters = extract_json(response)
+                if filters is not None:
                     logger.debug(f"LLM Filter extrahiert: {filters}")
                     return filters
 
@@ -170,27 +350,10 @@ JSON:"""
         if not extracted_filters:
             return None
 
-        where_conditions = {}
-
-        # Dokumenttyp
-        if 'document_type' in extracted_filters:
-            where_conditions['document_type'] = extracted_filters['document_type']
-
-        # Korrespondent
-        if 'correspondent' in extracted_filters:
-            where_conditions['correspondent'] = extracted_filters['correspondent']
-
-        # Tags (contains check)
-        if 'tags' in extracted_filters:
-            # ChromaDB doesn't support "contains", so we'd need to do this client-side
-            # For now, we skip tag filtering in ChromaDB and do it post-search
-            pass
-
-        # Jahr
-        if 'year' in extracted_filters or 'created_year' in extracted_filters:
-            year = extracted_filters.get('year') or extracted_filters.get('created_year')
-            # ChromaDB metadata are strings, so we filter by startswith
-            # We'll need to do this client-side for now
-            pass
-
-        return where_conditions if where_conditions else None
+        # Jahr und Tags bleiben als Auto-Filter außen vor (Dokumente aus älteren Indizes
+        # haben diese Felder nicht und würden sonst bei jeder Frage mit Jahreszahl fehlen)
+        return build_where_filter({
+            key: extracted_filters[key]
+            for key in AUTO_FILTER_KEYS
+            if key in extracted_filters
+        })
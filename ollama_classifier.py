@@ -1,51 +1,77 @@
 """
 Ollama-basierte Dokumentenklassifizierung
 """
+import hashlib
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import logging
-from typing import Dict, List, Optional
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Dict, Iterator, List, Optional, TYPE_CHECKING
 from config import DOCUMENT_TYPES, PERSON_TAGS, CORRESPONDENTS
+from json_utils import dumps, loads, response_json
+
+if TYPE_CHECKING:
+    from classification_cache import SemanticClassificationCache
 
 logger = logging.getLogger(__name__)
 
+# Nur (nahezu) deterministische Aufrufe werden gecacht - bei höherer Temperatur
+# (z.B. Q&A-Antworten) soll eine erneute Anfrage auch eine neue Antwort liefern
+CACHEABLE_MAX_TEMPERATURE = 0.3
 
-class OllamaClassifier:
-    def __init__(self, base_url: str, model: str):
-        self.base_url = base_url.rstrip('/')
-        self.model = model
+# Sehr niedrige Temperatur für präzise Klassifizierung
+CLASSIFICATION_TEMPERATURE = 0.05
 
-    def _call_ollama(self, prompt: str) -> Optional[str]:
-        """
-        Ruft Ollama API auf
-        """
-        try:
-            response = requests.post(
-                f'{self.base_url}/api/generate',
-                json={
-                    'model': self.model,
-                    'prompt': prompt,
-                    'stream': False,
-                    'options': {
-                        'temperature': 0.05,  # Sehr niedrige Temperatur für präzise Klassifizierung
-                    }
-                },
-                timeout=180
-            )
-            response.raise_for_status()
-            return response.json().get('response', '').strip()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Fehler beim Aufruf von Ollama: {e}")
-            return None
+# Sets für die Validierung (Mitgliedschaftstest O(1) statt Listen-Durchlauf).
+# Werte aus der LLM-Antwort vorher auf str prüfen - Listen/Dicts sind nicht hashbar
+_DOCUMENT_TYPES = frozenset(DOCUMENT_TYPES)
+_PERSON_TAGS = frozenset(PERSON_TAGS)
+_CORRESPONDENTS = frozenset(CORRESPONDENTS)
 
-    def classify_document(self, content: str) -> Dict:
-        """
-        Klassifiziert ein Dokument und extrahiert Metadaten
-        """
-        prompt = f"""Analysiere das folgende Dokument und extrahiere die Metadaten SEHR GENAU.
+# Vorfilter: Dokumente mit weniger Nicht-Leerzeichen sind Leerseiten/Scan-Banner
+MIN_CONTENT_CHARS = 50
+
+# Ein Suchlauf über den Text findet jeden Begriff aus den Listen (auch als Wortteil,
+# z.B. "Rechnung" in "Stromrechnung"); längere Begriffe zuerst
+_VOCABULARY_RE = re.compile(
+    '|'.join(re.escape(term) for term in sorted(
+        set(DOCUMENT_TYPES) | set(CORRESPONDENTS) | set(PERSON_TAGS), key=len, reverse=True
+    ) if term),
+    re.IGNORECASE
+)
+
+# Textbudget für die Klassifizierung (~750 Tokens bei deutschem Text)
+MAX_CONTENT_CHARS = 3000
+
+# OCR-Text enthält oft lange Leerzeichen-/Leerzeilen-Folgen, die das Budget verbrauchen
+_SPACE_RUN_RE = re.compile(r'[ \t\f\v]+')
+_BLANK_LINES_RE = re.compile(r'\n\s*\n')
 
-DOKUMENTENTEXT:
-{content[:3000]}
+# Datumsangaben im Dokumententext (für Cache-Treffer ähnlicher Dokumente, deren Datum
+# nicht übernommen werden darf): 2024-03-15, 15.03.2024 und 15. März 2024
+_DATE_MONTHS = {
+    'januar': 1, 'februar': 2, 'märz': 3, 'maerz': 3, 'april': 4, 'mai': 5, 'juni': 6,
+    'juli': 7, 'august': 8, 'september': 9, 'oktober': 10, 'november': 11, 'dezember': 12
+}
+_DATE_RE = re.compile(
+    r'\b(?:(?P<iso_y>\d{4})-(?P<iso_m>\d{2})-(?P<iso_d>\d{2})'
+    r'|(?P<de_d>\d{1,2})\.(?P<de_m>\d{1,2})\.(?P<de_y>\d{4})'
+    r'|(?P<name_d>\d{1,2})\.\s*(?P<name_m>' + '|'.join(_DATE_MONTHS) + r')\s+(?P<name_y>\d{4}))\b',
+    re.IGNORECASE
+)
+
+# Wie lange Ollama das Modell nach einer Anfrage geladen hält (spart erneutes Laden)
+KEEP_ALIVE = '30m'
+
+# Gleichbleibender Teil des Klassifizierungs-Prompts. Er steht vor dem Dokumententext,
+# damit Ollama den KV-Cache für diesen Präfix zwischen Anfragen wiederverwenden kann
+_CLASSIFICATION_PROMPT_PREFIX = f"""Analysiere das Dokument am Ende und extrahiere die Metadaten SEHR GENAU.
 
 WICHTIG: Sei KONSERVATIV bei der Klassifizierung. Wenn du dir nicht SICHER bist, setze null!
 
@@ -78,6 +104,258 @@ ANTWORTFORMAT (nur JSON, keine Erklärungen):
     "date": "2024-03-15"
 }}
 
+"""
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def truncate_content(content: str, max_chars: int = MAX_CONTENT_CHARS) -> str:
+    """
+    Kürzt einen Dokumententext auf das Budget für den Prompt
+
+    Kurze Texte werden unverändert zurückgegeben. Bei langen Texten werden zuerst
+    Leerzeichen-Folgen und Leerzeilen zusammengefasst (Zeilenumbrüche bleiben),
+    damit das Budget mehr Inhalt statt OCR-Leerraum enthält.
+    """
+    if len(content) <= max_chars:
+        return content
+
+    # Nur den Anfang normalisieren, der Rest wird ohnehin abgeschnitten
+    head = content[:max_chars * 2]
+    head = _BLANK_LINES_RE.sub('\n', _SPACE_RUN_RE.sub(' ', head))
+    return head[:max_chars]
+
+
+def extract_json(text: str) -> Optional[Dict]:
+    """
+    Dekodiert das erste JSON-Objekt in einer LLM-Antwort
+
+    raw_decode liest ab der öffnenden Klammer genau ein Objekt und ignoriert Text
+    danach (auch weitere Klammern). Scheitert das, wird ab der nächsten "{" versucht.
+
+    Returns:
+        Das Objekt oder None, wenn der Text keine "{" enthält
+
+    Raises:
+        json.JSONDecodeError: wenn ab keiner "{" ein gültiges Objekt beginnt
+    """
+    start = text.find('{')
+    if start == -1:
+        return None
+
+    error = None
+    while start != -1:
+        try:
+            obj, _ = _JSON_DECODER.raw_decode(text, start)
+            return obj
+        except json.JSONDecodeError as e:
+            error = error or e
+            start = text.find('{', start + 1)
+    raise error
+
+
+def extract_date(content: str) -> Optional[str]:
+    """
+    Sucht das erste gültige Datum im (gekürzten) Dokumententext
+
+    Returns:
+        Datum im Format YYYY-MM-DD oder None
+    """
+    for match in _DATE_RE.finditer(truncate_content(content)):
+        if match.group('iso_y'):
+            year, month, day = match.group('iso_y', 'iso_m', 'iso_d')
+        elif match.group('de_y'):
+            year, month, day = match.group('de_y', 'de_m', 'de_d')
+        else:
+            year, day = match.group('name_y', 'name_d')
+            month = _DATE_MONTHS[match.group('name_m').lower()]
+        try:
+            return date(int(year), int(month), int(day)).isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+class OllamaClassifier:
+    def __init__(self, base_url: str, model: str, cache: Optional["SemanticClassificationCache"] = None,
+                 response_cache_size: int = 256):
+        """
+        Args:
+            base_url: URL des Ollama Servers
+            model: LLM Modell
+            cache: Optionaler Klassifizierungs-Cache (überspringt das LLM bei ähnlichen Dokumenten)
+            response_cache_size: Maximale Anzahl gecachter LLM-Antworten für identische Prompts
+        """
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.cache = cache
+
+        # Dokumente ohne Begriff aus DOCUMENT_TYPES/CORRESPONDENTS/PERSON_TAGS nicht ans LLM schicken
+        self.prefilter = os.getenv('USE_CLASSIFICATION_PREFILTER', 'false').lower() == 'true'
+
+        # Feste Felder jedes /api/generate-Requests (siehe _post_generate)
+        self._base_payload = {'model': model, 'stream': False, 'keep_alive': KEEP_ALIVE}
+
+        # Session hält die Verbindung zu Ollama offen (Keep-Alive) statt pro Aufruf neu zu verbinden.
+        # Der Pool ist groß genug für parallele Aufrufe (classify_documents, Web-Threads);
+        # beim Standard von 10 würden darüber hinausgehende Verbindungen verworfen
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        # Exakter Prompt-Cache (LRU): identischer Prompt -> gespeicherte Antwort statt Inferenz
+        self.response_cache_size = response_cache_size
+        self._responses: "OrderedDict[str, str]" = OrderedDict()
+        self._responses_lock = threading.Lock()
+
+    def _response_key(self, prompt: str, temperature: float) -> Optional[str]:
+        """Cache-Key für einen Prompt oder None, wenn der Aufruf nicht gecacht werden soll"""
+        if self.response_cache_size <= 0 or temperature > CACHEABLE_MAX_TEMPERATURE:
+            return None
+        return hashlib.blake2b(
+            f"{self.model}\0{temperature}\0{prompt}".encode('utf-8'), digest_size=16
+        ).hexdigest()
+
+    def _cached_response(self, key: Optional[str]) -> Optional[str]:
+        """Gibt eine gecachte Antwort zurück (und markiert sie als zuletzt genutzt)"""
+        if key is None:
+            return None
+        with self._responses_lock:
+            response = self._responses.get(key)
+            if response is not None:
+                self._responses.move_to_end(key)
+                logger.debug("LLM-Antwort aus Prompt-Cache")
+            return response
+
+    def _store_response(self, key: Optional[str], response: Optional[str]):
+        """Speichert eine Antwort im Prompt-Cache (leere Antworten/Fehler werden nicht gecacht)"""
+        if key is None or not response:
+            return
+        with self._responses_lock:
+            self._responses[key] = response
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.response_cache_size:
+                self._responses.popitem(last=False)
+
+    def _post_generate(self, prompt: str, temperature: float, json_format: bool = False) -> str:
+        """
+        Schickt einen Prompt an /api/generate und gibt die Antwort zurück
+
+        Die festen Felder stehen vorbereitet in self._base_payload; serialisiert
+        wird direkt (orjson, falls installiert) statt über requests' json=.
+        json_format=True lässt Ollama nur gültiges JSON erzeugen (format: json).
+        Wirft RequestException bei Fehlern.
+        """
+        payload = {**self._base_payload, 'prompt': prompt, 'options': {'temperature': temperature}}
+        if json_format:
+            payload['format'] = 'json'
+        response = self._session.post(
+            f'{self.base_url}/api/generate',
+            data=dumps(payload),
+            headers={'Content-Type': 'application/json'},
+            timeout=180
+        )
+        response.raise_for_status()
+        return response_json(response).get('response', '').strip()
+
+    def _call_ollama(self, prompt: str) -> Optional[str]:
+        """
+        Ruft Ollama API auf
+        """
+        key = self._response_key(prompt, CLASSIFICATION_TEMPERATURE)
+        cached = self._cached_response(key)
+        if cached is not None:
+            return cached
+
+        try:
+            result = self._post_generate(prompt, CLASSIFICATION_TEMPERATURE)
+            self._store_response(key, result)
+            return result
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Fehler beim Aufruf von Ollama: {e}")
+            return None
+
+    def _looks_classifiable(self, content: str) -> bool:
+        """
+        Schneller Vorfilter vor dem LLM-Aufruf
+
+        Leere bzw. fast leere Texte werden immer übersprungen. Mit aktivem Vorfilter
+        muss außerdem mindestens ein bekannter Dokumenttyp, Korrespondent oder
+        Personen-Tag im (gekürzten) Text vorkommen, den das LLM zu sehen bekäme.
+        """
+        if len(''.join(content.split())) < MIN_CONTENT_CHARS:
+            logger.info("Dokument übersprungen: kaum Text vorhanden")
+            return False
+
+        if self.prefilter and not _VOCABULARY_RE.search(truncate_content(content)):
+            logger.info("Dokument übersprungen: kein bekannter Dokumenttyp, Korrespondent oder Name im Text")
+            return False
+
+        return True
+
+    def classify_document(self, content: str) -> Dict:
+        """
+        Klassifiziert ein Dokument und extrahiert Metadaten
+        """
+        if not self._looks_classifiable(content):
+            return {}
+
+        if self.cache:
+            cached = self.cache.lookup(content)
+            if cached is not None:
+                # Ähnliche Dokumente liefern kein Datum (z.B. Kontoauszug des Vormonats):
+                # das Datum kommt dann aus diesem Dokument
+                if 'date' not in cached:
+                    cached['date'] = extract_date(content)
+                return cached
+
+        result = self._classify_with_llm(content)
+
+        if self.cache and result:
+            self.cache.store(content, result)
+        return result
+
+    def classify_documents(self, contents: List[str], max_workers: int = 4) -> List[Dict]:
+        """
+        Klassifiziert mehrere Dokumente parallel
+
+        Ollama bearbeitet bis zu OLLAMA_NUM_PARALLEL Anfragen gleichzeitig; max_workers
+        sollte diesen Wert nicht überschreiten. Identische Texte werden nur einmal klassifiziert.
+
+        Args:
+            contents: Dokumententexte
+            max_workers: Anzahl gleichzeitiger Anfragen
+
+        Returns:
+            Klassifizierungen in derselben Reihenfolge ({} bei Fehler)
+        """
+        def classify(content: str) -> Dict:
+            try:
+                return self.classify_document(content)
+            except Exception as e:
+                logger.error(f"Fehler bei der Klassifizierung: {e}")
+                return {}
+
+        unique = list(dict.fromkeys(contents))
+        if len(unique) <= 1 or max_workers <= 1:
+            results = [classify(content) for content in unique]
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(unique))) as executor:
+                results = list(executor.map(classify, unique))
+
+        by_content = dict(zip(unique, results))
+        # Kopien, damit Aufrufer ein Ergebnis ändern können, ohne die Duplikate mitzuändern
+        return [dict(by_content[content]) for content in contents]
+
+    def _classify_with_llm(self, content: str) -> Dict:
+        """
+        Klassifiziert ein Dokument per LLM-Aufruf
+        """
+        # Dokument am Ende: der gleichbleibende Anfang kann von Ollama wiederverwendet werden
+        prompt = f"""{_CLASSIFICATION_PROMPT_PREFIX}DOKUMENTENTEXT:
+{truncate_content(content)}
+
 Antworte NUR mit dem JSON-Objekt.
 """
 
@@ -88,72 +366,107 @@ Antworte NUR mit dem JSON-Objekt.
             logger.error("Keine Antwort von Ollama erhalten")
             return {}
 
-        # Versuche JSON zu extrahieren
+        # Versuche JSON zu extrahieren (Text drum herum wird ignoriert)
         try:
-            # Finde JSON im Response (falls Text drum herum ist)
-            start_idx = response.find('{')
-            end_idx = response.rfind('}') + 1
-
-            if start_idx != -1:
-                if end_idx > start_idx:
-                    json_str = response[start_idx:end_idx]
-                else:
-                    # Keine schließende Klammer gefunden - versuche zu reparieren
-                    json_str = response[start_idx:] + '\n}'
-                    logger.warning("Unvollständiges JSON - versuche Reparatur")
-
-                result = json.loads(json_str)
-                logger.info(f"Klassifizierung erfolgreich: {result}")
-                return result
-            else:
+            result = extract_json(response)
+            if result is None:
                 logger.error(f"Kein JSON im Response gefunden: {response}")
                 return {}
 
+            logger.info(f"Klassifizierung erfolgreich: {result}")
+            return result
+
         except json.JSONDecodeError as e:
             logger.error(f"Fehler beim Parsen der Ollama-Antwort: {e}")
             logger.error(f"Response: {response}")
 
-            # Letzter Versuch: Versuche nochmal mit zusätzlichen Reparaturen
-            try:
-                # Entferne Trailing Kommas und füge } hinzu
-                json_str = response[start_idx:]
-                json_str = json_str.rstrip().rstrip(',') + '\n}'
-                result = json.loads(json_str)
-                logger.warning(f"JSON mit Reparatur erfolgreich geparst: {result}")
-                return result
-            except:
-                return {}
+            # Letzter Versuch: abgeschnittenes JSON reparieren
+            # (fehlende schließende Klammer, ggf. mit Trailing Komma)
+            json_str = response[response.find('{'):].rstrip()
+            for repaired in (json_str + '\n}', json_str.rstrip(',') + '\n}'):
+                try:
+                    result, _ = _JSON_DECODER.raw_decode(repaired)
+                    logger.warning(f"JSON mit Reparatur erfolgreich geparst: {result}")
+                    return result
+                except json.JSONDecodeError:
+                    continue
+            return {}
 
-    def generate(self, prompt: str, temperature: float = 0.7) -> str:
+    def generate(self, prompt: str, temperature: float = 0.7, json_format: bool = False) -> str:
         """
         Generiert Text basierend auf einem Prompt (für Q&A/RAG)
 
         Args:
             prompt: Der Prompt für die Generierung
             temperature: Temperatur für die Generierung (0.0-1.0)
+            json_format: Antwort als gültiges JSON erzwingen (Ollama format: json)
 
         Returns:
             Generierter Text
         """
+        key = self._response_key(prompt, temperature)
+        cached = self._cached_response(key)
+        if cached is not None:
+            return cached
+
         try:
-            response = requests.post(
-                f'{self.base_url}/api/generate',
-                json={
-                    'model': self.model,
-                    'prompt': prompt,
-                    'stream': False,
-                    'options': {
-                        'temperature': temperature,
-                    }
-                },
-                timeout=180
-            )
-            response.raise_for_status()
-            return response.json().get('response', '').strip()
+            result = self._post_generate(prompt, temperature, json_format)
+            self._store_response(key, result)
+            return result
         except requests.exceptions.RequestException as e:
             logger.error(f"Fehler beim Generieren: {e}")
             return ""
 
+    def generate_stream(self, prompt: str, temperature: float = 0.7) -> Iterator[str]:
+        """
+        Generiert Text als Stream (Ollama stream=True) und liefert die Teilstücke sobald sie ankommen
+
+        Wird der Generator vorzeitig geschlossen, wird auch die Verbindung geschlossen
+        und Ollama bricht die Generierung ab.
+
+        Args:
+            prompt: Der Prompt für die Generierung
+            temperature: Temperatur für die Generierung (0.0-1.0)
+
+        Yields:
+            Text-Teilstücke der Antwort (nichts bei Fehler)
+        """
+        key = self._response_key(prompt, temperature)
+        cached = self._cached_response(key)
+        if cached is not None:
+            yield cached
+            return
+
+        payload = {
+            **self._base_payload, 'stream': True, 'prompt': prompt, 'options': {'temperature': temperature}
+        }
+        parts = []
+        try:
+            with self._session.post(
+                f'{self.base_url}/api/generate',
+                data=dumps(payload),
+                headers={'Content-Type': 'application/json'},
+                timeout=180,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                # Ollama schickt eine JSON-Zeile pro Teilstück, die letzte mit done=true
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = loads(line)
+                    text = chunk.get('response', '')
+                    if text:
+                        parts.append(text)
+                        yield text
+                    if chunk.get('done'):
+                        break
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Fehler beim Generieren (Stream): {e}")
+            return
+
+        self._store_response(key, ''.join(parts).strip())
+
     def validate_classification(self, classification: Dict) -> Dict:
         """
         Validiert und bereinigt die Klassifizierung
@@ -162,7 +475,7 @@ Antworte NUR mit dem JSON-Objekt.
 
         # Dokumententyp validieren
         doc_type = classification.get('document_type')
-        if doc_type and doc_type in DOCUMENT_TYPES:
+        if isinstance(doc_type, str) and doc_type in _DOCUMENT_TYPES:
             validated['document_type'] = doc_type
         else:
             logger.warning(f"Ungültiger Dokumententyp: {doc_type}")
@@ -171,16 +484,16 @@ Antworte NUR mit dem JSON-Objekt.
         person_tags = classification.get('person_tags', [])
         if isinstance(person_tags, list):
             validated['person_tags'] = [
-                tag for tag in person_tags if tag in PERSON_TAGS
+                tag for tag in person_tags if isinstance(tag, str) and tag in _PERSON_TAGS
             ]
         elif isinstance(person_tags, str):
             # Falls als String zurückgegeben
-            if person_tags in PERSON_TAGS:
+            if person_tags in _PERSON_TAGS:
                 validated['person_tags'] = [person_tags]
 
         # Korrespondent validieren
         correspondent = classification.get('correspondent')
-        if correspondent and correspondent in CORRESPONDENTS:
+        if isinstance(correspondent, str) and correspondent in _CORRESPONDENTS:
             validated['correspondent'] = correspondent
         else:
             if correspondent:
@@ -1,34 +1,87 @@
 """
 Paperless-NGX API Client
 """
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from typing import List, Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+from typing import Iterator, List, Dict, Optional, Tuple
 import logging
+from json_utils import response_json
 
 logger = logging.getLogger(__name__)
 
+# Felder für Dokumentlisten: ohne 'content' (OCR-Text) sind die Antworten um ein Vielfaches kleiner
+LIST_FIELDS = ['id', 'title', 'tags', 'correspondent', 'document_type', 'created', 'added']
+
+# Ab dieser Größe wird bei unkomprimierten Antworten ein Hinweis geloggt
+UNCOMPRESSED_WARN_BYTES = 1024 * 1024
+
+# Maximale Seitengröße für Seiten mit OCR-Inhalt, damit eine Seite nicht zig MB JSON ausmacht
+CONTENT_PAGE_SIZE = 100
+
+
+def _fields_param(fields: Optional[List[str]]) -> Dict[str, str]:
+    """Query-Parameter für Paperless' Feldauswahl (leer = alle Felder)"""
+    return {'fields': ','.join(fields)} if fields else {}
+
 
 class PaperlessClient:
-    def __init__(self, base_url: str, token: str):
+    def __init__(self, base_url: str, token: str, lookup_ttl: float = 60.0):
         self.base_url = base_url.rstrip('/')
         self.token = token
+        # Größere Seiten = weniger Round-Trips; Paperless begrenzt die Seitengröße serverseitig
+        self.page_size = max(1, int(os.getenv('PAPERLESS_PAGE_SIZE', '500')))
         self.headers = {
             'Authorization': f'Token {token}',
             'Content-Type': 'application/json'
         }
 
-    def get_documents_by_tag(self, tag_name: str) -> List[Dict]:
+        # Eine Session für alle Requests: Keep-Alive statt neuer TCP/TLS-Verbindung pro Aufruf.
+        # Retry greift nur bei idempotenten Methoden (GET, PATCH/POST werden nicht wiederholt)
+        self._session = requests.Session()
+        self._session.headers.update(self.headers)
+        # Komprimierte Antworten anfordern; br/zstd nur, wenn ein Decoder installiert ist
+        self._session.headers['Accept-Encoding'] = make_headers(accept_encoding=True)['accept-encoding']
+        self._compression_checked = False
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=64,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        )
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+        # ID -> Name Caches für Tags, Korrespondenten und Dokumenttypen (siehe _warm_caches)
+        self._tag_names: Dict[int, str] = {}
+        self._correspondent_names: Dict[int, str] = {}
+        self._document_type_names: Dict[int, str] = {}
+        self._caches_warm = False
+        self._cache_lock = threading.Lock()
+
+        # Name -> ID Tabellen aus get_all_* (Pfad -> (Zeitpunkt, Tabelle)), gültig für lookup_ttl Sekunden
+        self.lookup_ttl = lookup_ttl
+        self._lookups: Dict[str, Tuple[float, Dict[str, int]]] = {}
+
+    def get_documents_by_tag(self, tag_name: str, fields: Optional[List[str]] = None) -> List[Dict]:
         """
         Holt alle Dokumente mit einem bestimmten Tag (mit Pagination)
+
+        Args:
+            tag_name: Name des Tags
+            fields: Nur diese Felder abrufen (z.B. LIST_FIELDS), None = alle
         """
         try:
             # Erst Tag-ID finden
-            tags_response = requests.get(
-                f'{self.base_url}/api/tags/',
-                headers=self.headers
+            tags_response = self._session.get(
+                f'{self.base_url}/api/tags/'
             )
             tags_response.raise_for_status()
-            tags = tags_response.json()['results']
+            tags = response_json(tags_response)['results']
 
             tag_id = None
             for tag in tags:
@@ -41,32 +94,7 @@ class PaperlessClient:
                 return []
 
             # Dokumente mit diesem Tag holen (MIT PAGINATION!)
-            all_documents = []
-            page = 1
-            page_size = 100
-
-            while True:
-                params = {
-                    'tags__id__in': tag_id,
-                    'page': page,
-                    'page_size': page_size
-                }
-
-                docs_response = requests.get(
-                    f'{self.base_url}/api/documents/',
-                    headers=self.headers,
-                    params=params
-                )
-                docs_response.raise_for_status()
-                data = docs_response.json()
-
-                all_documents.extend(data['results'])
-
-                # Prüfe ob weitere Seiten vorhanden sind
-                if not data.get('next'):
-                    break
-
-                page += 1
+            all_documents = self._fetch_all_pages({'tags__id__in': tag_id, **_fields_param(fields)})
 
             logger.info(f"{len(all_documents)} Dokumente mit Tag '{tag_name}' gefunden")
             return all_documents
@@ -80,12 +108,14 @@ class PaperlessClient:
         Holt ein einzelnes Dokument mit allen Metadaten
         """
         try:
-            response = requests.get(
-                f'{self.base_url}/api/documents/{document_id}/',
-                headers=self.headers
+            response = self._session.get(
+                f'{self.base_url}/api/documents/{document_id}/'
             )
             response.raise_for_status()
-            doc = response.json()
+            doc = response_json(response)
+
+            self._warm_caches()
+            self._prefetch_names(doc)
 
             # Füge Namen statt nur IDs hinzu für bessere Lesbarkeit
             if doc.get('correspondent'):
@@ -105,38 +135,53 @@ class PaperlessClient:
         Holt den OCR-Text eines Dokuments
         """
         try:
-            response = requests.get(
-                f'{self.base_url}/api/documents/{document_id}/',
-                headers=self.headers
+            response = self._session.get(
+                f'{self.base_url}/api/documents/{document_id}/'
             )
             response.raise_for_status()
-            return response.json().get('content', '')
+            return response_json(response).get('content', '')
         except requests.exceptions.RequestException as e:
             logger.error(f"Fehler beim Abrufen des Dokument-Inhalts: {e}")
             return None
 
-    def get_all_documents(self, page_size: int = 100) -> List[Dict]:
+    def iter_all_documents(self, page_size: Optional[int] = None,
+                           fields: Optional[List[str]] = None) -> Iterator[Dict]:
         """
-        Holt alle Dokumente von Paperless (mit Pagination)
+        Liefert alle Dokumente von Paperless seitenweise (Generator)
+
+        Es liegt immer nur eine Seite im Speicher; die Verarbeitung kann beginnen,
+        bevor die letzte Seite geladen ist. Bei einem Fehler wird die RequestException
+        nach den bereits gelieferten Dokumenten weitergereicht, damit der Aufrufer eine
+        unvollständige Liste erkennt.
+
+        Args:
+            page_size: Dokumente pro Seite (Standard: PAPERLESS_PAGE_SIZE)
+            fields: Nur diese Felder abrufen, None = alle
         """
-        all_documents = []
+        page_size = page_size or self.page_size
+        if fields is None or 'content' in fields:
+            # Eine Seite wird komplett geparst - mit OCR-Texten die Seitengröße begrenzen
+            page_size = min(page_size, CONTENT_PAGE_SIZE)
         page = 1
+        count = 0
 
         try:
             while True:
-                response = requests.get(
+                response = self._session.get(
                     f'{self.base_url}/api/documents/',
-                    headers=self.headers,
                     params={
                         'page': page,
-                        'page_size': page_size
+                        'page_size': page_size,
+                        **_fields_param(fields)
                     }
                 )
                 response.raise_for_status()
-                data = response.json()
+                self._check_compression(response)
+                data = response_json(response)
 
                 documents = data.get('results', [])
-                all_documents.extend(documents)
+                count += len(documents)
+                yield from documents
 
                 # Prüfe ob es weitere Seiten gibt
                 if not data.get('next'):
@@ -144,109 +189,243 @@ class PaperlessClient:
 
                 page += 1
 
-            logger.info(f"{len(all_documents)} Dokumente insgesamt gefunden")
-            return all_documents
+            logger.info(f"{count} Dokumente insgesamt gefunden")
 
         except requests.exceptions.RequestException as e:
             logger.error(f"Fehler beim Abrufen aller Dokumente: {e}")
-            return all_documents  # Gib zurück was wir haben
+            raise
 
-    def _get_tag_name(self, tag_id: int) -> str:
-        """Hilfsmethode: Holt Tag-Namen von ID"""
+    def get_all_documents(self, page_size: Optional[int] = None,
+                          fields: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Holt alle Dokumente von Paperless (mit Pagination)
+
+        Args:
+            page_size: Dokumente pro Seite (Standard: PAPERLESS_PAGE_SIZE)
+            fields: Nur diese Felder abrufen (z.B. LIST_FIELDS), None = alle
+        """
         try:
-            response = requests.get(
-                f'{self.base_url}/api/tags/{tag_id}/',
-                headers=self.headers
+            documents = self._fetch_all_pages(_fields_param(fields), page_size=page_size)
+            logger.info(f"{len(documents)} Dokumente insgesamt gefunden")
+            return documents
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Fehler beim Abrufen aller Dokumente: {e}")
+            return []
+
+    def _fetch_all_pages(self, params: Dict, page_size: Optional[int] = None, max_workers: int = 8) -> List[Dict]:
+        """
+        Hilfsmethode: Holt alle Seiten von /api/documents/ und gibt die Ergebnisse in Seitenreihenfolge zurück
+
+        Die erste Seite liefert die Gesamtanzahl, die restlichen Seiten werden
+        parallel geladen statt nacheinander je einen Round-Trip abzuwarten.
+        Wirft RequestException, wenn eine Seite nicht geladen werden kann.
+        """
+        page_size = page_size or self.page_size
+        # Feste Sortierung nach ID, damit sich parallel geladene Seiten nicht überschneiden
+        base_params = {'ordering': 'id', **params, 'page_size': page_size}
+
+        def fetch_page(page: int) -> Dict:
+            response = self._session.get(
+                f'{self.base_url}/api/documents/',
+                params={**base_params, 'page': page}
             )
             response.raise_for_status()
-            return response.json().get('name', '')
-        except:
-            return ''
+            self._check_compression(response)
+            return response_json(response)
+
+        first = fetch_page(1)
+        documents = list(first.get('results', []))
+        if not first.get('next'):
+            return documents
+
+        # Kappt der Server die Seitengröße, bestimmt die tatsächliche Größe der ersten Seite die Seitenanzahl
+        effective_page_size = len(documents) or page_size
+        total_pages = -(-first.get('count', 0) // effective_page_size)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for data in executor.map(fetch_page, range(2, total_pages + 1)):
+                documents.extend(data.get('results', []))
+
+        return documents
+
+    def _check_compression(self, response: requests.Response):
+        """Loggt einmalig einen Hinweis, wenn Paperless große Listen unkomprimiert liefert"""
+        if self._compression_checked:
+            return
+        self._compression_checked = True
+
+        if 'Content-Encoding' not in response.headers and len(response.content) > UNCOMPRESSED_WARN_BYTES:
+            logger.info(
+                f"Paperless liefert Dokumentlisten unkomprimiert ({len(response.content) // 1024} KB). "
+                "gzip im Reverse Proxy aktivieren (z.B. nginx: gzip on; gzip_types application/json)"
+            )
 
-    def _get_correspondent_name(self, correspondent_id: int) -> str:
-        """Hilfsmethode: Holt Korrespondent-Namen von ID"""
+    def get_document_count(self) -> int:
+        """
+        Gibt die Anzahl aller Dokumente zurück (eine Anfrage mit page_size=1)
+        """
         try:
-            response = requests.get(
-                f'{self.base_url}/api/correspondents/{correspondent_id}/',
-                headers=self.headers
+            response = self._session.get(
+                f'{self.base_url}/api/documents/',
+                params={'page_size': 1}
             )
             response.raise_for_status()
-            return response.json().get('name', '')
-        except:
-            return ''
+            return response_json(response).get('count', 0)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Fehler beim Abrufen der Dokumentanzahl: {e}")
+            return 0
+
+    def _fetch_names(self, path: str) -> Dict[int, str]:
+        """Hilfsmethode: Holt alle Objekte eines Endpoints (mit Pagination) als ID -> Name"""
+        names = {}
+        url = f'{self.base_url}{path}'
+        params = {'page_size': 1000}
+
+        while url:
+            response = self._session.get(url, params=params)
+            response.raise_for_status()
+            data = response_json(response)
+            names.update({obj['id']: obj.get('name', '') for obj in data.get('results', [])})
+            # 'next' enthält bereits alle Query-Parameter
+            url = data.get('next')
+            params = None
+
+        return names
+
+    def _warm_caches(self):
+        """
+        Lädt alle Tag-, Korrespondenten- und Dokumenttyp-Namen einmalig
+
+        Danach sind die Namens-Lookups in get_document Dictionary-Zugriffe statt
+        je ein HTTP-Request pro ID. Unbekannte IDs (z.B. neu angelegt) werden
+        weiterhin einzeln nachgeladen.
+        """
+        if self._caches_warm:
+            return
+
+        with self._cache_lock:
+            if self._caches_warm:
+                return
+            try:
+                self._tag_names.update(self._fetch_names('/api/tags/'))
+                self._correspondent_names.update(self._fetch_names('/api/correspondents/'))
+                self._document_type_names.update(self._fetch_names('/api/document_types/'))
+                logger.debug(
+                    f"Namens-Caches geladen: {len(self._tag_names)} Tags, "
+                    f"{len(self._correspondent_names)} Korrespondenten, "
+                    f"{len(self._document_type_names)} Dokumenttypen"
+                )
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Namens-Caches konnten nicht geladen werden: {e}")
+            # Auch bei Fehler nicht erneut versuchen, die Einzel-Lookups funktionieren weiterhin
+            self._caches_warm = True
+
+    def _get_name(self, cache: Dict[int, str], path: str, object_id: int) -> str:
+        """Hilfsmethode: Name aus dem Cache oder per Einzel-Request (Ergebnis wird gecacht)"""
+        if object_id in cache:
+            return cache[object_id]
 
-    def _get_document_type_name(self, doc_type_id: int) -> str:
-        """Hilfsmethode: Holt Dokumenttyp-Namen von ID"""
         try:
-            response = requests.get(
-                f'{self.base_url}/api/document_types/{doc_type_id}/',
-                headers=self.headers
+            response = self._session.get(
+                f'{self.base_url}{path}{object_id}/'
             )
             response.raise_for_status()
-            return response.json().get('name', '')
+            name = response_json(response).get('name', '')
         except:
             return ''
 
-    def get_all_tags(self) -> Dict[str, int]:
+        cache[object_id] = name
+        return name
+
+    def _prefetch_names(self, doc: Dict):
         """
-        Holt alle verfügbaren Tags (Name -> ID)
+        Lädt fehlende Namen eines Dokuments parallel in die Caches
+
+        Die Lookups warten nur auf das Netzwerk; parallel dauert das Auflösen etwa
+        einen Round-Trip statt einen pro ID. Sind alle Namen gecacht, passiert nichts.
+        """
+        lookups = []
+        if doc.get('correspondent'):
+            lookups.append((self._correspondent_names, '/api/correspondents/', doc['correspondent']))
+        if doc.get('document_type'):
+            lookups.append((self._document_type_names, '/api/document_types/', doc['document_type']))
+        for tag_id in doc.get('tags') or []:
+            lookups.append((self._tag_names, '/api/tags/', tag_id))
+
+        missing = [lookup for lookup in lookups if lookup[2] not in lookup[0]]
+        if len(missing) < 2:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(16, len(missing))) as executor:
+            list(executor.map(lambda lookup: self._get_name(*lookup), missing))
+
+    def _get_tag_name(self, tag_id: int) -> str:
+        """Hilfsmethode: Holt Tag-Namen von ID"""
+        return self._get_name(self._tag_names, '/api/tags/', tag_id)
+
+    def _get_correspondent_name(self, correspondent_id: int) -> str:
+        """Hilfsmethode: Holt Korrespondent-Namen von ID"""
+        return self._get_name(self._correspondent_names, '/api/correspondents/', correspondent_id)
+
+    def _get_document_type_name(self, doc_type_id: int) -> str:
+        """Hilfsmethode: Holt Dokumenttyp-Namen von ID"""
+        return self._get_name(self._document_type_names, '/api/document_types/', doc_type_id)
+
+    def _get_lookup(self, path: str, label: str) -> Dict[str, int]:
+        """
+        Name -> ID Tabelle eines Endpunkts, für lookup_ttl Sekunden gecacht
+
+        Fehlgeschlagene Abrufe werden nicht gecacht. Zurückgegeben wird eine Kopie,
+        damit Aufrufer den Cache nicht verändern.
         """
+        entry = self._lookups.get(path)
+        if entry is not None and time.monotonic() - entry[0] < self.lookup_ttl:
+            return dict(entry[1])
+
         try:
-            response = requests.get(
-                f'{self.base_url}/api/tags/',
-                headers=self.headers
+            response = self._session.get(
+                f'{self.base_url}{path}'
             )
             response.raise_for_status()
-            tags = response.json()['results']
-            return {tag['name']: tag['id'] for tag in tags}
+            objects = response_json(response)['results']
         except requests.exceptions.RequestException as e:
-            logger.error(f"Fehler beim Abrufen der Tags: {e}")
+            logger.error(f"Fehler beim Abrufen der {label}: {e}")
             return {}
 
+        lookup = {obj['name']: obj['id'] for obj in objects}
+        self._lookups[path] = (time.monotonic(), lookup)
+        return dict(lookup)
+
+    def get_all_tags(self) -> Dict[str, int]:
+        """
+        Holt alle verfügbaren Tags (Name -> ID)
+        """
+        return self._get_lookup('/api/tags/', 'Tags')
+
     def get_all_document_types(self) -> Dict[str, int]:
         """
         Holt alle verfügbaren Dokumententypen (Name -> ID)
         """
-        try:
-            response = requests.get(
-                f'{self.base_url}/api/document_types/',
-                headers=self.headers
-            )
-            response.raise_for_status()
-            doc_types = response.json()['results']
-            return {dt['name']: dt['id'] for dt in doc_types}
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Fehler beim Abrufen der Dokumententypen: {e}")
-            return {}
+        return self._get_lookup('/api/document_types/', 'Dokumententypen')
 
     def get_all_correspondents(self) -> Dict[str, int]:
         """
         Holt alle verfügbaren Korrespondenten (Name -> ID)
         """
-        try:
-            response = requests.get(
-                f'{self.base_url}/api/correspondents/',
-                headers=self.headers
-            )
-            response.raise_for_status()
-            correspondents = response.json()['results']
-            return {c['name']: c['id'] for c in correspondents}
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Fehler beim Abrufen der Korrespondenten: {e}")
-            return {}
+        return self._get_lookup('/api/correspondents/', 'Korrespondenten')
 
     def create_tag(self, name: str) -> Optional[int]:
         """
         Erstellt einen neuen Tag
         """
         try:
-            response = requests.post(
+            response = self._session.post(
                 f'{self.base_url}/api/tags/',
-                headers=self.headers,
                 json={'name': name}
             )
             response.raise_for_status()
-            tag_id = response.json()['id']
+            tag_id = response_json(response)['id']
+            self._tag_names[tag_id] = name
+            self._lookups.pop('/api/tags/', None)
             logger.info(f"Tag '{name}' erstellt mit ID {tag_id}")
             return tag_id
         except requests.exceptions.RequestException as e:
@@ -258,13 +437,14 @@ class PaperlessClient:
         Erstellt einen neuen Dokumententyp
         """
         try:
-            response = requests.post(
+            response = self._session.post(
                 f'{self.base_url}/api/document_types/',
-                headers=self.headers,
                 json={'name': name}
             )
             response.raise_for_status()
-            dt_id = response.json()['id']
+            dt_id = response_json(response)['id']
+            self._document_type_names[dt_id] = name
+            self._lookups.pop('/api/document_types/', None)
             logger.info(f"Dokumententyp '{name}' erstellt mit ID {dt_id}")
             return dt_id
         except requests.exceptions.RequestException as e:
@@ -276,13 +456,14 @@ class PaperlessClient:
         Erstellt einen neuen Korrespondenten
         """
         try:
-            response = requests.post(
+            response = self._session.post(
                 f'{self.base_url}/api/correspondents/',
-                headers=self.headers,
                 json={'name': name}
             )
             response.raise_for_status()
-            corr_id = response.json()['id']
+            corr_id = response_json(response)['id']
+            self._correspondent_names[corr_id] = name
+            self._lookups.pop('/api/correspondents/', None)
             logger.info(f"Korrespondent '{name}' erstellt mit ID {corr_id}")
             return corr_id
         except requests.exceptions.RequestException as e:
@@ -294,27 +475,56 @@ class PaperlessClient:
         Aktualisiert ein Dokument mit neuen Metadaten
         """
         try:
-            # Erst aktuelles Dokument holen
-            response = requests.get(
+            # PATCH ändert nur die übergebenen Felder, das aktuelle Dokument wird nicht benötigt
+            response = self._session.patch(
                 f'{self.base_url}/api/documents/{document_id}/',
-                headers=self.headers
+                json=updates
             )
             response.raise_for_status()
-            current_doc = response.json()
+            logger.info(f"Dokument {document_id} erfolgreich aktualisiert")
+            return True
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Fehler beim Aktualisieren des Dokuments {document_id}: {e}")
+            return False
 
-            # Updates anwenden
-            current_doc.update(updates)
+    def bulk_update(self, document_ids: List[int], method: str, parameters: Dict) -> bool:
+        """
+        Führt eine Operation für mehrere Dokumente in einem Request aus (/api/documents/bulk_edit/)
 
-            # Dokument aktualisieren
-            response = requests.patch(
-                f'{self.base_url}/api/documents/{document_id}/',
-                headers=self.headers,
-                json=updates
+        Args:
+            document_ids: IDs der Dokumente
+            method: Paperless bulk_edit-Methode (z.B. 'set_correspondent', 'add_tag')
+            parameters: Parameter der Methode (z.B. {'correspondent': 5})
+        """
+        if not document_ids:
+            return True
+
+        try:
+            response = self._session.post(
+                f'{self.base_url}/api/documents/bulk_edit/',
+                json={
+                    'documents': list(document_ids),
+                    'method': method,
+                    'parameters': parameters
+                }
             )
             response.raise_for_status()
-            logger.info(f"Dokument {document_id} erfolgreich aktualisiert")
+            logger.info(f"Bulk-Update '{method}' für {len(document_ids)} Dokumente erfolgreich")
             return True
 
         except requests.exceptions.RequestException as e:
-            logger.error(f"Fehler beim Aktualisieren des Dokuments {document_id}: {e}")
+            logger.error(f"Fehler beim Bulk-Update '{method}': {e}")
             return False
+
+    def bulk_set_correspondent(self, document_ids: List[int], correspondent_id: Optional[int]) -> bool:
+        """Setzt den Korrespondenten mehrerer Dokumente (None entfernt ihn)"""
+        return self.bulk_update(document_ids, 'set_correspondent', {'correspondent': correspondent_id})
+
+    def bulk_set_document_type(self, document_ids: List[int], document_type_id: Optional[int]) -> bool:
+        """Setzt den Dokumenttyp mehrerer Dokumente (None entfernt ihn)"""
+        return self.bulk_update(document_ids, 'set_document_type', {'document_type': document_type_id})
+
+    def bulk_add_tag(self, document_ids: List[int], tag_id: int) -> bool:
+        """Fügt mehreren Dokumenten einen Tag hinzu"""
+        return self.bulk_update(document_ids, 'add_tag', {'tag': tag_id})
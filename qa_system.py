@@ -4,12 +4,20 @@ Beantwortet Fragen basierend auf indexierten Dokumenten
 """
 import os
 import re
+import time
+import hashlib
+import heapq
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import numpy as np
 from embedding_service import EmbeddingService
 from vector_store import VectorStore
 from ollama_classifier import OllamaClassifier
 from metadata_extractor import MetadataExtractor
+from llm_cache import LLMResultCache
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +36,232 @@ SYNONYM_MAP = {
     'versicherung': ['Versicherung', 'Insurance', 'Police'],
 }
 
+# Alle Schlüssel in einem Muster: ein Durchlauf über die Query statt einer Suche pro Schlüssel.
+# Wie bisher Teilstring-Treffer (ohne Wortgrenzen), damit z.B. "Stromrechnung" 'rechnung' trifft
+_SYNONYM_RE = re.compile(
+    '|'.join(re.escape(key) for key in sorted(SYNONYM_MAP, key=len, reverse=True)),
+    re.IGNORECASE
+)
+# Synonyme pro Schlüssel bereits als fertiger String
+_SYNONYM_TEXT = {key: ' '.join(synonyms) for key, synonyms in SYNONYM_MAP.items()}
+
+# Satzgrenzen für die Auswahl relevanter Sätze im RAG-Kontext
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+
+# Nummerierung am Zeilenanfang von LLM-Varianten ("1. ...", "2) ...")
+_NUMBERING_RE = re.compile(r'^\d+[\.\)]\s*')
+
+# Konfidenz-Punkte nach Distanz: Schwellwerte (aufsteigend) und Punkte pro Intervall,
+# z.B. durchschnittliche Distanz < 0.3 -> 40 Punkte, < 0.5 -> 30, < 0.7 -> 15, sonst 5
+_AVG_DISTANCE_THRESHOLDS = np.array([0.3, 0.5, 0.7])
+_AVG_DISTANCE_POINTS = np.array([40, 30, 15, 5])
+_BEST_DISTANCE_THRESHOLDS = np.array([0.2, 0.4, 0.6])
+_BEST_DISTANCE_POINTS = np.array([30, 20, 10, 3])
+
+# Negativ-Indikatoren in der Antwort (senken die Konfidenz)
+NEGATIVE_PHRASES = (
+    'keine antwort',
+    'nicht beantworten',
+    'keine information',
+    'nicht gefunden',
+    'konnte nicht',
+    'keine relevanten dokumente',
+    'ich weiß nicht',
+    'unklar'
+)
+# Ein Durchlauf über die Antwort statt einer Teilstring-Suche pro Phrase (und ohne lower()-Kopie)
+_NEGATIVE_PHRASES_RE = re.compile('|'.join(re.escape(phrase) for phrase in NEGATIVE_PHRASES), re.IGNORECASE)
+
+# Antworten, die schon mit dem ersten Satz sagen, dass die Dokumente nichts hergeben
+# (nur am Antwortanfang - "Die Lastschrift konnte nicht eingelöst werden" ist eine echte Antwort)
+_NO_ANSWER_RE = re.compile(
+    r'leider\s*,?\s*(?:habe|finde|fand|konnte)\s+ich\s+keine'
+    r'|(?:leider\s*,?\s*)?(?:'
+    r'ich\s+(?:habe|finde|fand|konnte)\s+(?:leider\s+)?keine'
+    r'|ich\s+kann\s+(?:diese|die|deine|ihre)\s+frage\s+(?:leider\s+)?nicht'
+    r'|keine\s+(?:relevanten\s+)?(?:information(?:en)?|dokumente|angaben)'
+    r'|(?:die\s+)?(?:bereitgestellten\s+)?dokumente\s+enthalten\s+keine'
+    r'|es\s+(?:gibt|liegen)\s+keine\s+(?:relevanten\s+)?(?:information(?:en)?|angaben|hinweise|dokumente)'
+    r')',
+    re.IGNORECASE
+)
+# Satzende: . ! ? oder Zeilenumbruch; ein Punkt zwischen Ziffern (15.03.2024, 1.234) zählt nicht,
+# ein Punkt nach einer Ziffer erst, wenn das nächste Zeichen keine Ziffer ist
+_SENTENCE_END_RE = re.compile(r'[!?\n]|(?<!\d)\.|\.(?=\D)')
+
+# Folgt der Absage ein "aber ..." o.ä., kommt noch eine Antwort (z.B. ein verwandter Treffer)
+_CONTRAST_RE = re.compile(r'\b(?:aber|jedoch|allerdings|dafür)\b', re.IGNORECASE)
+
+# Nur wenn die Absage in den ersten Teilstücken (Tokens) kommt, wird die Generierung abgebrochen
+EARLY_STOP_CHUNKS = 30
+
+NO_DOCUMENTS_ANSWER = "Ich konnte keine relevanten Dokumente finden, um diese Frage zu beantworten."
+NO_ANSWER_TEXT = "Entschuldigung, ich konnte keine Antwort generieren."
+
+
+def _format_context_entry(index: int, title: str, correspondent: str, document_type: str, text: str) -> str:
+    """Formatiert ein Dokument für den RAG-Kontext (Von/Typ nur wenn vorhanden)"""
+    correspondent_line = f"Von: {correspondent}\n" if correspondent else ""
+    type_line = f"Typ: {document_type}\n" if document_type else ""
+    return f"[Dokument {index}]\nTitel: {title}\n{correspondent_line}{type_line}Inhalt: {text}\n"
+
+
+class QueryCache:
+    """
+    Semantischer Cache für Suchergebnisse
+
+    Exakter Treffer über den Hash von Query und Suchparametern (ohne Embedding),
+    sonst Kosinus-Ähnlichkeit des Query-Embeddings gegen alle gespeicherten Queries
+    mit gleichen Suchparametern. Einträge verfallen nach ttl Sekunden.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 512,
+        ttl: float = 300.0,
+        similarity_threshold: float = 0.95,
+        name: str = 'Query-Cache'
+    ):
+        """
+        Args:
+            max_size: Maximale Anzahl Einträge (LRU-Verdrängung, 0 deaktiviert den Cache)
+            ttl: Lebensdauer eines Eintrags in Sekunden
+            similarity_threshold: Minimale Kosinus-Ähnlichkeit für einen semantischen Treffer
+            name: Name für Log-Meldungen
+        """
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        # key -> (normiertes Embedding, Parameter-Key, Ergebnisse, Zeitstempel)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Gestapelte Embeddings pro Parameter-Key für die Ähnlichkeitssuche:
+        # params -> (Keys, (N, d)-Matrix, Zeitstempel); wird bei Änderungen neu aufgebaut.
+        # Bewusst float32 statt int8-quantisiert: NumPy rechnet Integer-Matrixprodukte ohne
+        # BLAS, bei 128-512 Einträgen x 768 Dimensionen etwa 10x langsamer als float32
+        self._groups: Optional[Dict[str, Tuple[List[str], np.ndarray, np.ndarray]]] = None
+
+    @staticmethod
+    def make_key(query: str, params: str) -> str:
+        """Hash über die normalisierte Query und die Suchparameter"""
+        normalized = ' '.join(query.lower().split())
+        return hashlib.sha1(f"{params}\x00{normalized}".encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def make_params(n_results: int, filters: Optional[Dict[str, Any]]) -> str:
+        """Parameter-Key: Treffer gelten nur bei gleicher Ergebnisanzahl und gleichen Filtern"""
+        return f"{n_results}|{sorted(filters.items()) if filters else ''}"
+
+    def _expire(self, now: float):
+        """Entfernt abgelaufene Einträge (ältester Eintrag steht vorne)"""
+        expired = [key for key, entry in self._entries.items() if now - entry[3] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._groups = None
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Exakter Treffer über den Query-Hash"""
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[3] > self.ttl:
+                del self._entries[key]
+                self._groups = None
+                return None
+            self._entries.move_to_end(key)
+            return list(entry[2])
+
+    def get_similar(self, embedding: np.ndarray, params: str) -> Optional[List[Dict[str, Any]]]:
+        """Semantischer Treffer: Query mit Kosinus-Ähnlichkeit >= similarity_threshold"""
+        if self.max_size <= 0:
+            return None
+        query_vec = self._normalize(embedding)
+        if query_vec is None:
+            return None
+
+        with self._lock:
+            if not self._entries:
+                return None
+            if self._groups is None:
+                self._rebuild_groups()
+            group = self._groups.get(params)
+            if group is None:
+                return None
+            keys, matrix, created = group
+            if matrix.shape[1] != query_vec.shape[0]:
+                return None
+
+            # Ein Matrix-Vektor-Produkt über die Queries mit gleichen Parametern;
+            # abgelaufene Einträge werden maskiert statt einzeln geprüft
+            sims = matrix @ query_vec
+            sims[created < time.monotonic() - self.ttl] = -1.0
+            best = int(np.argmax(sims))
+            if sims[best] < self.similarity_threshold:
+                return None
+
+            key = keys[best]
+            self._entries.move_to_end(key)
+            logger.info(f"Treffer im {self.name} (Ähnlichkeit: {sims[best]:.3f})")
+            return list(self._entries[key][2])
+
+    def put(self, key: str, embedding: np.ndarray, params: str, results: List[Dict[str, Any]]):
+        """Speichert die Suchergebnisse einer Query"""
+        if self.max_size <= 0:
+            return
+        query_vec = self._normalize(embedding)
+        if query_vec is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._entries[key] = (query_vec, params, list(results), now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._groups = None
+
+    def clear(self):
+        """Leert den Cache (z.B. nach einer Neu-Indexierung)"""
+        with self._lock:
+            self._entries.clear()
+            self._groups = None
+
+    def _rebuild_groups(self):
+        """Stapelt die Embeddings pro Parameter-Key in zusammenhängende (N, d) float32-Matrizen"""
+        dims = {entry[0].shape[0] for entry in self._entries.values()}
+        if len(dims) > 1:
+            # Embedding-Modell gewechselt: nur Einträge mit der neuesten Dimension behalten
+            latest = next(reversed(self._entries.values()))[0].shape[0]
+            for key in [k for k, e in self._entries.items() if e[0].shape[0] != latest]:
+                del self._entries[key]
+
+        grouped: Dict[str, List[Tuple[str, tuple]]] = {}
+        for key, entry in self._entries.items():
+            grouped.setdefault(entry[1], []).append((key, entry))
+
+        self._groups = {
+            params: (
+                [key for key, _ in items],
+                np.ascontiguousarray(np.stack([entry[0] for _, entry in items]), dtype=np.float32),
+                np.array([entry[3] for _, entry in items])
+            )
+            for params, items in grouped.items()
+        }
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> Optional[np.ndarray]:
+        """L2-normiert das Embedding (None bei leerem Vektor)"""
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        if vec.size == 0 or norm == 0.0:
+            return None
+        return vec / norm
+
 
 class QASystem:
     """Question & Answer System mit RAG für Paperless Dokumente"""
@@ -36,7 +270,13 @@ class QASystem:
         self,
         embedding_service: EmbeddingService,
         vector_store: VectorStore,
-        ollama_classifier: OllamaClassifier
+        ollama_classifier: OllamaClassifier,
+        query_cache_size: int = 512,
+        query_cache_ttl: float = 300.0,
+        llm_cache: Optional[LLMResultCache] = None,
+        answer_cache_size: int = 256,
+        answer_cache_ttl: float = 300.0,
+        answer_similarity_threshold: float = 0.97
     ):
         """
         Initialisiert das Q&A System
@@ -45,14 +285,60 @@ class QASystem:
             embedding_service: Service für Embedding-Generierung
             vector_store: Vector Store für semantische Suche
             ollama_classifier: Ollama Client für Text-Generierung
+            query_cache_size: Maximale Anzahl gecachter Suchanfragen (0 deaktiviert den Cache)
+            query_cache_ttl: Lebensdauer gecachter Suchergebnisse in Sekunden
+            llm_cache: Cache für LLM-Synonyme und Query-Varianten (Standard: nur im Speicher)
+            answer_cache_size: Maximale Anzahl gecachter Antworten (0 deaktiviert den Cache)
+            answer_cache_ttl: Lebensdauer gecachter Antworten in Sekunden
+            answer_similarity_threshold: Minimale Kosinus-Ähnlichkeit für eine gecachte Antwort
+                (strenger als bei der Suche: ähnliche Fragen zu denselben Dokumenten
+                können unterschiedliche Antworten brauchen)
         """
         self.embeddings = embedding_service
         self.vector_store = vector_store
         self.llm = ollama_classifier
         self.metadata_extractor = MetadataExtractor(ollama_classifier)
 
+        # Feature-Flags aus .env einmal beim Start lesen (nicht bei jeder Anfrage)
+        # USE_LLM_EXPANSION: LLM generiert Synonyme, wenn die hardcoded Liste nicht passt
+        # USE_MULTI_QUERY: alternative Formulierungen der Frage zusätzlich durchsuchen
+        self.use_llm_expansion = os.getenv('USE_LLM_EXPANSION', 'false').lower() == 'true'
+        self.use_multi_query = os.getenv('USE_MULTI_QUERY', 'true').lower() == 'true'
+        self.query_cache = QueryCache(max_size=query_cache_size, ttl=query_cache_ttl)
+        self.llm_cache = llm_cache if llm_cache is not None else LLMResultCache()
+        self.answer_cache = QueryCache(
+            max_size=answer_cache_size,
+            ttl=answer_cache_ttl,
+            similarity_threshold=answer_similarity_threshold,
+            name='Antwort-Cache'
+        )
+        # Stand des Vector Stores, zu dem die gecachten Ergebnisse passen
+        self._cache_generation = vector_store.generation
+        # Maximale Zeichen pro Kontext-Dokument im RAG-Prompt (0 = ungekürzt)
+        self.context_max_chars = int(os.getenv('QA_CONTEXT_MAX_CHARS', '1000'))
+        # Gemeinsamer Pool für parallele Vektorsuchen (eine Suche pro Query-Variante)
+        self._search_pool = ThreadPoolExecutor(
+            max_workers=max(1, int(os.getenv('QA_SEARCH_WORKERS', '4'))),
+            thread_name_prefix='qa-search'
+        )
+        # Eigener Pool für vorgezogene Query-Embeddings: search_documents läuft selbst im
+        # Such-Pool und wartet darauf, ein gemeinsamer Pool könnte sich so blockieren
+        self._embedding_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='qa-embed')
+
         logger.info("QASystem initialisiert")
 
+    def clear_query_cache(self):
+        """Verwirft gecachte Suchergebnisse und Antworten (nach Änderungen am Index aufrufen)"""
+        self.query_cache.clear()
+        self.answer_cache.clear()
+        self._cache_generation = self.vector_store.generation
+
+    def _sync_caches_with_index(self):
+        """Verwirft die Caches, wenn seit dem letzten Zugriff in den Vector Store geschrieben wurde"""
+        if self.vector_store.generation != self._cache_generation:
+            logger.info("Vector Store wurde geändert, Query- und Antwort-Cache werden geleert")
+            self.clear_query_cache()
+
     def _expand_query_llm(self, query: str) -> str:
         """
         Erweitert die Suchanfrage mit LLM-generierten Synonymen (dynamisch!)
@@ -63,6 +349,12 @@ class QASystem:
         Returns:
             Erweiterte Suchanfrage mit Synonymen
         """
+        cache_key = LLMResultCache.make_key('synonyms', self.llm.model, query)
+        cached = self.llm_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Query erweitert (LLM, aus Cache): '{query}'")
+            return f"{query} {cached}"
+
         try:
             # Kurzer Prompt für schnelle Synonym-Generierung
             synonym_prompt = f"""Generiere Synonyme und alternative Schreibweisen für die Suchbegriffe in dieser Frage.
@@ -84,6 +376,7 @@ Synonyme:"""
             synonyms_text = self.llm.generate(synonym_prompt, temperature=0.3)
 
             if synonyms_text and len(synonyms_text) > 0:
+                self.llm_cache.put(cache_key, synonyms_text)
                 # Kombiniere Original-Query mit Synonymen
                 expanded = f"{query} {synonyms_text}"
                 logger.info(f"Query erweitert (LLM): '{query}' → '{expanded[:100]}...'")
@@ -105,30 +398,32 @@ Synonyme:"""
         Returns:
             Erweiterte Suchanfrage mit Synonymen
         """
-        query_lower = query.lower()
-        expanded_terms = []
-
         # 1. Schnelle hardcoded Synonyme (für häufige Begriffe)
-        for key, synonyms in SYNONYM_MAP.items():
-            if key in query_lower:
-                expanded_terms.extend(synonyms)
-                logger.debug(f"Query-Expansion (hardcoded): '{key}' → {synonyms}")
-
-        if expanded_terms:
-            # Nutze hardcoded Synonyme
-            expanded = f"{query} {' '.join(expanded_terms)}"
-            logger.info(f"Query erweitert (hardcoded): '{query}' → '{expanded[:100]}...'")
+        expanded = self._expand_query_hardcoded(query)
+        if expanded is not None:
             return expanded
 
         # 2. Fallback: LLM-basierte Expansion (für andere Begriffe)
-        # Konfigurierbar über .env: USE_LLM_EXPANSION=true
-        use_llm = os.getenv('USE_LLM_EXPANSION', 'false').lower() == 'true'
-        if use_llm:
+        # Konfigurierbar über .env: USE_LLM_EXPANSION=true (siehe __init__)
+        if self.use_llm_expansion:
             logger.info("Nutze LLM-basierte Query Expansion (konfiguriert via .env)")
             return self._expand_query_llm(query)
 
         return query
 
+    @staticmethod
+    def _expand_query_hardcoded(query: str) -> Optional[str]:
+        """Erweitert die Suchanfrage mit Synonymen aus SYNONYM_MAP (None wenn kein Begriff passt)"""
+        hits = {match.group(0).lower() for match in _SYNONYM_RE.finditer(query)}
+        if not hits:
+            return None
+
+        # Nutze hardcoded Synonyme (Reihenfolge wie in SYNONYM_MAP)
+        logger.debug(f"Query-Expansion (hardcoded): {sorted(hits)}")
+        expanded = f"{query} {' '.join(_SYNONYM_TEXT[key] for key in SYNONYM_MAP if key in hits)}"
+        logger.info(f"Query erweitert (hardcoded): '{query}' → '{expanded[:100]}...'")
+        return expanded
+
     def _generate_multi_queries(self, original_query: str, n_variants: int = 2) -> List[str]:
         """
         Generiert alternative Formulierungen einer Frage (Multi-Query Approach)
@@ -140,6 +435,12 @@ Synonyme:"""
         Returns:
             Liste von Fragen (inkl. Original)
         """
+        cache_key = LLMResultCache.make_key(f'variants:{n_variants}', self.llm.model, original_query)
+        cached = self.llm_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Multi-Query: {len(cached) + 1} Varianten aus Cache")
+            return [original_query] + cached
+
         try:
             prompt = f"""Generiere {n_variants} alternative Formulierungen für diese Frage.
 Die Varianten sollen die gleiche Information suchen, aber anders formuliert sein.
@@ -157,12 +458,11 @@ Varianten:"""
             response = self.llm.generate(prompt, temperature=0.7)
 
             if response:
-                # Parse Varianten (eine pro Zeile)
-                variants = [q.strip() for q in response.split('\n') if q.strip()]
-                # Entferne Nummerierungen falls vorhanden
-                variants = [re.sub(r'^\d+[\.\)]\s*', '', q) for q in variants]
+                # Parse Varianten (eine pro Zeile) und entferne Nummerierungen falls vorhanden
+                variants = [_NUMBERING_RE.sub('', line) for q in response.split('\n') if (line := q.strip())]
                 # Nehme nur die gewünschte Anzahl
                 variants = variants[:n_variants]
+                self.llm_cache.put(cache_key, variants)
 
                 # Füge Original hinzu
                 all_queries = [original_query] + variants
@@ -193,38 +493,156 @@ Varianten:"""
             Liste von relevanten Dokumenten mit Metadaten
         """
         try:
-            # Auto-Filter-Extraktion wenn keine Filter gegeben
-            if filters is None:
-                extracted_filters = self.metadata_extractor.extract_filters(query)
-                filters = self.metadata_extractor.convert_to_chromadb_filter(extracted_filters)
-                if filters:
-                    logger.info(f"Auto-Filter aktiviert: {filters}")
+            # Exakter Cache-Treffer: Filter-Extraktion, Expansion und Embedding entfallen
+            self._sync_caches_with_index()
+            exact_key = QueryCache.make_key(query, QueryCache.make_params(n_results, filters))
+            cached = self.query_cache.get(exact_key)
+            if cached is not None:
+                logger.info(f"Suchergebnisse aus Query-Cache für: '{query}'")
+                return cached
 
-            # Query mit Synonymen erweitern
-            expanded_query = self._expand_query(query)
+            expanded_query, filters, embedding_future = self._prepare_query(query, filters, prefetch_embedding=True)
 
             # Query-Embedding erstellen (mit erweiterter Query)
             logger.info(f"Suche nach: '{query}'")
-            query_embedding = self.embeddings.generate_embedding(expanded_query)
-
-            if not query_embedding:
-                logger.error("Konnte kein Embedding für Query erstellen")
-                return []
-
-            # Semantische Suche durchführen
-            results = self.vector_store.search(
-                query_embedding=query_embedding,
-                n_results=n_results,
-                where=filters
-            )
+            if embedding_future is not None:
+                query_embedding = embedding_future.result()
+            else:
+                query_embedding = self.embeddings.generate_embedding(expanded_query)
 
-            logger.info(f"Gefunden: {len(results)} relevante Dokumente")
-            return results
+            return self._search_with_embedding(exact_key, query_embedding, n_results, filters)
 
         except Exception as e:
             logger.error(f"Fehler bei der Dokumentensuche: {e}")
             return []
 
+    def _prepare_query(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        prefetch_embedding: bool = False
+    ) -> Tuple[str, Optional[Dict[str, Any]], Optional[Future]]:
+        """
+        Bereitet eine Suchanfrage vor: Auto-Filter (wenn keine Filter gegeben) und Synonyme
+
+        Mit LLM-Expansion liefert ein einziger LLM-Aufruf Filter und Synonyme. Steht der
+        Embedding-Text schon vor der Filter-Extraktion fest (hardcoded Synonyme bzw. keine
+        LLM-Expansion), wird das Embedding mit prefetch_embedding parallel angefragt.
+
+        Returns:
+            Tuple aus erweiterter Query, ChromaDB-Filter und ggf. Future des Query-Embeddings
+        """
+        # Query mit Synonymen erweitern (hardcoded oder aus dem LLM-Cache steht sofort fest)
+        expanded = self._expand_query_hardcoded(query)
+        use_llm_expansion = expanded is None and self.use_llm_expansion
+        synonyms_key = LLMResultCache.make_key('synonyms', self.llm.model, query)
+        if use_llm_expansion:
+            cached = self.llm_cache.get(synonyms_key)
+            if cached is not None:
+                expanded = f"{query} {cached}"
+                use_llm_expansion = False
+        elif expanded is None:
+            expanded = query
+
+        embedding_future = None
+        if prefetch_embedding and expanded is not None and filters is None:
+            embedding_future = self._embedding_pool.submit(self.embeddings.generate_embedding, expanded)
+
+        # Auto-Filter-Extraktion wenn keine Filter gegeben
+        synonyms = None
+        if filters is None:
+            if use_llm_expansion:
+                extracted_filters, synonyms = self.metadata_extractor.extract_filters_and_synonyms(query)
+            else:
+                extracted_filters = self.metadata_extractor.extract_filters(query)
+            filters = self.metadata_extractor.convert_to_chromadb_filter(extracted_filters)
+            if filters:
+                logger.info(f"Auto-Filter aktiviert: {filters}")
+
+        if expanded is None:
+            if synonyms is None:
+                # Kein kombinierter Aufruf (Filter gegeben oder ohne LLM extrahiert)
+                expanded = self._expand_query_llm(query)
+            elif synonyms:
+                self.llm_cache.put(synonyms_key, synonyms)
+                expanded = f"{query} {synonyms}"
+                logger.info(f"Query erweitert (LLM, mit Filtern): '{query}' → '{expanded[:100]}...'")
+            else:
+                expanded = query
+
+        return expanded, filters, embedding_future
+
+    def _search_with_embedding(
+        self,
+        exact_key: str,
+        query_embedding: np.ndarray,
+        n_results: int,
+        filters: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Semantische Suche mit fertigem Query-Embedding (inkl. Query-Cache)
+
+        Args:
+            exact_key: Cache-Key der ursprünglichen Anfrage (QueryCache.make_key)
+            query_embedding: Embedding der erweiterten Query
+            n_results: Anzahl der Ergebnisse
+            filters: ChromaDB-Filter
+
+        Returns:
+            Liste von relevanten Dokumenten mit Metadaten
+        """
+        results = self._search_with_embeddings([(exact_key, query_embedding, filters)], n_results)[0]
+        logger.info(f"Gefunden: {len(results)} relevante Dokumente")
+        return results
+
+    def _search_with_embeddings(
+        self,
+        items: List[Tuple[str, np.ndarray, Optional[Dict[str, Any]]]],
+        n_results: int
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Semantische Suche für mehrere fertige Query-Embeddings (inkl. Query-Cache)
+
+        Queries ohne Cache-Treffer mit gleichen Filtern gehen gemeinsam in einem
+        Aufruf an den Vector Store.
+
+        Args:
+            items: (exact_key, query_embedding, filters) pro Query
+            n_results: Anzahl der Ergebnisse pro Query
+
+        Returns:
+            Eine Ergebnisliste pro Query (Reihenfolge wie items)
+        """
+        results: List[List[Dict[str, Any]]] = [[] for _ in items]
+        groups: Dict[str, List[int]] = {}
+        for i, (_, query_embedding, filters) in enumerate(items):
+            if query_embedding.size == 0:
+                logger.error("Konnte kein Embedding für Query erstellen")
+                continue
+
+            # Semantischer Cache-Treffer: fast gleiche Frage mit gleichen Filtern
+            params = QueryCache.make_params(n_results, filters)
+            cached = self.query_cache.get_similar(query_embedding, params)
+            if cached is not None:
+                results[i] = cached
+            else:
+                groups.setdefault(params, []).append(i)
+
+        for params, indices in groups.items():
+            # Semantische Suche durchführen (eine Anfrage pro Filter-Kombination)
+            found = self.vector_store.search_batch(
+                [items[i][1] for i in indices],
+                n_results=n_results,
+                where=items[indices[0]][2]
+            )
+            for i, query_results in zip(indices, found):
+                results[i] = query_results
+                # Leere Ergebnisse nicht cachen (evtl. Fehler oder noch nicht indexiert)
+                if query_results:
+                    exact_key, query_embedding, _ = items[i]
+                    self.query_cache.put(exact_key, query_embedding, params, query_results)
+        return results
+
     def search_documents_multi(
         self,
         query: str,
@@ -245,37 +663,39 @@ Varianten:"""
             Deduplizierte Liste von relevanten Dokumenten
         """
         try:
-            # Generiere mehrere Varianten der Frage
-            if use_multi_query and os.getenv('USE_MULTI_QUERY', 'true').lower() == 'true':
-                queries = self._generate_multi_queries(query, n_variants=2)
+            if use_multi_query and self.use_multi_query:
+                n_variants = 2
+                results_per_query = max(n_results // (n_variants + 1), 3)
+
+                # Varianten-Generierung (LLM) und Suche mit der Original-Frage laufen gleichzeitig
+                variants_future = self._search_pool.submit(self._generate_multi_queries, query, n_variants)
+                original_future = self._search_pool.submit(self.search_documents, query, results_per_query, filters)
+                variants = variants_future.result()[1:]
+
+                if variants:
+                    result_lists = [original_future.result()] + self._search_variants(variants, results_per_query, filters)
+                else:
+                    # Keine Varianten: Original-Frage mit voller Ergebnisanzahl (Embedding ist gecacht)
+                    original_future.result()
+                    result_lists = [self.search_documents(query, n_results=max(n_results, 3), filters=filters)]
             else:
-                queries = [query]
-
-            # Suche mit allen Query-Varianten
-            all_results = []
-            results_per_query = max(n_results // len(queries), 3)
+                result_lists = [self.search_documents(query, n_results=max(n_results, 3), filters=filters)]
 
-            for q in queries:
-                results = self.search_documents(q, n_results=results_per_query, filters=filters)
-                all_results.extend(results)
-
-            # Deduplizierung basierend auf doc_id
+            # Die Listen sind vom Vector Store bereits nach Distanz sortiert: zusammenführen,
+            # dabei deduplizieren (der erste Treffer pro doc_id ist der beste) und nach
+            # n_results Dokumenten abbrechen
             seen_docs = set()
-            dedup_results = []
-
-            for result in all_results:
-                doc_id = result['doc_id']
-                if doc_id not in seen_docs:
-                    seen_docs.add(doc_id)
-                    dedup_results.append(result)
-
-            # Sortiere nach Distance (beste zuerst)
-            dedup_results.sort(key=lambda x: x.get('distance', 999))
-
-            # Limitiere auf n_results
-            final_results = dedup_results[:n_results]
-
-            logger.info(f"Multi-Query Suche: {len(all_results)} gesamt, {len(final_results)} nach Deduplizierung")
+            final_results = []
+            for result in heapq.merge(*result_lists, key=lambda x: x.get('distance', 999)):
+                if result['doc_id'] in seen_docs:
+                    continue
+                seen_docs.add(result['doc_id'])
+                final_results.append(result)
+                if len(final_results) == n_results:
+                    break
+
+            total = sum(len(results) for results in result_lists)
+            logger.info(f"Multi-Query Suche: {total} gesamt, {len(final_results)} nach Deduplizierung")
             return final_results
 
         except Exception as e:
@@ -283,6 +703,56 @@ Varianten:"""
             # Fallback auf normale Suche
             return self.search_documents(query, n_results, filters)
 
+    def _search_variants(
+        self,
+        queries: List[str],
+        n_results: int,
+        filters: Optional[Dict[str, Any]]
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Sucht mit mehreren Query-Varianten
+
+        Cache-Treffer werden direkt übernommen. Für den Rest laufen die Vorbereitung
+        (Filter, Synonyme) parallel, alle Embeddings kommen aus einem Request und
+        Varianten mit gleichen Filtern werden in einer Vektorsuche zusammengefasst.
+
+        Darf nicht selbst im Such-Pool laufen, da es auf Aufgaben in diesem Pool wartet.
+
+        Returns:
+            Eine Ergebnisliste pro Variante (Reihenfolge der Varianten, je nach Distanz sortiert)
+        """
+        self._sync_caches_with_index()
+        result_lists: List[Optional[List[Dict[str, Any]]]] = []
+        misses = []
+        params = QueryCache.make_params(n_results, filters)
+        for q in queries:
+            exact_key = QueryCache.make_key(q, params)
+            cached = self.query_cache.get(exact_key)
+            result_lists.append(cached)
+            if cached is None:
+                misses.append((len(result_lists) - 1, exact_key, q))
+
+        if not misses:
+            return result_lists
+
+        # Filter-Extraktion und Expansion (ggf. LLM-Aufrufe) für alle Varianten gleichzeitig
+        prepare_futures = [self._search_pool.submit(self._prepare_query, q, filters) for _, _, q in misses]
+        pending = []
+        for (index, exact_key, _), future in zip(misses, prepare_futures):
+            expanded_query, query_filters, _ = future.result()
+            pending.append((index, exact_key, expanded_query, query_filters))
+
+        logger.info(f"Suche nach {len(pending)} Query-Varianten")
+        embeddings = self.embeddings.generate_embeddings_multi([item[2] for item in pending])
+        found = self._search_with_embeddings(
+            [(exact_key, query_embedding, query_filters)
+             for (_, exact_key, _, query_filters), query_embedding in zip(pending, embeddings)],
+            n_results
+        )
+        for (index, _, _, _), query_results in zip(pending, found):
+            result_lists[index] = query_results
+        return result_lists
+
     def answer_question(
         self,
         question: str,
@@ -303,72 +773,19 @@ Varianten:"""
         try:
             # 1. Relevante Dokumente finden (Retrieval) mit Multi-Query
             logger.info(f"Beantworte Frage: '{question}'")
-
-            # Nutze Multi-Query für bessere Ergebnisse
-            use_multi = os.getenv('USE_MULTI_QUERY', 'true').lower() == 'true'
-            if use_multi:
-                relevant_docs = self.search_documents_multi(query=question, n_results=n_context_docs * 2)
-                # Nehme nur die besten n_context_docs
-                relevant_docs = relevant_docs[:n_context_docs]
-            else:
-                relevant_docs = self.search_documents(query=question, n_results=n_context_docs)
+            relevant_docs = self._retrieve_context_docs(question, n_context_docs)
 
             if not relevant_docs:
                 return {
-                    'answer': "Ich konnte keine relevanten Dokumente finden, um diese Frage zu beantworten.",
+                    'answer': NO_DOCUMENTS_ANSWER,
                     'sources': [],
                     'confidence': 'low'
                 }
 
-            # 2. Kontext aus Dokumenten erstellen
-            context_parts = []
-            sources = []
-
-            for i, doc in enumerate(relevant_docs, 1):
-                doc_info = f"[Dokument {i}]\n"
-                doc_info += f"Titel: {doc['metadata'].get('title', 'Unbekannt')}\n"
-                if doc['metadata'].get('correspondent'):
-                    doc_info += f"Von: {doc['metadata']['correspondent']}\n"
-                if doc['metadata'].get('document_type'):
-                    doc_info += f"Typ: {doc['metadata']['document_type']}\n"
-                doc_info += f"Inhalt: {doc['text']}\n"
-
-                context_parts.append(doc_info)
-
-                # Quellen sammeln
-                if include_sources:
-                    sources.append({
-                        'doc_id': doc['doc_id'],
-                        'title': doc['metadata'].get('title', 'Unbekannt'),
-                        'correspondent': doc['metadata'].get('correspondent', ''),
-                        'document_type': doc['metadata'].get('document_type', ''),
-                        'relevance_score': 1 - (doc.get('distance', 0) / 2) if doc.get('distance') else None
-                    })
-
-            context = "\n\n".join(context_parts)
-
-            # 3. Prompt für LLM erstellen (Augmentation)
-            prompt = self._create_rag_prompt(question, context)
-
-            # 4. Antwort generieren (Generation)
-            logger.info("Generiere Antwort mit LLM...")
-            answer = self.llm.generate(prompt)
-
-            if not answer:
-                return {
-                    'answer': "Entschuldigung, ich konnte keine Antwort generieren.",
-                    'sources': sources if include_sources else [],
-                    'confidence': 'low'
-                }
-
-            # 5. Antwort zurückgeben
-            result = {
-                'answer': answer.strip(),
-                'sources': sources if include_sources else [],
-                'confidence': self._estimate_confidence(relevant_docs, answer)
-            }
-
-            logger.info("Antwort erfolgreich generiert")
+            # 2.-4. Kontext, Prompt und Antwort (ggf. aus dem Antwort-Cache)
+            result = self.generate_answer(question, relevant_docs)
+            if not include_sources:
+                result['sources'] = []
             return result
 
         except Exception as e:
@@ -379,6 +796,275 @@ Varianten:"""
                 'confidence': 'low'
             }
 
+    def answer_question_stream(
+        self,
+        question: str,
+        n_context_docs: int = 3,
+        include_sources: bool = True
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Wie answer_question, liefert die Antwort aber als Stream (z.B. für Server-Sent Events)
+
+        Yields:
+            {'type': 'token', 'text': ...} pro Teilstück der Antwort, zum Schluss
+            {'type': 'done', 'result': {...}} mit Antwort, Quellen und Konfidenz
+        """
+        try:
+            logger.info(f"Beantworte Frage (Stream): '{question}'")
+            relevant_docs = self._retrieve_context_docs(question, n_context_docs)
+        except Exception as e:
+            logger.error(f"Fehler beim Beantworten der Frage: {e}")
+            relevant_docs = []
+
+        if not relevant_docs:
+            yield {'type': 'token', 'text': NO_DOCUMENTS_ANSWER}
+            yield {'type': 'done', 'result': {'answer': NO_DOCUMENTS_ANSWER, 'sources': [], 'confidence': 'low'}}
+            return
+
+        for event in self.generate_answer_stream(question, relevant_docs):
+            if event['type'] == 'done' and not include_sources:
+                event['result']['sources'] = []
+            yield event
+
+    def _retrieve_context_docs(self, question: str, n_context_docs: int) -> List[Dict[str, Any]]:
+        """Findet die Kontext-Dokumente für eine Frage (Multi-Query wenn aktiviert)"""
+        # Nutze Multi-Query für bessere Ergebnisse
+        if self.use_multi_query:
+            relevant_docs = self.search_documents_multi(query=question, n_results=n_context_docs * 2)
+            # Nehme nur die besten n_context_docs
+            return relevant_docs[:n_context_docs]
+        return self.search_documents(query=question, n_results=n_context_docs)
+
+    def generate_answer(
+        self,
+        question: str,
+        relevant_docs: List[Dict[str, Any]],
+        use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Generiert die Antwort zu bereits gefundenen Dokumenten (Augmentation + Generation)
+
+        Antworten werden pro Fragen-Embedding und Dokument-Menge gecacht: eine gleiche
+        oder sehr ähnliche Frage über dieselben Dokumente braucht keinen LLM-Aufruf.
+
+        Args:
+            question: Die Frage
+            relevant_docs: Kontext-Dokumente (nicht leer, beste zuerst)
+            use_cache: False erzwingt eine neue Antwort (z.B. nach Änderungen an Dokumenten)
+
+        Returns:
+            Dictionary mit Antwort, Quellen und Konfidenz
+        """
+        for event in self.generate_answer_stream(question, relevant_docs, use_cache):
+            if event['type'] == 'done':
+                return event['result']
+        return {'answer': NO_ANSWER_TEXT, 'sources': [], 'confidence': 'low'}
+
+    def generate_answer_stream(
+        self,
+        question: str,
+        relevant_docs: List[Dict[str, Any]],
+        use_cache: bool = True
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream-Variante von generate_answer
+
+        Beginnt die Antwort mit einer Absage ("Ich habe keine Informationen" o.ä.) und enthalten
+        weder dieser noch der folgende Satz ein "aber"/"jedoch"/..., wird die Generierung nach
+        dem zweiten Satz abgebrochen - der Rest wäre nur Begründung. Abgebrochene Antworten
+        werden nicht gecacht.
+
+        Yields:
+            {'type': 'token', 'text': ...} pro Teilstück, zum Schluss {'type': 'done', 'result': {...}}
+        """
+        # Treffer nur bei gleichem Modell und gleichen Dokumenten
+        params = f"{self.llm.model}|{sorted(doc['doc_id'] for doc in relevant_docs)}"
+        answer_key = QueryCache.make_key(question, params)
+        question_embedding = None
+        if use_cache:
+            self._sync_caches_with_index()
+            cached = self.answer_cache.get(answer_key)
+            if cached is None:
+                question_embedding = self.embeddings.generate_embedding(question)
+                cached = self.answer_cache.get_similar(question_embedding, params)
+            if cached is not None:
+                logger.info("Antwort aus Antwort-Cache")
+                yield {'type': 'token', 'text': cached[0]['answer']}
+                yield {'type': 'done', 'result': dict(cached[0])}
+                return
+
+        context, sources = self._build_context(relevant_docs, question)
+
+        # Prompt für LLM erstellen (Augmentation)
+        prompt = self._create_rag_prompt(question, context)
+
+        # Antwort generieren (Generation)
+        logger.info("Generiere Antwort mit LLM...")
+        parts = []
+        stopped_early = False
+        decided = False
+        stream = self.llm.generate_stream(prompt)
+        try:
+            for text in stream:
+                parts.append(text)
+                yield {'type': 'token', 'text': text}
+                if decided or len(parts) > EARLY_STOP_CHUNKS:
+                    continue
+                sentences = self._leading_sentences(parts, 2)
+                if not sentences:
+                    continue
+                if not _NO_ANSWER_RE.match(sentences[0]) or _CONTRAST_RE.search(sentences[0]):
+                    decided = True
+                elif len(sentences) == 2:
+                    decided = True
+                    if not _CONTRAST_RE.search(sentences[1]):
+                        stopped_early = True
+                        logger.info("Antwort enthält keine Information - Generierung abgebrochen")
+                        break
+        finally:
+            stream.close()
+        answer = ''.join(parts)
+
+        if not answer.strip():
+            yield {'type': 'done', 'result': {'answer': NO_ANSWER_TEXT, 'sources': sources, 'confidence': 'low'}}
+            return
+
+        result = {
+            'answer': answer.strip(),
+            'sources': sources,
+            'confidence': 'low' if stopped_early else self._estimate_confidence(relevant_docs, answer)
+        }
+
+        # Abgebrochene Antworten sind unvollständig und sollen beim nächsten Mal neu entstehen
+        if use_cache and not stopped_early:
+            if question_embedding is None:
+                question_embedding = self.embeddings.generate_embedding(question)
+            self.answer_cache.put(answer_key, question_embedding, params, [result])
+
+        logger.info("Antwort erfolgreich generiert")
+        yield {'type': 'done', 'result': dict(result)}
+
+    @staticmethod
+    def _leading_sentences(parts: List[str], count: int) -> List[str]:
+        """Die ersten count abgeschlossenen Sätze der bisherigen Antwort (ohne Whitespace, leere übersprungen)"""
+        head = ''.join(parts)
+        sentences = []
+        start = 0
+        for end in _SENTENCE_END_RE.finditer(head):
+            sentence = head[start:end.start()].strip()
+            start = end.end()
+            if sentence:
+                sentences.append(sentence)
+                if len(sentences) == count:
+                    break
+        return sentences
+
+    def _build_context(
+        self,
+        relevant_docs: List[Dict[str, Any]],
+        question: Optional[str] = None
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Erstellt den Kontext für den RAG-Prompt und die Quellenliste
+
+        Die Metadaten werden einmal pro Feld in Listen extrahiert; Kontext und
+        Quellen entstehen beide aus diesen Listen. Mit Frage werden zu lange Texte
+        auf die relevantesten Sätze gekürzt (siehe _condense_texts).
+
+        Args:
+            relevant_docs: Suchergebnisse (beste zuerst)
+            question: Die Frage (optional, für die Satzauswahl)
+
+        Returns:
+            Tuple aus Kontext-Text und Quellen
+        """
+        metadatas = [doc['metadata'] for doc in relevant_docs]
+        titles = [metadata.get('title', 'Unbekannt') for metadata in metadatas]
+        correspondents = [metadata.get('correspondent', '') for metadata in metadatas]
+        document_types = [metadata.get('document_type', '') for metadata in metadatas]
+
+        texts = [doc['text'] for doc in relevant_docs]
+        if question is not None:
+            texts = self._condense_texts(question, texts)
+
+        context = "\n\n".join(
+            _format_context_entry(i, title, correspondent, document_type, text)
+            for i, (text, title, correspondent, document_type)
+            in enumerate(zip(texts, titles, correspondents, document_types), 1)
+        )
+
+        # Relevanz aus der Distanz (0 bis 2 bei Kosinus), einmal pro Dokument berechnet
+        distances = [doc.get('distance') for doc in relevant_docs]
+        scores = [1 - distance / 2 if distance else None for distance in distances]
+
+        sources = [
+            {
+                'doc_id': doc['doc_id'],
+                'title': title,
+                'correspondent': correspondent,
+                'document_type': document_type,
+                'relevance_score': score
+            }
+            for doc, title, correspondent, document_type, score
+            in zip(relevant_docs, titles, correspondents, document_types, scores)
+        ]
+        return context, sources
+
+    def _condense_texts(self, question: str, texts: List[str]) -> List[str]:
+        """
+        Kürzt Kontext-Texte auf höchstens context_max_chars Zeichen
+
+        Aus zu langen Texten werden die Sätze mit der höchsten Ähnlichkeit zur Frage
+        übernommen (in ursprünglicher Reihenfolge). Alle Sätze werden mit einem
+        einzigen Embedding-Request eingebettet; schlägt das fehl, wird abgeschnitten.
+
+        Args:
+            question: Die Frage
+            texts: Texte der Kontext-Dokumente
+
+        Returns:
+            Gekürzte Texte (gleiche Reihenfolge)
+        """
+        max_chars = self.context_max_chars
+        if max_chars <= 0:
+            return texts
+
+        long_docs = {
+            i: sentences for i, text in enumerate(texts) if len(text) > max_chars
+            if len(sentences := _SENTENCE_SPLIT_RE.split(text.strip())) > 1
+        }
+        condensed = [text[:max_chars] for text in texts]
+        if not long_docs:
+            return condensed
+
+        all_sentences = [sentence for sentences in long_docs.values() for sentence in sentences]
+        embeddings = self.embeddings.generate_embeddings_multi([question] + all_sentences)
+        if any(embedding.size == 0 for embedding in embeddings):
+            logger.warning("Satz-Embeddings fehlgeschlagen, Kontext wird abgeschnitten")
+            return condensed
+
+        matrix = np.stack(embeddings).astype(np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        sims = matrix[1:] @ matrix[0]
+
+        offset = 0
+        for i, sentences in long_docs.items():
+            doc_sims = sims[offset:offset + len(sentences)]
+            offset += len(sentences)
+
+            # Beste Sätze zuerst nehmen, solange sie ins Budget passen
+            selected = []
+            used = 0
+            for j in np.argsort(-doc_sims):
+                length = len(sentences[j]) + 1
+                if used + length <= max_chars + 1:
+                    selected.append(j)
+                    used += length
+            if selected:
+                condensed[i] = ' '.join(sentences[j] for j in sorted(selected))
+
+        return condensed
+
     def _create_rag_prompt(self, question: str, context: str) -> str:
         """
         Erstellt einen RAG-Prompt für das LLM
@@ -430,30 +1116,18 @@ Antwort:"""
         score = 0
         max_score = 100
 
+        distances = np.fromiter(
+            (doc.get('distance', 1.0) for doc in relevant_docs[:3]), dtype=np.float64
+        )
+
         # Faktor 1: Durchschnittliche Distanz der Top-3 Dokumente (40 Punkte)
-        top_distances = [doc.get('distance', 1.0) for doc in relevant_docs[:3]]
-        avg_distance = sum(top_distances) / len(top_distances)
-
-        if avg_distance < 0.3:
-            score += 40
-        elif avg_distance < 0.5:
-            score += 30
-        elif avg_distance < 0.7:
-            score += 15
-        else:
-            score += 5
+        # side='right': ein Wert genau auf dem Schwellwert fällt ins nächste Intervall (wie "<")
+        avg_distance = distances.mean()
+        score += int(_AVG_DISTANCE_POINTS[np.searchsorted(_AVG_DISTANCE_THRESHOLDS, avg_distance, side='right')])
 
         # Faktor 2: Beste Übereinstimmung (30 Punkte)
-        best_distance = relevant_docs[0].get('distance', 1.0)
-
-        if best_distance < 0.2:
-            score += 30
-        elif best_distance < 0.4:
-            score += 20
-        elif best_distance < 0.6:
-            score += 10
-        else:
-            score += 3
+        best_distance = distances[0]
+        score += int(_BEST_DISTANCE_POINTS[np.searchsorted(_BEST_DISTANCE_THRESHOLDS, best_distance, side='right')])
 
         # Faktor 3: Anzahl relevanter Dokumente (15 Punkte)
         num_docs = len(relevant_docs)
@@ -465,21 +1139,7 @@ Antwort:"""
             score += 5
 
         # Faktor 4: Antwort-Qualität (15 Punkte)
-        answer_lower = answer.lower()
-
-        # Negativ-Indikatoren
-        negative_phrases = [
-            'keine antwort',
-            'nicht beantworten',
-            'keine information',
-            'nicht gefunden',
-            'konnte nicht',
-            'keine relevanten dokumente',
-            'ich weiß nicht',
-            'unklar'
-        ]
-
-        has_negative = any(phrase in answer_lower for phrase in negative_phrases)
+        has_negative = _NEGATIVE_PHRASES_RE.search(answer) is not None
 
         if has_negative:
             score += 0  # Keine Punkte bei negativen Phrasen
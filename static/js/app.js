@@ -413,13 +413,58 @@ async function loadIndexStatus() {
 
         document.getElementById('indexed-docs').textContent = data.indexed_documents || 0;
         document.getElementById('total-docs').textContent = data.total_paperless_documents || 0;
-        document.getElementById('index-status').textContent = data.indexing_progress || 'Unbekannt';
+        const status = document.getElementById('index-status');
+        status.textContent = data.indexing_progress || 'Unbekannt';
+        status.title = '';
+
+        // Index mit veraltetem Format: "Indexieren" bettet alle Dokumente neu ein
+        if (data.reindex_required) {
+            status.textContent += ' – Neuindexierung erforderlich';
+            status.title = (data.reindex_reasons || []).join('\n');
+            showToast('Der Suchindex hat ein veraltetes Format. Bitte "Indexieren" starten.', 'warning');
+        }
     } catch (error) {
         console.error('Error loading index status:', error);
         document.getElementById('index-status').textContent = 'Fehler';
     }
 }
 
+// Aufeinanderfolgende fehlgeschlagene Statusabfragen, nach denen das Warten aufgegeben wird
+const INDEX_STATUS_MAX_ERRORS = 5;
+
+async function waitForIndexing(btn) {
+    let errors = 0;
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+
+        // Ohne gültigen Job-Status ist unbekannt, ob die Indexierung noch läuft:
+        // weiter abfragen und erst nach mehreren Fehlern in Folge als Fehler melden
+        let data = null;
+        try {
+            const response = await fetch(`${API_BASE}/api/qa/index-status`);
+            data = await response.json();
+            if (!response.ok || !data.job) {
+                throw new Error(data.error || `HTTP ${response.status}`);
+            }
+        } catch (error) {
+            console.error('Error polling index status:', error);
+            if (++errors >= INDEX_STATUS_MAX_ERRORS) {
+                return { statusError: error.message };
+            }
+            continue;
+        }
+        errors = 0;
+        const job = data.job;
+
+        if (!job.running) {
+            return job;
+        }
+        if (job.total) {
+            btn.innerHTML = `<span class="spinner-border spinner-border-sm me-2"></span>Indexiere... ${job.processed}/${job.total}`;
+        }
+    }
+}
+
 async function startIndexing() {
     const btn = document.getElementById('btn-index');
     const originalHtml = btn.innerHTML;
@@ -433,12 +478,22 @@ async function startIndexing() {
         });
         const data = await response.json();
 
-        if (data.success) {
-            showToast(data.message, 'success');
-            loadIndexStatus();
-        } else {
+        if (!data.success) {
             showToast('Indexierung fehlgeschlagen: ' + (data.error || 'Unbekannter Fehler'), 'error');
+            return;
+        }
+
+        // Die Indexierung läuft im Hintergrund: Status abfragen, bis sie fertig ist
+        showToast(data.message, 'info');
+        const job = await waitForIndexing(btn);
+        if (job.statusError) {
+            showToast('Indexierungsstatus nicht abrufbar, die Indexierung läuft eventuell weiter: ' + job.statusError, 'warning');
+        } else if (job.error) {
+            showToast('Indexierung fehlgeschlagen: ' + job.error, 'error');
+        } else {
+            showToast(job.message || 'Indexierung abgeschlossen', 'success');
         }
+        loadIndexStatus();
     } catch (error) {
         console.error('Error indexing documents:', error);
         showToast('Fehler bei der Indexierung', 'error');
@@ -539,20 +594,18 @@ async function askQuestion() {
         const loadingId = 'loading-' + Date.now();
         addMessageToChat('assistant', '<span class="spinner-border spinner-border-sm me-2"></span>Suche in Dokumenten...', loadingId);
 
-        // Send request
-        const response = await fetch(`${API_BASE}/api/qa/ask`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                question: question,
-                n_context_docs: 5
-            })
+        // Send request (Antwort wird gestreamt und erscheint schon während der Generierung)
+        let streamedAnswer = '';
+        const data = await askStream({
+            question: question,
+            n_context_docs: 5
+        }, text => {
+            streamedAnswer += text;
+            const loadingMsg = document.getElementById(loadingId);
+            if (loadingMsg) loadingMsg.lastElementChild.textContent = streamedAnswer;
+            chatHistory.scrollTop = chatHistory.scrollHeight;
         });
 
-        const data = await response.json();
-
         // Remove loading message
         const loadingMsg = document.getElementById(loadingId);
         if (loadingMsg) loadingMsg.remove();
@@ -602,6 +655,48 @@ async function askQuestion() {
     }
 }
 
+async function askStream(body, onToken) {
+    // Server-Sent Events von /api/qa/ask: Token-Events, zum Schluss ein done-Event mit dem Ergebnis
+    const response = await fetch(`${API_BASE}/api/qa/ask`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ...body, stream: true })
+    });
+
+    // Fehler vor dem Streaming (z.B. fehlende Frage) kommen weiterhin als JSON
+    if (!(response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+        return await response.json();
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+
+        for (const event of events) {
+            if (!event.startsWith('data: ')) continue;
+            const data = JSON.parse(event.slice(6));
+
+            if (data.type === 'token') {
+                onToken(data.text);
+            } else if (data.type === 'error') {
+                return { success: false, error: data.error };
+            } else if (data.type === 'done') {
+                return { success: true, question: body.question, ...data.result };
+            }
+        }
+    }
+
+    return { success: false, error: 'Verbindung abgebrochen' };
+}
+
 function addMessageToChat(role, content, id = null) {
     const chatHistory = document.getElementById('chat-history');
 
@@ -796,19 +891,27 @@ async function askWithFilters() {
     try {
         resultsContainer.innerHTML = '<div class="text-center"><div class="spinner-border text-primary"></div><p class="mt-2">Beantworte Frage...</p></div>';
 
-        // Sende Frage mit Filtern
-        const response = await fetch(`${API_BASE}/api/qa/ask`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                question: query,
-                n_context_docs: 5,
-                filters: filters
-            })
+        // Sende Frage mit Filtern (Antwort wird gestreamt angezeigt)
+        let streamedAnswer = '';
+        const data = await askStream({
+            question: query,
+            n_context_docs: 5,
+            filters: filters
+        }, text => {
+            if (!streamedAnswer) {
+                resultsContainer.innerHTML = `
+                    <div class="card bg-light">
+                        <div class="card-body">
+                            <h5 class="card-title"><i class="bi bi-chat-dots"></i> Antwort</h5>
+                            <p class="card-text"></p>
+                        </div>
+                    </div>
+                `;
+            }
+            streamedAnswer += text;
+            resultsContainer.querySelector('.card-text').textContent = streamedAnswer;
         });
 
-        const data = await response.json();
-
         if (!data.success) {
             resultsContainer.innerHTML = `<div class="alert alert-danger">Fehler: ${data.error || 'Unbekannter Fehler'}</div>`;
             return;
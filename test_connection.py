@@ -7,6 +7,9 @@ import sys
 from dotenv import load_dotenv
 import requests
 
+# Eine Session für alle Tests: Ollama-Tests laufen über dieselbe Keep-Alive-Verbindung
+_session = requests.Session()
+
 def test_paperless_connection(url, token):
     """
     Testet Verbindung zu Paperless-NGX
@@ -14,7 +17,13 @@ def test_paperless_connection(url, token):
     print(f"\n[1] Teste Paperless-NGX Verbindung: {url}")
     try:
         headers = {'Authorization': f'Token {token}'}
-        response = requests.get(f'{url}/api/documents/', headers=headers, timeout=10)
+        # page_size=1: für die Anzahl reicht die kleinste Seite
+        response = _session.get(
+            f'{url}/api/documents/',
+            headers=headers,
+            params={'page_size': 1, 'fields': 'id'},
+            timeout=10
+        )
         response.raise_for_status()
 
         doc_count = response.json()['count']
@@ -32,7 +41,7 @@ def test_ollama_connection(url, model):
     print(f"\n[2] Teste Ollama Verbindung: {url}")
     try:
         # Teste API Verfügbarkeit
-        response = requests.get(f'{url}/api/tags', timeout=10)
+        response = _session.get(f'{url}/api/tags', timeout=10)
         response.raise_for_status()
 
         models = response.json().get('models', [])
@@ -51,7 +60,7 @@ def test_ollama_connection(url, model):
 
         # Teste einfache Generation
         print(f"    Teste Generierung mit {model}...")
-        test_response = requests.post(
+        test_response = _session.post(
             f'{url}/api/generate',
             json={
                 'model': model,
@@ -3,51 +3,297 @@ Vector Store für semantische Dokumentensuche
 Nutzt ChromaDB für persistente Embedding-Speicherung
 """
 import os
+import re
 import logging
-from typing import List, Dict, Any, Optional, Union
+import sqlite3
+from typing import List, Dict, Any, Optional, Set, Union
+import numpy as np
 import chromadb
 from chromadb.config import Settings
 
 logger = logging.getLogger(__name__)
 
+Embedding = Union[List[float], np.ndarray]
+
+
+def _chroma_version() -> tuple:
+    """(major, minor) der installierten ChromaDB-Version"""
+    match = re.match(r'(\d+)\.(\d+)', getattr(chromadb, '__version__', ''))
+    return (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+
+
+# ChromaDB 0.4.x validiert Embeddings als Python-Listen, neuere Versionen nehmen
+# NumPy-Arrays direkt an (keine Umwandlung in Listen von Python-Floats)
+_CHROMA_ACCEPTS_NDARRAY = _chroma_version() >= (0, 6)
+
+
+def _to_chroma_embeddings(embeddings: List[Embedding]) -> Union[np.ndarray, List[List[float]]]:
+    """
+    Bringt Embeddings in das Format, das die installierte ChromaDB-Version erwartet
+
+    Die Vektoren werden auf Länge 1 normiert (beim Schreiben und bei der Suche): die
+    L2-Distanz entspricht dann 2 * Kosinus-Distanz, die Rangfolge ist die der Kosinus-Ähnlichkeit.
+    """
+    # Eine zusammenhängende float32-Matrix statt einzelner Listen
+    matrix = np.array(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    if _CHROMA_ACCEPTS_NDARRAY:
+        return matrix
+    return matrix.tolist()
+
+
+# Jeder Tag eines Dokuments wird als eigenes Bool-Feld gespeichert (tag_<Name>: True),
+# damit ChromaDB direkt danach filtern kann
+TAG_METADATA_PREFIX = 'tag_'
+
+
+def _to_chroma_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Zahlen und Bools bleiben erhalten (filterbar), alles andere wird zum String (None wird zu "")"""
+    return {
+        k: v if isinstance(v, (bool, int, float)) else str(v) if v is not None else ""
+        for k, v in metadata.items()
+    }
+
+
+def build_where_filter(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Baut aus einfachen Filtern eine ChromaDB where-clause
+
+    Args:
+        filters: Filter mit document_type, correspondent, year (bzw. created_year)
+            und tags (Liste, mindestens einer muss passen)
+
+    Returns:
+        where-clause (mehrere Bedingungen per $and verknüpft) oder None
+    """
+    if not filters:
+        return None
+
+    conditions = []
+    for key in ('document_type', 'correspondent'):
+        if filters.get(key):
+            conditions.append({key: filters[key]})
+
+    year = filters.get('year') or filters.get('created_year')
+    if year:
+        try:
+            conditions.append({'year': int(year)})
+        except (TypeError, ValueError):
+            logger.warning(f"Ungültiger Jahr-Filter ignoriert: {year}")
+
+    tags = filters.get('tags')
+    if isinstance(tags, str):
+        tags = [tags]
+    if tags:
+        tag_conditions = [{TAG_METADATA_PREFIX + tag: True} for tag in dict.fromkeys(tags)]
+        conditions.append(tag_conditions[0] if len(tag_conditions) == 1 else {'$or': tag_conditions})
+
+    # $and/$or verlangen mindestens zwei Bedingungen
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {'$and': conditions}
+
+
+def _parse_doc_id(chroma_id: str, metadata: Dict[str, Any]) -> int:
+    """Paperless-ID eines Treffers: aus den Metadaten, sonst aus der ChromaDB-ID (doc_123_chunk_0)"""
+    # Doc ID aus Metadaten holen (für Chunk-Support)
+    doc_id_str = metadata.get('doc_id_original', '')
+    if doc_id_str:
+        try:
+            return int(doc_id_str)
+        except ValueError:
+            pass
+    # Fallback für alte Einträge ohne doc_id_original
+    return int(chroma_id.replace('doc_', '').split('_chunk_')[0])
+
+
+# Optionale HNSW-Parameter aus .env (Umgebungsvariable -> ChromaDB-Metadaten-Key)
+_HNSW_ENV_PARAMS = {
+    'CHROMA_HNSW_M': 'hnsw:M',
+    'CHROMA_HNSW_EF_CONSTRUCTION': 'hnsw:construction_ef',
+    'CHROMA_HNSW_EF_SEARCH': 'hnsw:search_ef',
+}
+
+
+# Format der gespeicherten Embeddings, steht in den Collection-Metadaten: "unit" = auf Länge 1
+# normiert (_to_chroma_embeddings). Damit liefern /api/embed und /api/embeddings vergleichbare
+# Vektoren; ältere Collections enthalten unnormierte /api/embeddings-Vektoren ohne diesen Eintrag.
+EMBEDDING_FORMAT = 'unit'
+
+# Version der Chunk-Metadaten: 2 = Jahr als Zahl (year) und ein Bool-Feld pro Tag (tag_<Name>),
+# nach denen build_where_filter filtert; ältere Chunks haben diese Felder nicht
+METADATA_SCHEMA = 2
+
+# Aktuelles Index-Format (Collection-Metadaten)
+_INDEX_FORMAT = {'embedding_format': EMBEDDING_FORMAT, 'metadata_schema': METADATA_SCHEMA}
+
+
+def _collection_metadata() -> Dict[str, Any]:
+    """
+    Metadaten für die Dokumenten-Collection inkl. gesetzter HNSW-Parameter und Index-Format
+
+    ChromaDB übernimmt die HNSW-Parameter nur beim Anlegen der Collection: für eine
+    bestehende Collection wirken Änderungen erst nach einem Reset und neuer Indexierung.
+    """
+    metadata = {"description": "Paperless-NGX Dokumenten-Embeddings", **_INDEX_FORMAT}
+    for env_name, key in _HNSW_ENV_PARAMS.items():
+        value = os.getenv(env_name, '').strip()
+        if not value:
+            continue
+        try:
+            metadata[key] = int(value)
+        except ValueError:
+            logger.warning(f"Ungültiger Wert für {env_name}: '{value}' (ChromaDB-Standard wird genutzt)")
+    return metadata
+
 
 class VectorStore:
     """Vector Store für Dokumenten-Embeddings mit ChromaDB"""
 
-    def __init__(self, persist_directory: str = "data/chromadb"):
+    def __init__(
+        self,
+        persist_directory: str = "data/chromadb",
+        host: Optional[str] = None,
+        port: int = 8000
+    ):
         """
         Initialisiert den Vector Store
 
         Args:
-            persist_directory: Verzeichnis für persistente Speicherung
+            persist_directory: Verzeichnis für persistente Speicherung (nur ohne host)
+            host: Host eines ChromaDB-Servers (chroma run): Index liegt dann nicht im eigenen Prozess
+            port: Port des ChromaDB-Servers
         """
-        self.persist_directory = persist_directory
-        os.makedirs(persist_directory, exist_ok=True)
+        settings = Settings(
+            anonymized_telemetry=False,
+            allow_reset=True
+        )
 
         # ChromaDB Client initialisieren
-        self.client = chromadb.PersistentClient(
-            path=persist_directory,
-            settings=Settings(
-                anonymized_telemetry=False,
-                allow_reset=True
-            )
-        )
+        if host:
+            self.persist_directory = f"http://{host}:{port}"
+            self.client = chromadb.HttpClient(host=host, port=port, settings=settings)
+        else:
+            self.persist_directory = persist_directory
+            os.makedirs(persist_directory, exist_ok=True)
+            self.client = chromadb.PersistentClient(path=persist_directory, settings=settings)
+            if os.getenv('CHROMA_SQLITE_WAL', 'true').lower() == 'true':
+                self._enable_sqlite_wal()
 
         # Collection für Dokumente erstellen/laden
         self.collection = self.client.get_or_create_collection(
             name="paperless_documents",
-            metadata={"description": "Paperless-NGX Dokumenten-Embeddings"}
+            metadata=_collection_metadata()
         )
 
-        logger.info(f"VectorStore initialisiert: {persist_directory}")
+        # Zählt Schreibzugriffe, damit Caches über Suchergebnisse veraltete Einträge erkennen
+        self.generation = 0
+
+        logger.info(f"VectorStore initialisiert: {self.persist_directory}")
         logger.info(f"Anzahl Dokumente in Collection: {self.collection.count()}")
 
+        # Gründe, warum der bestehende Index neu aufgebaut werden muss (leer = aktuell)
+        self.reindex_reasons = self._check_index_format()
+
+    def _check_index_format(self) -> List[str]:
+        """
+        Vergleicht das Format der bestehenden Collection mit dem aktuellen (_INDEX_FORMAT)
+
+        Eine leere Collection wird einfach als aktuell markiert. Fehlt bei einer gefüllten
+        Collection ein Eintrag, wird an einem gespeicherten Chunk geprüft, ob er schon passt.
+
+        Returns:
+            Liste von Gründen für eine Neuindexierung (leer wenn das Format passt)
+        """
+        try:
+            metadata = self.collection.metadata or {}
+            if self.collection.count() == 0:
+                if any(metadata.get(key) != value for key, value in _INDEX_FORMAT.items()):
+                    self._update_collection_metadata(_INDEX_FORMAT)
+                return []
+
+            checks = (
+                ('embedding_format', self._stored_embeddings_normalized,
+                 "Embeddings wurden von einer älteren Version unnormiert gespeichert: "
+                 "die Suche sortiert nach Vektorlänge statt nach Bedeutung"),
+                ('metadata_schema', self._stored_metadata_current,
+                 "Chunks ohne Jahr- und Tag-Felder (ältere Version): Jahr- und Tag-Filter finden sie nicht"),
+            )
+            reasons = []
+            updates = {}
+            for key, is_current, reason in checks:
+                value = metadata.get(key)
+                if value == _INDEX_FORMAT[key]:
+                    continue
+                if value is None and is_current():
+                    updates[key] = _INDEX_FORMAT[key]
+                else:
+                    reasons.append(reason)
+            if updates:
+                self._update_collection_metadata(updates)
+
+            for reason in reasons:
+                logger.error(f"Index muss neu aufgebaut werden (Indexierung starten): {reason}")
+            return reasons
+
+        except Exception as e:
+            logger.warning(f"Format des Index konnte nicht geprüft werden: {e}")
+            return []
+
+    def _stored_embeddings_normalized(self) -> bool:
+        """Prüft an einem gespeicherten Vektor, ob er auf Länge 1 normiert ist"""
+        sample = self.collection.get(limit=1, include=['embeddings'])['embeddings']
+        if sample is None or len(sample) == 0:
+            return True
+        return abs(float(np.linalg.norm(np.asarray(sample[0], dtype=np.float32))) - 1.0) < 1e-3
+
+    def _stored_metadata_current(self) -> bool:
+        """Prüft an einem gespeicherten Chunk, ob er schon das year-Feld hat"""
+        sample = self.collection.get(limit=1, include=['metadatas'])['metadatas']
+        return bool(sample) and 'year' in (sample[0] or {})
+
+    def _update_collection_metadata(self, updates: Dict[str, Any]):
+        """Ergänzt die Collection-Metadaten (modify ersetzt sie komplett, daher mit den bisherigen)"""
+        self.collection.modify(metadata={**(self.collection.metadata or {}), **updates})
+
+    def mark_index_current(self):
+        """Markiert den Index nach einer vollständigen Neuindexierung als aktuell"""
+        try:
+            self._update_collection_metadata(_INDEX_FORMAT)
+            self.reindex_reasons = []
+            logger.info("Index-Format aktualisiert")
+        except Exception as e:
+            logger.error(f"Index-Format konnte nicht gespeichert werden: {e}")
+
+    def _enable_sqlite_wal(self):
+        """
+        Stellt die SQLite-Datei von ChromaDB auf WAL um
+
+        ChromaDB nutzt den Standard-Journal-Modus mit mehreren fsyncs pro add(); im
+        WAL-Modus sind Schreibzugriffe um ein Vielfaches schneller und weiterhin absturzsicher.
+        Der Modus wird in der Datei gespeichert und gilt für alle Verbindungen von ChromaDB.
+        """
+        db_file = os.path.join(self.persist_directory, 'chroma.sqlite3')
+        if not os.path.exists(db_file):
+            return
+        try:
+            conn = sqlite3.connect(db_file, timeout=5)
+            try:
+                mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+            finally:
+                conn.close()
+            logger.debug(f"ChromaDB SQLite Journal-Modus: {mode}")
+        except sqlite3.Error as e:
+            logger.warning(f"WAL-Modus für ChromaDB konnte nicht gesetzt werden: {e}")
+
     def add_document(
         self,
         doc_id: Union[int, str],
         text: str,
-        embedding: List[float],
-        metadata: Dict[str, Any]
+        embedding: Embedding,
+        metadata: Dict[str, Any],
+        upsert: bool = False
     ) -> bool:
         """
         Fügt ein Dokument zum Vector Store hinzu
@@ -57,16 +303,14 @@ class VectorStore:
             text: Dokumententext (für Anzeige bei Suchergebnissen)
             embedding: Embedding-Vektor
             metadata: Metadaten (title, correspondent, doc_type, etc.)
+            upsert: Vorhandenen Eintrag mit gleicher ID überschreiben (ohne vorherige Existenzprüfung)
 
         Returns:
             True wenn erfolgreich
         """
         try:
             # ChromaDB erwartet strings für alle Metadaten
-            safe_metadata = {
-                k: str(v) if v is not None else ""
-                for k, v in metadata.items()
-            }
+            safe_metadata = _to_chroma_metadata(metadata)
 
             # ID formatieren: wenn int, dann "doc_{id}", wenn schon string, dann as-is
             if isinstance(doc_id, int):
@@ -74,12 +318,14 @@ class VectorStore:
             else:
                 chroma_id = f"doc_{doc_id}"  # String wie "123_chunk_0" → "doc_123_chunk_0"
 
-            self.collection.add(
+            write = self.collection.upsert if upsert else self.collection.add
+            write(
                 ids=[chroma_id],
-                embeddings=[embedding],
+                embeddings=_to_chroma_embeddings([embedding]),
                 documents=[text],
                 metadatas=[safe_metadata]
             )
+            self.generation += 1
 
             logger.debug(f"Dokument {doc_id} zum Vector Store hinzugefügt")
             return True
@@ -90,39 +336,40 @@ class VectorStore:
 
     def add_documents_batch(
         self,
-        doc_ids: List[int],
+        doc_ids: List[Union[int, str]],
         texts: List[str],
-        embeddings: List[List[float]],
-        metadatas: List[Dict[str, Any]]
+        embeddings: List[Embedding],
+        metadatas: List[Dict[str, Any]],
+        upsert: bool = False
     ) -> bool:
         """
         Fügt mehrere Dokumente in einem Batch hinzu
 
         Args:
-            doc_ids: Liste von Paperless Dokument-IDs
+            doc_ids: Liste von Paperless Dokument-IDs oder Chunk-IDs (wie "123_chunk_0")
             texts: Liste von Dokumententexten
             embeddings: Liste von Embedding-Vektoren
             metadatas: Liste von Metadaten
+            upsert: Vorhandene Einträge mit gleicher ID überschreiben statt sie zu behalten
 
         Returns:
             True wenn erfolgreich
         """
         try:
             # Metadaten konvertieren
-            safe_metadatas = [
-                {k: str(v) if v is not None else "" for k, v in meta.items()}
-                for meta in metadatas
-            ]
+            safe_metadatas = [_to_chroma_metadata(meta) for meta in metadatas]
 
             # IDs erstellen
             ids = [f"doc_{doc_id}" for doc_id in doc_ids]
 
-            self.collection.add(
+            write = self.collection.upsert if upsert else self.collection.add
+            write(
                 ids=ids,
-                embeddings=embeddings,
+                embeddings=_to_chroma_embeddings(embeddings),
                 documents=texts,
                 metadatas=safe_metadatas
             )
+            self.generation += 1
 
             logger.info(f"Batch von {len(doc_ids)} Dokumenten zum Vector Store hinzugefügt")
             return True
@@ -133,7 +380,7 @@ class VectorStore:
 
     def search(
         self,
-        query_embedding: List[float],
+        query_embedding: Embedding,
         n_results: int = 5,
         where: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
@@ -148,48 +395,66 @@ class VectorStore:
         Returns:
             Liste von Suchergebnissen mit Dokumenten und Metadaten
         """
+        return self.search_batch([query_embedding], n_results=n_results, where=where)[0]
+
+    def search_batch(
+        self,
+        query_embeddings: List[Embedding],
+        n_results: int = 5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Semantische Suche für mehrere Anfragen mit gleichen Filtern in einem ChromaDB-Aufruf
+
+        Args:
+            query_embeddings: Embeddings der Suchanfragen
+            n_results: Anzahl der Ergebnisse pro Anfrage
+            where: Filter-Bedingungen (z.B. {"doc_type": "invoice"})
+
+        Returns:
+            Eine Ergebnisliste pro Anfrage (Reihenfolge wie query_embeddings), bei Fehler leere Listen
+        """
+        if not query_embeddings:
+            return []
+
         try:
             results = self.collection.query(
-                query_embeddings=[query_embedding],
+                query_embeddings=_to_chroma_embeddings(query_embeddings),
                 n_results=n_results,
-                where=where
+                where=where,
+                # Embeddings der Treffer werden nicht gebraucht (unabhängig vom Standard der ChromaDB-Version)
+                include=['documents', 'metadatas', 'distances']
             )
 
-            # Ergebnisse formatieren
-            formatted_results = []
-            for i in range(len(results['ids'][0])):
-                metadata = results['metadatas'][0][i]
-
-                # Doc ID aus Metadaten holen (für Chunk-Support)
-                doc_id_str = metadata.get('doc_id_original', '')
-                if doc_id_str:
-                    try:
-                        doc_id = int(doc_id_str)
-                    except:
-                        # Fallback: parse from ChromaDB ID
-                        chroma_id = results['ids'][0][i].replace('doc_', '')
-                        doc_id = int(chroma_id.split('_chunk_')[0]) if '_chunk_' in chroma_id else int(chroma_id)
-                else:
-                    # Fallback für alte Einträge ohne doc_id_original
-                    chroma_id = results['ids'][0][i].replace('doc_', '')
-                    doc_id = int(chroma_id.split('_chunk_')[0]) if '_chunk_' in chroma_id else int(chroma_id)
-
-                formatted_results.append({
-                    'doc_id': doc_id,
-                    'chunk_id': results['ids'][0][i],
-                    'chunk_number': metadata.get('chunk_number', '0'),
-                    'total_chunks': metadata.get('total_chunks', '1'),
-                    'text': results['documents'][0][i],
-                    'metadata': metadata,
-                    'distance': results['distances'][0][i] if 'distances' in results else None
-                })
-
-            logger.info(f"Suche abgeschlossen: {len(formatted_results)} Ergebnisse gefunden")
-            return formatted_results
+            # Ergebnisse formatieren (Spalten pro Anfrage gemeinsam durchlaufen)
+            all_distances = results.get('distances')
+            formatted = []
+            for q, ids in enumerate(results['ids']):
+                distances = all_distances[q] if all_distances else [None] * len(ids)
+                formatted.append([
+                    {
+                        'doc_id': _parse_doc_id(chroma_id, metadata),
+                        'chunk_id': chroma_id,
+                        'chunk_number': metadata.get('chunk_number', '0'),
+                        'total_chunks': metadata.get('total_chunks', '1'),
+                        'text': text,
+                        'metadata': metadata,
+                        'distance': distance
+                    }
+                    for chroma_id, metadata, text, distance in zip(
+                        ids, results['metadatas'][q], results['documents'][q], distances
+                    )
+                ])
+
+            logger.info(
+                f"Suche abgeschlossen: {sum(len(r) for r in formatted)} Ergebnisse "
+                f"für {len(formatted)} Anfrage(n) gefunden"
+            )
+            return formatted
 
         except Exception as e:
             logger.error(f"Fehler bei der Suche: {e}")
-            return []
+            return [[] for _ in query_embeddings]
 
     def document_exists(self, doc_id: Union[int, str]) -> bool:
         """
@@ -207,11 +472,48 @@ class VectorStore:
             else:
                 chroma_id = f"doc_{doc_id}"
 
-            result = self.collection.get(ids=[chroma_id])
+            result = self.collection.get(ids=[chroma_id], include=[])
             return len(result['ids']) > 0
         except:
             return False
 
+    def get_indexed_doc_ids(self, page_size: int = 10000) -> Set[int]:
+        """
+        Gibt die Paperless-IDs aller Dokumente zurück, von denen mindestens ein Chunk indexiert ist
+
+        Lädt nur die IDs (keine Embeddings, Texte oder Metadaten), seitenweise.
+
+        Args:
+            page_size: Anzahl IDs pro Abfrage
+
+        Returns:
+            Set von Paperless Dokument-IDs
+        """
+        doc_ids = set()
+        offset = 0
+
+        try:
+            while True:
+                result = self.collection.get(include=[], limit=page_size, offset=offset)
+                ids = result['ids']
+
+                for chroma_id in ids:
+                    # "doc_123_chunk_0" bzw. alte Einträge "doc_123"
+                    raw_id = chroma_id.replace('doc_', '', 1).split('_chunk_')[0]
+                    try:
+                        doc_ids.add(int(raw_id))
+                    except ValueError:
+                        logger.debug(f"Unbekanntes ID-Format im Vector Store: {chroma_id}")
+
+                if len(ids) < page_size:
+                    break
+                offset += page_size
+
+        except Exception as e:
+            logger.error(f"Fehler beim Laden der indexierten IDs: {e}")
+
+        return doc_ids
+
     def delete_document(self, doc_id: Union[int, str]) -> bool:
         """
         Löscht ein Dokument aus dem Vector Store
@@ -229,6 +531,7 @@ class VectorStore:
                 chroma_id = f"doc_{doc_id}"
 
             self.collection.delete(ids=[chroma_id])
+            self.generation += 1
             logger.info(f"Dokument {doc_id} aus Vector Store gelöscht")
             return True
         except Exception as e:
@@ -246,20 +549,86 @@ class VectorStore:
             True wenn erfolgreich
         """
         try:
-            # Hole alle Dokumente mit dieser doc_id_original
-            all_docs = self.collection.get(
-                where={"doc_id_original": str(doc_id)}
-            )
-
-            if all_docs['ids']:
-                self.collection.delete(ids=all_docs['ids'])
-                logger.info(f"Alle {len(all_docs['ids'])} Chunks von Dokument {doc_id} gelöscht")
-                return True
+            # Chunk-IDs sind deterministisch (doc_123_chunk_N): die Anzahl steht in den Metadaten
+            # von Chunk 0, gelöscht wird dann per ID-Liste statt per Metadaten-Filter
+            first = self.collection.get(ids=[f"doc_{doc_id}_chunk_0"], include=['metadatas'])
+            total_chunks = None
+            if first['ids']:
+                try:
+                    total_chunks = int(first['metadatas'][0].get('total_chunks', ''))
+                except ValueError:
+                    pass
+
+            if total_chunks is not None:
+                ids = [f"doc_{doc_id}_chunk_{i}" for i in range(total_chunks)]
+                # Alter Eintrag ohne Chunks ("doc_123"), falls noch vorhanden
+                ids.append(f"doc_{doc_id}")
+                self.collection.delete(ids=ids)
+            else:
+                # Chunk 0 fehlt (z.B. Embedding fehlgeschlagen) oder ohne Anzahl: per Filter löschen
+                self.collection.delete(where={"doc_id_original": str(doc_id)})
+            self.generation += 1
+            logger.info(f"Alle Chunks von Dokument {doc_id} gelöscht")
             return True
         except Exception as e:
             logger.error(f"Fehler beim Löschen aller Chunks von Dokument {doc_id}: {e}")
             return False
 
+    def delete_stale_document_chunks(self, doc_id: int, total_chunks: int) -> bool:
+        """
+        Löscht die Chunks eines Dokuments ab chunk_number total_chunks
+
+        Nach einer Neuindexierung per upsert bleiben sonst überzählige Chunks einer
+        früheren, längeren Fassung des Dokuments stehen.
+
+        Args:
+            doc_id: Paperless Dokument-ID (ohne chunk suffix)
+            total_chunks: Anzahl der aktuellen Chunks (0 bis total_chunks - 1 bleiben erhalten)
+
+        Returns:
+            True wenn erfolgreich
+        """
+        try:
+            existing = self.collection.get(where={"doc_id_original": str(doc_id)}, include=['metadatas'])
+            stale = []
+            for chroma_id, metadata in zip(existing['ids'], existing['metadatas']):
+                try:
+                    chunk_number = int((metadata or {}).get('chunk_number', ''))
+                except ValueError:
+                    chunk_number = None
+                if chunk_number is None or chunk_number >= total_chunks:
+                    stale.append(chroma_id)
+
+            # Alter Eintrag ohne Chunks ("doc_123"), falls noch vorhanden
+            if self.collection.get(ids=[f"doc_{doc_id}"], include=[])['ids']:
+                stale.append(f"doc_{doc_id}")
+
+            if stale:
+                self.collection.delete(ids=stale)
+                self.generation += 1
+                logger.debug(f"{len(stale)} veraltete Chunks von Dokument {doc_id} gelöscht")
+            return True
+        except Exception as e:
+            logger.error(f"Fehler beim Löschen veralteter Chunks von Dokument {doc_id}: {e}")
+            return False
+
+    def warm_up(self):
+        """
+        Führt eine Suche mit einem gespeicherten Embedding aus, damit ChromaDB den
+        HNSW-Index schon vor der ersten echten Anfrage in den Speicher lädt
+        """
+        try:
+            sample = self.collection.get(limit=1, include=['embeddings'])
+            embeddings = sample['embeddings']
+            if embeddings is None or len(embeddings) == 0:
+                return
+            self.collection.query(
+                query_embeddings=_to_chroma_embeddings([embeddings[0]]), n_results=1, include=['distances']
+            )
+            logger.info("Vector Store Index vorgeladen")
+        except Exception as e:
+            logger.warning(f"Vorladen des Vector Store Index fehlgeschlagen: {e}")
+
     def get_stats(self) -> Dict[str, Any]:
         """
         Gibt Statistiken über den Vector Store zurück
@@ -281,10 +650,12 @@ class VectorStore:
         """
         try:
             self.client.delete_collection(name="paperless_documents")
+            self.generation += 1
             self.collection = self.client.get_or_create_collection(
                 name="paperless_documents",
-                metadata={"description": "Paperless-NGX Dokumenten-Embeddings"}
+                metadata=_collection_metadata()
             )
+            self.reindex_reasons = []
             logger.info("Vector Store wurde zurückgesetzt")
             return True
         except Exception as e:
@@ -1,27 +1,67 @@
 """
 Flask Web Interface für Paperless-NGX AI Agent
 """
+import atexit
+import functools
 import os
 import json
-from flask import Flask, render_template, request, jsonify
+import threading
+from datetime import datetime
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from flask import Flask, Response, render_template, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv, set_key, find_dotenv
 from database import DocumentDatabase
 from config import DOCUMENT_TYPES, PERSON_TAGS, CORRESPONDENTS
-from paperless_client import PaperlessClient
+from paperless_client import PaperlessClient, LIST_FIELDS
 from ollama_classifier import OllamaClassifier
 from embedding_service import EmbeddingService
-from vector_store import VectorStore
+from vector_store import VectorStore, build_where_filter
 from document_indexer import DocumentIndexer
 from qa_system import QASystem
+from llm_cache import LLMResultCache
+from classification_cache import SemanticClassificationCache
+import json_utils
 import logging
 
 # Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    jsonify über orjson (deutlich schneller bei großen Ergebnislisten mit Dokumenttexten)
+
+    Datum/Uhrzeit und unbekannte Typen laufen weiter über Flasks Standard-Konvertierung;
+    ohne orjson oder mit Einrückung (indent, Debug-Modus) wird der Flask-Standard genutzt.
+    """
+
+    def dumps(self, obj, **kwargs):
+        orjson = json_utils.orjson
+        # orjson schreibt immer kompakt: separators ist damit abgedeckt, indent nicht
+        if orjson is None or kwargs.get('indent') is not None:
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(
+                obj,
+                default=self.default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            ).decode('utf-8')
+        except TypeError:
+            return super().dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return json_utils.loads(s)
+
+
 # Flask App
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 # Datenverzeichnis erstellen falls nicht vorhanden
@@ -31,47 +71,65 @@ os.makedirs(DATA_DIR, exist_ok=True)
 # Database
 DB_PATH = os.path.join(DATA_DIR, 'processed_documents.db')
 db = DocumentDatabase(db_path=DB_PATH)
+# Ausstehende Schreibzugriffe des Hintergrund-Writers beim Beenden schreiben
+atexit.register(db.close)
 
 # .env Datei laden
 load_dotenv()
 ENV_FILE = find_dotenv()
 
+# Session für die Verbindungstests (Keep-Alive bei wiederholten Tests)
+_http_session = requests.Session()
+
 # Q&A Services (lazy initialization - wird bei Bedarf initialisiert)
 embedding_service = None
 vector_store = None
 document_indexer = None
 qa_system = None
+classification_cache = None
+# Schützt die einmalige Initialisierung (Warm-up-Thread und Requests laufen parallel)
+_qa_services_lock = threading.Lock()
+_classification_cache_lock = threading.Lock()
 
+# Status der Hintergrund-Indexierung (es läuft höchstens eine gleichzeitig)
+_index_job_lock = threading.Lock()
+_index_job: Dict = {'running': False}
 
-def get_qa_services():
-    """Initialisiert Q&A Services wenn benötigt"""
-    global embedding_service, vector_store, document_indexer, qa_system
 
-    if qa_system is None:
-        ollama_url = os.getenv('OLLAMA_URL', 'http://localhost:11434')
-        embedding_model = os.getenv('EMBEDDING_MODEL', 'nomic-embed-text')
+@functools.lru_cache(maxsize=4)
+def get_paperless_client(paperless_url: str, paperless_token: str) -> PaperlessClient:
+    """
+    Gemeinsamer PaperlessClient pro URL/Token für alle Requests
 
-        # Embedding Service
-        logger.info(f"Initialisiere Embedding Service mit Modell: {embedding_model}")
-        embedding_service = EmbeddingService(ollama_url=ollama_url, model=embedding_model)
+    Wiederverwendet Session (Keep-Alive) und ID -> Name Caches; nach geänderten
+    Einstellungen entsteht über den neuen Key automatisch ein neuer Client.
+    """
+    return PaperlessClient(paperless_url, paperless_token)
 
-        # Vector Store
-        vector_store_path = os.path.join(DATA_DIR, 'chromadb')
-        vector_store = VectorStore(persist_directory=vector_store_path)
 
-        # Document Indexer
-        paperless_url = os.getenv('PAPERLESS_URL')
-        paperless_token = os.getenv('PAPERLESS_TOKEN')
-        if paperless_url and paperless_token:
-            paperless_client = PaperlessClient(paperless_url, paperless_token)
-            document_indexer = DocumentIndexer(paperless_client, embedding_service, vector_store)
+@functools.lru_cache(maxsize=4)
+def get_classifier(ollama_url: str, ollama_model: str) -> OllamaClassifier:
+    """
+    Gemeinsamer OllamaClassifier pro URL/Modell (Session und Prompt-Cache bleiben erhalten)
 
-        # Q&A System
-        ollama_model = os.getenv('OLLAMA_MODEL', 'qwen2.5:14b-instruct')
-        ollama_classifier = OllamaClassifier(ollama_url, ollama_model)
-        qa_system = QASystem(embedding_service, vector_store, ollama_classifier)
+    Der Klassifizierungs-Cache ist nicht Teil des Keys, sonst entstünde pro Aufrufvariante
+    ein eigener Client; er wird bei Bedarf über classifier.cache gesetzt.
+    """
+    return OllamaClassifier(ollama_url, ollama_model)
 
-        logger.info("Q&A Services initialisiert")
+
+def get_qa_services():
+    """
+    Initialisiert Q&A Services wenn benötigt
+
+    Thread-sicher: Warm-up-Thread und erste Requests können gleichzeitig hier ankommen,
+    gebaut wird nur einmal. qa_system wird zuletzt gesetzt, damit ein Aufrufer ohne Lock
+    nie halb initialisierte Services sieht.
+    """
+    if qa_system is None:
+        with _qa_services_lock:
+            if qa_system is None:
+                _init_qa_services()
 
     return {
         'embedding_service': embedding_service,
@@ -81,6 +139,69 @@ def get_qa_services():
     }
 
 
+def _init_qa_services():
+    """Baut die Q&A Services auf (nur unter _qa_services_lock aufrufen)"""
+    global embedding_service, vector_store, document_indexer, qa_system
+
+    ollama_url = os.getenv('OLLAMA_URL', 'http://localhost:11434')
+    embedding_model = os.getenv('EMBEDDING_MODEL', 'nomic-embed-text')
+
+    # Embedding Service
+    logger.info(f"Initialisiere Embedding Service mit Modell: {embedding_model}")
+    new_embedding_service = EmbeddingService(ollama_url=ollama_url, model=embedding_model)
+
+    # Vector Store
+    vector_store_path = os.path.join(DATA_DIR, 'chromadb')
+    new_vector_store = VectorStore(
+        persist_directory=vector_store_path,
+        host=os.getenv('CHROMA_HOST') or None,
+        port=int(os.getenv('CHROMA_PORT', '8000'))
+    )
+
+    # Document Indexer
+    new_document_indexer = None
+    paperless_url = os.getenv('PAPERLESS_URL')
+    paperless_token = os.getenv('PAPERLESS_TOKEN')
+    if paperless_url and paperless_token:
+        paperless_client = get_paperless_client(paperless_url, paperless_token)
+        new_document_indexer = DocumentIndexer(paperless_client, new_embedding_service, new_vector_store)
+
+    # Q&A System
+    ollama_model = os.getenv('OLLAMA_MODEL', 'qwen2.5:14b-instruct')
+    ollama_classifier = get_classifier(ollama_url, ollama_model)
+    llm_cache = LLMResultCache(
+        db_path=os.path.join(DATA_DIR, 'qa_llm_cache.db'),
+        ttl=float(os.getenv('QA_LLM_CACHE_TTL', '86400'))
+    )
+    new_qa_system = QASystem(new_embedding_service, new_vector_store, ollama_classifier, llm_cache=llm_cache)
+
+    embedding_service = new_embedding_service
+    vector_store = new_vector_store
+    document_indexer = new_document_indexer
+    qa_system = new_qa_system
+
+    logger.info("Q&A Services initialisiert")
+
+
+def get_classification_cache():
+    """Initialisiert den Klassifizierungs-Cache wenn über .env aktiviert (sonst None)"""
+    global classification_cache
+
+    if os.getenv('USE_CLASSIFICATION_CACHE', 'false').lower() != 'true':
+        return None
+
+    if classification_cache is None:
+        services = get_qa_services()
+        with _classification_cache_lock:
+            if classification_cache is None:
+                classification_cache = SemanticClassificationCache(
+                    services['embedding_service'],
+                    persist_directory=os.path.join(DATA_DIR, 'classification_cache')
+                )
+
+    return classification_cache
+
+
 @app.route('/')
 def index():
     """Hauptseite"""
@@ -112,6 +233,8 @@ def update_settings():
 
             # Umgebungsvariablen neu laden
             load_dotenv(override=True)
+            # Clients samt gecachter Tags/Typen/Korrespondenten mit den neuen Einstellungen neu anlegen
+            get_paperless_client.cache_clear()
 
             return jsonify({'success': True, 'message': 'Einstellungen gespeichert'})
         else:
@@ -135,12 +258,17 @@ def get_config():
 def get_processed_documents():
     """Gibt alle verarbeiteten Dokumente zurück"""
     try:
-        documents = db.get_all_processed_documents()
         stats = db.get_statistics()
-        return jsonify({
-            'documents': documents,
-            'statistics': stats
-        })
+        documents = db.iter_processed_documents()
+
+        # Antwort stückweise senden (gleiches JSON-Format), statt alle Dokumente vorher zu serialisieren
+        def generate():
+            yield b'{"documents":['
+            for i, doc in enumerate(documents):
+                yield (b',' if i else b'') + json_utils.dumps(doc)
+            yield b'],"statistics":' + json_utils.dumps(stats) + b'}\n'
+
+        return Response(generate(), mimetype='application/json')
     except Exception as e:
         logger.error(f"Error getting processed documents: {e}")
         return jsonify({'error': str(e)}), 500
@@ -170,13 +298,14 @@ def get_pending_documents():
         if not paperless_url or not paperless_token:
             return jsonify({'error': 'Paperless-Einstellungen nicht konfiguriert'}), 400
 
-        paperless = PaperlessClient(paperless_url, paperless_token)
-        all_ki_documents = paperless.get_documents_by_tag('KI')
+        paperless = get_paperless_client(paperless_url, paperless_token)
+        all_ki_documents = paperless.get_documents_by_tag('KI', fields=LIST_FIELDS)
 
         # Filtere bereits verarbeitete Dokumente heraus
+        processed_ids = db.get_processed_ids([doc['id'] for doc in all_ki_documents])
         pending = []
         for doc in all_ki_documents:
-            if not db.is_document_processed(doc['id']):
+            if doc['id'] not in processed_ids:
                 pending.append({
                     'id': doc['id'],
                     'title': doc.get('title', 'Unbekannt'),
@@ -190,6 +319,120 @@ def get_pending_documents():
         return jsonify({'error': str(e)}), 500
 
 
+def _load_lookups(paperless: PaperlessClient) -> Tuple[Dict[str, int], Dict[str, int], Dict[str, int]]:
+    """
+    Lädt Dokumenttypen, Korrespondenten und Tags (Name -> ID) parallel
+
+    Der PaperlessClient hält die Tabellen ohnehin 60s vor; sind sie abgelaufen, kostet
+    das Neuladen so nur einen statt drei aufeinanderfolgende Requests an Paperless.
+    """
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        doc_types = executor.submit(paperless.get_all_document_types)
+        correspondents = executor.submit(paperless.get_all_correspondents)
+        all_tags = executor.submit(paperless.get_all_tags)
+        return doc_types.result(), correspondents.result(), all_tags.result()
+
+
+def _apply_classification(
+    doc_id: int,
+    content: str,
+    classification: Optional[Dict],
+    paperless: PaperlessClient,
+    classifier: OllamaClassifier,
+    doc_types: Dict[str, int],
+    correspondents: Dict[str, int],
+    all_tags: Dict[str, int]
+) -> Tuple[Dict, tuple]:
+    """
+    Schreibt die Klassifizierung eines Dokuments nach Paperless
+
+    Returns:
+        (Ergebnis für die API-Antwort, Zeile für db.add_processed_documents_bulk)
+    """
+    try:
+        if not content:
+            return ({
+                'document_id': doc_id,
+                'success': False,
+                'error': 'Kein Inhalt gefunden'
+            }, (doc_id, 'Unbekannt', {}, False, 'Kein Inhalt gefunden'))
+
+        # Klassifizierung
+        validated = classifier.validate_classification(classification)
+
+        if not validated:
+            return ({
+                'document_id': doc_id,
+                'success': False,
+                'error': 'Klassifizierung fehlgeschlagen'
+            }, (doc_id, 'Unbekannt', {}, False, 'Klassifizierung fehlgeschlagen'))
+
+        # Metadaten vorbereiten (wie in main.py)
+        updates = {}
+
+        if 'document_type' in validated:
+            doc_type_id = doc_types.get(validated['document_type'])
+            if doc_type_id:
+                updates['document_type'] = doc_type_id
+
+        if 'correspondent' in validated:
+            correspondent_id = correspondents.get(validated['correspondent'])
+            if correspondent_id:
+                updates['correspondent'] = correspondent_id
+
+        if 'person_tags' in validated and validated['person_tags']:
+            tag_ids = [all_tags[tag] for tag in validated['person_tags'] if tag in all_tags]
+            ki_tag_id = all_tags.get('KI')
+            if ki_tag_id:
+                tag_ids.append(ki_tag_id)
+            if tag_ids:
+                updates['tags'] = list(set(tag_ids))
+
+        if 'date' in validated:
+            updates['created'] = validated['date']
+
+        # Titel generieren
+        title_parts = []
+        if 'date' in validated:
+            title_parts.append(validated['date'])
+        if 'document_type' in validated:
+            title_parts.append(validated['document_type'].lower().replace(' ', '_'))
+        if 'correspondent' in validated:
+            title_parts.append(validated['correspondent'].lower().replace(' ', '_'))
+        if 'person_tags' in validated and validated['person_tags']:
+            persons = '_'.join([p.lower() for p in validated['person_tags']])
+            title_parts.append(persons)
+
+        if title_parts:
+            new_title = '_'.join(title_parts)
+            updates['title'] = new_title
+
+        # Updates anwenden
+        if updates:
+            success = paperless.update_document(doc_id, updates)
+            return ({
+                'document_id': doc_id,
+                'success': success,
+                'classification': validated,
+                'updates': updates
+            }, (doc_id, updates.get('title', 'Unbekannt'), validated, success))
+
+        return ({
+            'document_id': doc_id,
+            'success': True,
+            'classification': validated,
+            'message': 'Keine Updates notwendig'
+        }, (doc_id, 'Unbekannt', validated, True))
+
+    except Exception as e:
+        logger.error(f"Error processing document {doc_id}: {e}")
+        return ({
+            'document_id': doc_id,
+            'success': False,
+            'error': str(e)
+        }, (doc_id, 'Unbekannt', {}, False, str(e)))
+
+
 @app.route('/api/documents/process', methods=['POST'])
 def process_documents():
     """Verarbeitet ausstehende Dokumente"""
@@ -210,106 +453,39 @@ def process_documents():
             return jsonify({'error': 'Konfiguration unvollständig'}), 400
 
         # Clients initialisieren
-        paperless = PaperlessClient(paperless_url, paperless_token)
-        classifier = OllamaClassifier(ollama_url, ollama_model)
-
-        results = []
-        for doc_id in document_ids:
-            try:
-                # Dokument-Inhalt abrufen
-                content = paperless.get_document_content(doc_id)
-                if not content:
-                    results.append({
-                        'document_id': doc_id,
-                        'success': False,
-                        'error': 'Kein Inhalt gefunden'
-                    })
-                    db.add_processed_document(doc_id, 'Unbekannt', {}, False, 'Kein Inhalt gefunden')
-                    continue
-
-                # Klassifizierung
-                classification = classifier.classify_document(content)
-                validated = classifier.validate_classification(classification)
-
-                if not validated:
-                    results.append({
-                        'document_id': doc_id,
-                        'success': False,
-                        'error': 'Klassifizierung fehlgeschlagen'
-                    })
-                    db.add_processed_document(doc_id, 'Unbekannt', {}, False, 'Klassifizierung fehlgeschlagen')
-                    continue
-
-                # Metadaten vorbereiten (wie in main.py)
-                updates = {}
-
-                if 'document_type' in validated:
-                    doc_types = paperless.get_all_document_types()
-                    doc_type_id = doc_types.get(validated['document_type'])
-                    if doc_type_id:
-                        updates['document_type'] = doc_type_id
-
-                if 'correspondent' in validated:
-                    correspondents = paperless.get_all_correspondents()
-                    correspondent_id = correspondents.get(validated['correspondent'])
-                    if correspondent_id:
-                        updates['correspondent'] = correspondent_id
-
-                if 'person_tags' in validated and validated['person_tags']:
-                    all_tags = paperless.get_all_tags()
-                    tag_ids = [all_tags[tag] for tag in validated['person_tags'] if tag in all_tags]
-                    ki_tag_id = all_tags.get('KI')
-                    if ki_tag_id:
-                        tag_ids.append(ki_tag_id)
-                    if tag_ids:
-                        updates['tags'] = list(set(tag_ids))
-
-                if 'date' in validated:
-                    updates['created'] = validated['date']
-
-                # Titel generieren
-                title_parts = []
-                if 'date' in validated:
-                    title_parts.append(validated['date'])
-                if 'document_type' in validated:
-                    title_parts.append(validated['document_type'].lower().replace(' ', '_'))
-                if 'correspondent' in validated:
-                    title_parts.append(validated['correspondent'].lower().replace(' ', '_'))
-                if 'person_tags' in validated and validated['person_tags']:
-                    persons = '_'.join([p.lower() for p in validated['person_tags']])
-                    title_parts.append(persons)
-
-                if title_parts:
-                    new_title = '_'.join(title_parts)
-                    updates['title'] = new_title
-
-                # Updates anwenden
-                if updates:
-                    success = paperless.update_document(doc_id, updates)
-                    results.append({
-                        'document_id': doc_id,
-                        'success': success,
-                        'classification': validated,
-                        'updates': updates
-                    })
-                    db.add_processed_document(doc_id, updates.get('title', 'Unbekannt'), validated, success)
-                else:
-                    results.append({
-                        'document_id': doc_id,
-                        'success': True,
-                        'classification': validated,
-                        'message': 'Keine Updates notwendig'
-                    })
-                    db.add_processed_document(doc_id, 'Unbekannt', validated, True)
-
-            except Exception as e:
-                logger.error(f"Error processing document {doc_id}: {e}")
-                results.append({
-                    'document_id': doc_id,
-                    'success': False,
-                    'error': str(e)
-                })
-                db.add_processed_document(doc_id, 'Unbekannt', {}, False, str(e))
+        paperless = get_paperless_client(paperless_url, paperless_token)
+        classifier = get_classifier(ollama_url, ollama_model)
+        classifier.cache = get_classification_cache()
+
+        # Inhalte laden und alle Dokumente gemeinsam klassifizieren (parallele Anfragen an Ollama)
+        workers = max(1, int(os.getenv('PROCESSING_WORKERS', '4')))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            contents = dict(zip(document_ids, executor.map(paperless.get_document_content, document_ids)))
+        to_classify = [doc_id for doc_id in document_ids if contents[doc_id]]
+        classifications = dict(zip(
+            to_classify,
+            classifier.classify_documents([contents[doc_id] for doc_id in to_classify], max_workers=workers)
+        ))
+
+        # Verfügbare Metadaten einmal pro Aufruf laden statt pro Dokument (wie in main.py)
+        doc_types, correspondents, all_tags = {}, {}, {}
+        if to_classify:
+            doc_types, correspondents, all_tags = _load_lookups(paperless)
+
+        # Updates an Paperless sind unabhängig voneinander: parallel, Reihenfolge bleibt erhalten
+        def apply(doc_id: int) -> Tuple[Dict, tuple]:
+            return _apply_classification(
+                doc_id, contents[doc_id], classifications.get(doc_id), paperless, classifier,
+                doc_types, correspondents, all_tags
+            )
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(apply, document_ids))
+        results = [result for result, _ in outcomes]
+        processed_rows = [row for _, row in outcomes]
+
+        # Alle Ergebnisse in einer Transaktion speichern
+        db.add_processed_documents_bulk(processed_rows)
 
         return jsonify({'results': results})
 
@@ -333,10 +509,10 @@ def test_connection():
                 return jsonify({'success': False, 'message': 'URL und Token erforderlich'}), 400
 
             try:
-                import requests
-                response = requests.get(f"{url}/api/documents/",
-                                       headers={'Authorization': f'Token {token}'},
-                                       timeout=10)
+                response = _http_session.get(f"{url}/api/documents/",
+                                             headers={'Authorization': f'Token {token}'},
+                                             params={'page_size': 1, 'fields': 'id'},
+                                             timeout=10)
                 response.raise_for_status()
                 return jsonify({'success': True, 'message': 'Verbindung erfolgreich'})
             except Exception as e:
@@ -350,9 +526,8 @@ def test_connection():
                 return jsonify({'success': False, 'message': 'URL erforderlich'}), 400
 
             try:
-                import requests
                 # Test Ollama API
-                response = requests.get(f"{url}/api/tags", timeout=10)
+                response = _http_session.get(f"{url}/api/tags", timeout=10)
                 response.raise_for_status()
 
                 # Check if model exists
@@ -380,9 +555,37 @@ def test_connection():
 # Q&A / Semantic Search Endpunkte
 # ============================================================
 
+def _run_indexing(indexer: DocumentIndexer, qa: QASystem):
+    """Führt die Indexierung im Hintergrund-Thread aus und hält _index_job aktuell"""
+    def progress(processed: int, total: int):
+        with _index_job_lock:
+            _index_job['processed'] = processed
+            _index_job['total'] = total
+
+    try:
+        stats = indexer.index_all_documents(
+            batch_chunks=int(os.getenv('INDEX_BATCH_CHUNKS', '100')),
+            progress=progress
+        )
+        qa.clear_query_cache()
+        with _index_job_lock:
+            _index_job['stats'] = stats
+            _index_job['message'] = (
+                f"Indexierung abgeschlossen: {stats['indexed']} neu indexiert, {stats['skipped']} übersprungen"
+            )
+    except Exception as e:
+        logger.error(f"Error indexing documents: {e}")
+        with _index_job_lock:
+            _index_job['error'] = str(e)
+    finally:
+        with _index_job_lock:
+            _index_job['running'] = False
+            _index_job['finished_at'] = datetime.now().isoformat()
+
+
 @app.route('/api/qa/index-status', methods=['GET'])
 def get_index_status():
-    """Gibt den Status der Dokumenten-Indexierung zurück"""
+    """Gibt den Status der Dokumenten-Indexierung zurück (inkl. laufender Hintergrund-Indexierung)"""
     try:
         services = get_qa_services()
         indexer = services['document_indexer']
@@ -391,6 +594,8 @@ def get_index_status():
             return jsonify({'error': 'Document Indexer nicht verfügbar'}), 500
 
         stats = indexer.get_indexing_stats()
+        with _index_job_lock:
+            stats['job'] = dict(_index_job)
         return jsonify(stats)
 
     except Exception as e:
@@ -408,15 +613,29 @@ def index_documents():
         if not indexer:
             return jsonify({'error': 'Document Indexer nicht verfügbar'}), 500
 
-        # Indexierung im Hintergrund starten (für MVP: synchron)
-        logger.info("Starte Dokument-Indexierung...")
-        stats = indexer.index_all_documents()
+        # Indexierung im Hintergrund starten, der Fortschritt kommt über /api/qa/index-status
+        with _index_job_lock:
+            if _index_job['running']:
+                return jsonify({
+                    'success': True,
+                    'running': True,
+                    'message': 'Indexierung läuft bereits'
+                }), 202
+            _index_job.update(
+                running=True, processed=0, total=0, stats=None, error=None, message=None,
+                started_at=datetime.now().isoformat(), finished_at=None
+            )
+
+        logger.info("Starte Dokument-Indexierung im Hintergrund...")
+        threading.Thread(
+            target=_run_indexing, args=(indexer, services['qa_system']), name='qa-indexing', daemon=True
+        ).start()
 
         return jsonify({
             'success': True,
-            'stats': stats,
-            'message': f"Indexierung abgeschlossen: {stats['indexed']} neu indexiert, {stats['skipped']} übersprungen"
-        })
+            'running': True,
+            'message': 'Indexierung gestartet'
+        }), 202
 
     except Exception as e:
         logger.error(f"Error indexing documents: {e}")
@@ -433,12 +652,10 @@ def get_metadata_options():
         if not paperless_url or not paperless_token:
             return jsonify({'error': 'Paperless-Einstellungen nicht konfiguriert'}), 400
 
-        paperless = PaperlessClient(paperless_url, paperless_token)
+        paperless = get_paperless_client(paperless_url, paperless_token)
 
-        # Hole alle verfügbaren Metadaten
-        all_document_types = paperless.get_all_document_types()
-        all_correspondents = paperless.get_all_correspondents()
-        all_tags = paperless.get_all_tags()
+        # Hole alle verfügbaren Metadaten (aus dem Lookup-Cache des Clients, sonst parallel)
+        all_document_types, all_correspondents, all_tags = _load_lookups(paperless)
 
         return jsonify({
             'document_types': list(all_document_types.keys()),
@@ -469,35 +686,15 @@ def semantic_search():
         if not qa:
             return jsonify({'error': 'Q&A System nicht verfügbar'}), 500
 
-        # Konvertiere Filter in ChromaDB-Format
-        chroma_filters = None
-        if filters:
-            # Konvertiere Filter (Jahr, Tags werden später clientseitig gefiltert)
-            chroma_filters = {}
-            if 'document_type' in filters:
-                chroma_filters['document_type'] = filters['document_type']
-            if 'correspondent' in filters:
-                chroma_filters['correspondent'] = filters['correspondent']
+        # Konvertiere Filter in ChromaDB-Format (auch Jahr und Tags filtert ChromaDB direkt)
+        chroma_filters = build_where_filter(filters)
 
         # Suche durchführen (mit Multi-Query wenn aktiviert)
-        use_multi = os.getenv('USE_MULTI_QUERY', 'true').lower() == 'true'
-        if use_multi:
+        if qa.use_multi_query:
             results = qa.search_documents_multi(query=query, n_results=n_results, filters=chroma_filters)
         else:
             results = qa.search_documents(query=query, n_results=n_results, filters=chroma_filters)
 
-        # Post-filtering für Jahr und Tags (da ChromaDB keine complex queries unterstützt)
-        if 'year' in filters:
-            year = str(filters['year'])
-            results = [r for r in results if r['metadata'].get('created', '').startswith(year)]
-
-        if 'tags' in filters and filters['tags']:
-            filter_tags = set(filters['tags'])
-            results = [
-                r for r in results
-                if any(tag in r['metadata'].get('tags', '') for tag in filter_tags)
-            ]
-
         return jsonify({
             'success': True,
             'query': query,
@@ -510,14 +707,43 @@ def semantic_search():
         return jsonify({'error': str(e)}), 500
 
 
+def _sse_response(events) -> Response:
+    """
+    Server-Sent Events: ein JSON-Objekt pro Event (siehe QASystem.generate_answer_stream)
+
+    Fehler während der Generierung kommen als {'type': 'error', ...} Event, da der
+    HTTP-Status zu diesem Zeitpunkt schon gesendet ist.
+    """
+    def generate():
+        try:
+            for event in events:
+                yield b'data: ' + json_utils.dumps(event) + b'\n\n'
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}")
+            yield b'data: ' + json_utils.dumps({'type': 'error', 'error': str(e)}) + b'\n\n'
+
+    # Kein Caching/Puffern durch Browser oder Reverse Proxy, damit jedes Token sofort ankommt
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/api/qa/ask', methods=['POST'])
 def ask_question():
-    """Beantwortet eine Frage basierend auf Dokumenten (RAG)"""
+    """
+    Beantwortet eine Frage basierend auf Dokumenten (RAG)
+
+    Mit "stream": true wird die Antwort als Server-Sent Events gestreamt: Token-Events
+    während der Generierung, zum Schluss ein done-Event mit Antwort, Quellen und Konfidenz.
+    """
     try:
         data = request.json
         question = data.get('question')
         n_context_docs = data.get('n_context_docs', 3)
         filters = data.get('filters', {})
+        stream = bool(data.get('stream'))
 
         if not question:
             return jsonify({'error': 'Frage erforderlich'}), 400
@@ -528,91 +754,39 @@ def ask_question():
         if not qa:
             return jsonify({'error': 'Q&A System nicht verfügbar'}), 500
 
-        # Konvertiere Filter in ChromaDB-Format
-        chroma_filters = None
-        if filters:
-            chroma_filters = {}
-            if 'document_type' in filters:
-                chroma_filters['document_type'] = filters['document_type']
-            if 'correspondent' in filters:
-                chroma_filters['correspondent'] = filters['correspondent']
+        # Konvertiere Filter in ChromaDB-Format (auch Jahr und Tags filtert ChromaDB direkt)
+        chroma_filters = build_where_filter(filters)
 
         # Frage beantworten (answer_question nutzt intern search_documents_multi)
         logger.info(f"Beantworte Frage: {question}")
 
         # Hole relevante Dokumente mit Filtern
-        use_multi = os.getenv('USE_MULTI_QUERY', 'true').lower() == 'true'
-        if use_multi:
-            relevant_docs = qa.search_documents_multi(query=question, n_results=n_context_docs * 2, filters=chroma_filters)
-            relevant_docs = relevant_docs[:n_context_docs]
+        if qa.use_multi_query:
+            relevant_docs = qa.search_documents_multi(query=question, n_results=n_context_docs, filters=chroma_filters)
         else:
             relevant_docs = qa.search_documents(query=question, n_results=n_context_docs, filters=chroma_filters)
 
-        # Post-filtering für Jahr und Tags
-        if 'year' in filters:
-            year = str(filters['year'])
-            relevant_docs = [r for r in relevant_docs if r['metadata'].get('created', '').startswith(year)]
-
-        if 'tags' in filters and filters['tags']:
-            filter_tags = set(filters['tags'])
-            relevant_docs = [
-                r for r in relevant_docs
-                if any(tag in r['metadata'].get('tags', '') for tag in filter_tags)
-            ]
+        no_docs_answer = "Ich konnte keine relevanten Dokumente mit den angegebenen Filtern finden."
+        if stream:
+            if not relevant_docs:
+                return _sse_response(iter([
+                    {'type': 'token', 'text': no_docs_answer},
+                    {'type': 'done', 'result': {'answer': no_docs_answer, 'sources': [], 'confidence': 'low'}}
+                ]))
+            return _sse_response(qa.generate_answer_stream(question, relevant_docs))
 
         # Wenn keine Dokumente gefunden wurden
         if not relevant_docs:
             return jsonify({
                 'success': True,
                 'question': question,
-                'answer': "Ich konnte keine relevanten Dokumente mit den angegebenen Filtern finden.",
+                'answer': no_docs_answer,
                 'sources': [],
                 'confidence': 'low'
             })
 
-        # Kontext aus gefilterten Dokumenten erstellen
-        context_parts = []
-        sources = []
-
-        for i, doc in enumerate(relevant_docs, 1):
-            doc_info = f"[Dokument {i}]\n"
-            doc_info += f"Titel: {doc['metadata'].get('title', 'Unbekannt')}\n"
-            if doc['metadata'].get('correspondent'):
-                doc_info += f"Von: {doc['metadata']['correspondent']}\n"
-            if doc['metadata'].get('document_type'):
-                doc_info += f"Typ: {doc['metadata']['document_type']}\n"
-            doc_info += f"Inhalt: {doc['text']}\n"
-
-            context_parts.append(doc_info)
-
-            sources.append({
-                'doc_id': doc['doc_id'],
-                'title': doc['metadata'].get('title', 'Unbekannt'),
-                'correspondent': doc['metadata'].get('correspondent', ''),
-                'document_type': doc['metadata'].get('document_type', ''),
-                'relevance_score': 1 - (doc.get('distance', 0) / 2) if doc.get('distance') else None
-            })
-
-        context = "\n\n".join(context_parts)
-
-        # Prompt erstellen und Antwort generieren
-        prompt = qa._create_rag_prompt(question, context)
-        answer = qa.llm.generate(prompt)
-
-        if not answer:
-            return jsonify({
-                'success': True,
-                'question': question,
-                'answer': "Entschuldigung, ich konnte keine Antwort generieren.",
-                'sources': sources,
-                'confidence': 'low'
-            })
-
-        result = {
-            'answer': answer.strip(),
-            'sources': sources,
-            'confidence': qa._estimate_confidence(relevant_docs, answer)
-        }
+        # Antwort generieren (Kontext, Prompt, LLM - ggf. aus dem Antwort-Cache)
+        result = qa.generate_answer(question, relevant_docs)
 
         return jsonify({
             'success': True,
@@ -662,6 +836,7 @@ def reset_index():
 
         # Index zurücksetzen
         success = vector_store_svc.reset()
+        services['qa_system'].clear_query_cache()
 
         if success:
             logger.info("Vector Store wurde erfolgreich zurückgesetzt")
@@ -680,5 +855,16 @@ def reset_index():
         return jsonify({'error': str(e)}), 500
 
 
+def warm_up_qa_services():
+    """Initialisiert die Q&A Services und lädt den Suchindex vor (läuft im Hintergrund)"""
+    try:
+        get_qa_services()['vector_store'].warm_up()
+    except Exception as e:
+        logger.warning(f"Q&A Services konnten nicht vorab initialisiert werden: {e}")
+
+
 if __name__ == '__main__':
+    # Der Debug-Reloader startet das Skript zweimal: nur im Prozess vorladen, der die Requests bedient
+    if os.getenv('QA_WARMUP', 'true').lower() == 'true' and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        threading.Thread(target=warm_up_qa_services, name='qa-warmup', daemon=True).start()
     app.run(debug=True, host='0.0.0.0', port=5000)